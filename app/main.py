@@ -1,9 +1,14 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from src.api.router import router
+from src.core.admission import AdmissionController
+from src.core.manager import MessageManager
+from src.core.ollama import OllamaClient
+from src.core.rabbitmq import RabbitMQService
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,7 +17,22 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rabbitmq_service = RabbitMQService()
+    await rabbitmq_service.initialize()
+    ollama_client = OllamaClient()
+    admission = AdmissionController(rabbitmq_service)
+    admission.start()
+    app.state.admission = admission
+    app.state.message_manager = MessageManager(rabbitmq_service, ollama_client, admission)
+    logger.info("App startup complete")
+    yield
+    await admission.close()
+    await ollama_client.close()
+    await rabbitmq_service.close()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 Instrumentator().instrument(app).expose(app)
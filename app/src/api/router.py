@@ -1,30 +1,75 @@
+import json
+import time
 import asyncio
+from contextlib import aclosing
 from logging import getLogger
+from typing import Awaitable, Literal, Optional, TypeVar
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from src.core.rabbitmq import RabbitMQService
+from src.core.admission import AdmissionController
 from src.core.manager import MessageManager
-from src.pydantic.response import UserInput, ModelResponse
+from src.pydantic.response import BatchInput, BatchResponse, UserInput, ModelResponse
+from src.utils.config import REQUEST_TIMEOUT, DISCONNECT_POLL_INTERVAL
+from src.utils.metrics import CLIENT_DISCONNECTED_COUNTER
 
 router = APIRouter()
 logger = getLogger(__name__)
 
-def provide_message_manager() -> MessageManager:
-    return MessageManager(RabbitMQService())
+def provide_message_manager(request: Request) -> MessageManager:
+    return request.app.state.message_manager
+
+def provide_admission(request: Request) -> AdmissionController:
+    return request.app.state.admission
+
+# Callers that can wait (e.g. offline jobs) send X-Priority: bulk and are shed before interactive traffic.
+Priority = Literal["interactive", "bulk"]
+
+T = TypeVar("T")
+
+def request_deadline(
+    timeout: Optional[float] = Header(None, alias="X-Request-Timeout", gt=0)
+) -> float:
+    """Epoch deadline of the request: REQUEST_TIMEOUT, or less if the client asks for it."""
+    return time.time() + min(timeout or REQUEST_TIMEOUT, REQUEST_TIMEOUT)
+
+async def until_disconnected(request: Request, work: Awaitable[T]) -> T:
+    """Runs `work`, cancelling it as soon as the client disconnects."""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                CLIENT_DISCONNECTED_COUNTER.labels(endpoint=request.url.path).inc()
+                logger.warning("%s - Client disconnected, cancelling request", request.url.path)
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
 
 @router.post("/prompt")
 async def process_prompt(
     user_input: UserInput,
-    msg_service: MessageManager = Depends(provide_message_manager)
+    request: Request,
+    priority: Priority = Header("interactive", alias="X-Priority"),
+    deadline: float = Depends(request_deadline),
+    msg_service: MessageManager = Depends(provide_message_manager),
+    admission: AdmissionController = Depends(provide_admission)
 ) -> dict:
     logger.info("POST /prompt - Received input: %s", user_input.message)
     try:
-        result: ModelResponse = await asyncio.to_thread(
-            msg_service.get_filters_results, user_input.message
-        )
+        async with admission.admit(priority):
+            result: ModelResponse = await until_disconnected(
+                request,
+                msg_service.get_filters_results(user_input.message, priority, deadline, user_input.session_id)
+            )
         logger.info("POST /prompt - Successfully processed input")
         return {"response": result.model_dump(exclude_unset=True)}
+    except HTTPException:
+        raise
     except Exception as exc:
         logger.exception("POST /prompt - Processing failed: %s", exc)
         raise HTTPException(
@@ -32,6 +77,61 @@ async def process_prompt(
             detail=f"Processing failed: {type(exc).__name__}: {exc}"
         ) from exc
 
+@router.post("/prompt/batch")
+async def process_batch(
+    batch_input: BatchInput,
+    request: Request,
+    deadline: float = Depends(request_deadline),
+    msg_service: MessageManager = Depends(provide_message_manager),
+    admission: AdmissionController = Depends(provide_admission)
+) -> dict:
+    logger.info("POST /prompt/batch - Received %d messages", len(batch_input.messages))
+    try:
+        async with admission.admit("bulk"):
+            result: BatchResponse = await until_disconnected(
+                request, msg_service.get_batch_filters_results(batch_input.messages, deadline)
+            )
+        logger.info("POST /prompt/batch - Successfully processed input")
+        return {"response": result.model_dump(exclude_unset=True)}
+    except HTTPException:
+        raise
+    except Exception as exc:
+        logger.exception("POST /prompt/batch - Processing failed: %s", exc)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Processing failed: {type(exc).__name__}: {exc}"
+        ) from exc
+
+@router.post("/prompt/stream")
+async def stream_prompt(
+    user_input: UserInput,
+    priority: Priority = Header("interactive", alias="X-Priority"),
+    deadline: float = Depends(request_deadline),
+    msg_service: MessageManager = Depends(provide_message_manager),
+    admission: AdmissionController = Depends(provide_admission)
+) -> StreamingResponse:
+    logger.info("POST /prompt/stream - Received input: %s", user_input.message)
+    # Admitted before the response starts so a shed request still gets a proper 429/503.
+    # The generator never runs if the client leaves before streaming starts, so the
+    # response releases the slot too; whichever comes first wins.
+    release = admission.acquire_once(priority)
+
+    # The response itself stops as soon as the client disconnects, which closes the generation.
+    async def event_stream():
+        try:
+            stream = msg_service.stream_filters_results(user_input.message, priority, deadline, user_input.session_id)
+            async with aclosing(stream) as events:
+                async for event, data in events:
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as exc:
+            logger.exception("POST /prompt/stream - Processing failed: %s", exc)
+            detail = exc.detail if isinstance(exc, HTTPException) else f"{type(exc).__name__}: {exc}"
+            yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+        finally:
+            release()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", background=BackgroundTask(release))
+
 @router.get("/")
 def root() -> dict:
     logger.info("GET / - Health check OK")
@@ -0,0 +1,168 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from src.utils.config import (
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_BULK_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE_DEPTH, ADMISSION_MAX_FILTER_LATENCY,
+    ADMISSION_BULK_SHARE, ADMISSION_LATENCY_WINDOW, ADMISSION_PROBE_INTERVAL, ADMISSION_RETRY_AFTER
+)
+from src.utils.metrics import ADMISSION_COUNTER, ADMISSION_IN_FLIGHT, TASK_QUEUE_DEPTH
+
+logger = getLogger(__name__)
+
+PRIORITIES = ("interactive", "bulk")
+
+
+class AdmissionController:
+    """
+    Decides at the API edge whether a request is admitted or shed.
+
+    A request is rejected with 429 once this process holds too many requests,
+    and with 503 while the filter is overloaded: the task queues are too deep
+    or recent filter round trips are too slow. Bulk requests are shed first,
+    at ADMISSION_BULK_SHARE of the interactive thresholds.
+    """
+
+    def __init__(
+        self,
+        rabbitmq_service,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        bulk_max_in_flight: int = ADMISSION_BULK_MAX_IN_FLIGHT,
+        max_queue_depth: int = ADMISSION_MAX_QUEUE_DEPTH,
+        max_filter_latency: float = ADMISSION_MAX_FILTER_LATENCY
+    ):
+        self.rabbitmq_service = rabbitmq_service
+        self.max_in_flight = {"interactive": max_in_flight, "bulk": bulk_max_in_flight}
+        self.max_queue_depth = max_queue_depth
+        self.max_filter_latency = max_filter_latency
+        self.in_flight = {priority: 0 for priority in PRIORITIES}
+        self.queue_depths: Dict[str, int] = {}
+        self.latencies = deque(maxlen=1000)
+        self._last_latency_probe = 0.0
+        self._probe: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.max_queue_depth and self._probe is None:
+            self._probe = asyncio.create_task(self._probe_queues())
+
+    async def close(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+
+    async def _probe_queues(self):
+        while True:
+            try:
+                self.queue_depths = await self.rabbitmq_service.queue_depths()
+                for queue, depth in self.queue_depths.items():
+                    TASK_QUEUE_DEPTH.labels(queue=queue).set(depth)
+            except Exception as e:
+                logger.warning("Task queue depth probe failed: %s", e)
+            await asyncio.sleep(ADMISSION_PROBE_INTERVAL)
+
+    def observe_filter_latency(self, seconds: float):
+        self.latencies.append((time.monotonic(), seconds))
+
+    def filter_latency(self) -> float:
+        """p95 of the filter round trips finished in the last ADMISSION_LATENCY_WINDOW seconds."""
+        horizon = time.monotonic() - ADMISSION_LATENCY_WINDOW
+        while self.latencies and self.latencies[0][0] < horizon:
+            self.latencies.popleft()
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(seconds for _, seconds in self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def _latency_probe(self) -> bool:
+        """
+        While shedding on latency, lets one request through every
+        ADMISSION_PROBE_INTERVAL. Shed requests add no samples, so without
+        probes the p95 would only reflect the filter from before shedding began
+        and, once those samples aged out, drop to 0 and admit everything at once.
+        """
+        now = time.monotonic()
+        if now - self._last_latency_probe < ADMISSION_PROBE_INTERVAL:
+            return False
+        self._last_latency_probe = now
+        return True
+
+    def _shed(self, priority: str, reason: str, status_code: int, detail: str, retry_after: float):
+        ADMISSION_COUNTER.labels(priority=priority, outcome=f"shed_{reason}").inc()
+        logger.warning("Shedding %s request: %s", priority, detail)
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def _backlog(self, priority: str) -> int:
+        """
+        Messages a new request waits behind. Interactive requests only wait
+        behind the interactive queue; bulk requests behind everything. With
+        stage pools (task.classifier, ...) every text visits each pool, so the
+        most backed-up pool counts.
+        """
+        pools: Dict[str, int] = {}
+        for queue, depth in self.queue_depths.items():
+            name, _, pool = queue.partition(".")
+            if priority == "interactive" and name != "task":
+                continue
+            pools[pool] = pools.get(pool, 0) + depth
+        return max(pools.values(), default=0)
+
+    def acquire(self, priority: str = "interactive"):
+        """Admits a request or raises 429/503 with Retry-After. Admitted requests must call release()."""
+        share = 1.0 if priority == "interactive" else ADMISSION_BULK_SHARE
+
+        limit = self.max_in_flight[priority]
+        if limit and self.in_flight[priority] >= limit:
+            self._shed(priority, "in_flight", 429, "Too many requests in flight", ADMISSION_RETRY_AFTER)
+
+        if self.max_queue_depth:
+            depth = self._backlog(priority)
+            if depth >= self.max_queue_depth * share:
+                self._shed(priority, "queue_depth", 503, f"Filter queue is backed up ({depth} messages)",
+                           ADMISSION_RETRY_AFTER)
+
+        if self.max_filter_latency:
+            latency = self.filter_latency()
+            if latency >= self.max_filter_latency * share and not self._latency_probe():
+                self._shed(priority, "latency", 503, f"Filter is overloaded (p95 {latency:.1f}s)", latency)
+
+        self.in_flight[priority] += 1
+        ADMISSION_IN_FLIGHT.labels(priority=priority).set(self.in_flight[priority])
+        ADMISSION_COUNTER.labels(priority=priority, outcome="admitted").inc()
+
+    def release(self, priority: str = "interactive"):
+        self.in_flight[priority] -= 1
+        ADMISSION_IN_FLIGHT.labels(priority=priority).set(self.in_flight[priority])
+
+    def acquire_once(self, priority: str = "interactive") -> Callable[[], None]:
+        """
+        Admits a request like acquire() and returns its release, which is safe
+        to call more than once. For responses that outlive the handler, where
+        several paths may end the request.
+        """
+        self.acquire(priority)
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release(priority)
+        return release
+
+    @asynccontextmanager
+    async def admit(self, priority: str = "interactive"):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
@@ -0,0 +1,82 @@
+import hashlib
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Dict, Optional
+
+from src.utils.config import VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL
+from src.utils.metrics import VERDICT_CACHE_COUNTER
+
+logger = getLogger(__name__)
+
+class VerdictCache:
+    """
+    App-side LRU of filter verdicts with a per-entry TTL, consulted before a
+    text is sent to the filter workers. Every reply carries the worker's
+    models/index/thresholds fingerprint; a new fingerprint in any reply, cached
+    or not, drops all entries.
+    """
+
+    def __init__(self, max_size: int = VERDICT_CACHE_SIZE, ttl: float = VERDICT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint: Optional[str] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        key = self._key(text)
+        entry = self._entries.get(key)
+        if entry is None:
+            VERDICT_CACHE_COUNTER.labels(event="miss").inc()
+            return None
+        expires_at, verdict = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            VERDICT_CACHE_COUNTER.labels(event="expired").inc()
+            VERDICT_CACHE_COUNTER.labels(event="miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        VERDICT_CACHE_COUNTER.labels(event="hit").inc()
+        return dict(verdict)
+
+    def _set_fingerprint(self, fingerprint: Optional[str]):
+        if fingerprint != self.fingerprint:
+            if self._entries:
+                logger.info("Filter fingerprint changed (%s -> %s), clearing verdict cache",
+                            self.fingerprint, fingerprint)
+                VERDICT_CACHE_COUNTER.labels(event="invalidation").inc()
+            self._entries.clear()
+            self.fingerprint = fingerprint
+
+    def observe(self, verdict: Dict):
+        """
+        Notes the fingerprint of every filter reply, including the ones that
+        are not cached (conversation turns), so that hot keys, which only ever
+        hit, stop serving verdicts of the previous models as soon as any reply
+        shows the new ones.
+        """
+        if self.enabled and verdict.get("fingerprint"):
+            self._set_fingerprint(verdict["fingerprint"])
+
+    def put(self, text: str, verdict: Dict):
+        # Errors and verdicts missing a stage pool's part are not worth keeping.
+        if not self.enabled or "error" in verdict or verdict.get("failed_stages"):
+            return
+        self._set_fingerprint(verdict.get("fingerprint"))
+
+        key = self._key(text)
+        self._entries[key] = (time.monotonic() + self.ttl, dict(verdict))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            VERDICT_CACHE_COUNTER.labels(event="eviction").inc()
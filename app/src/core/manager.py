@@ -1,63 +1,185 @@
-import os
+import re
 import time
+import asyncio
+from collections import deque
+from contextlib import aclosing
 from logging import getLogger
+from typing import AsyncIterator, List, Optional, Tuple
 
-import httpx
 from fastapi import HTTPException
 
+from src.core.admission import AdmissionController
+from src.core.cache import VerdictCache
+from src.core.ollama import OllamaClient
 from src.core.rabbitmq import RabbitMQService
-from src.pydantic.response import ModelResponse, ModelResponsePayload, ProcessingResult
-from src.utils.metrics import FILTER_DURATION, LLM_RESPONSE_TIME, FILTER_RESULT_COUNTER
+from src.core.sessions import SessionStore
+from src.core.stages import StageFanout
+from src.pydantic.response import BatchResponse, ModelResponse, ModelResponsePayload, ProcessingResult
+from src.utils.config import (
+    STREAM_MIN_WINDOW_CHARS, STREAM_MIN_WORDS, BATCH_CONCURRENCY, SPECULATIVE_GENERATION, SPECULATION_MAX_BLOCK_RATE, SPECULATION_WINDOW,
+    FILTER_STAGES
+)
+from src.utils.metrics import (
+    FILTER_DURATION, LLM_RESPONSE_TIME, FILTER_RESULT_COUNTER, LLM_FIRST_TOKEN_TIME, STREAM_ABORTED_COUNTER,
+    SPECULATION_COUNTER, PRE_FILTER_BLOCK_RATE, DEADLINE_EXCEEDED_COUNTER
+)
 
 logger = getLogger(__name__)
 
+# Splits streamed output after sentence punctuation or at line breaks.
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def stream_window_end(output: str, emitted: int) -> Optional[int]:
+    """
+    End of the next streamed window: the last sentence boundary after the
+    `emitted` characters already sent, once the window holds
+    STREAM_MIN_WINDOW_CHARS and the whole output STREAM_MIN_WORDS. Returns
+    None while the window is not ready.
+    """
+    end = None
+    for match in SENTENCE_BOUNDARY.finditer(output, emitted):
+        end = match.end()
+    if end is None or len(output[emitted:end].strip()) < STREAM_MIN_WINDOW_CHARS:
+        return None
+    if len(output[:end].split()) < STREAM_MIN_WORDS:
+        return None
+    return end
+
 class MessageManager:
 
-    def __init__(self, rabbitmq_service: RabbitMQService):
+    def __init__(
+        self,
+        rabbitmq_service: RabbitMQService,
+        ollama_client: OllamaClient,
+        admission: Optional[AdmissionController] = None
+    ):
         self.rabbitmq_service = rabbitmq_service
-        self.ollama_url = os.environ.get('OLLAMA_HOST') + '/api/generate'
-        self.ollama_model = os.environ.get('OLLAMA_MODEL')
-        if not self.ollama_model or not self.ollama_url:
-            logger.error("Missing OLLAMA_HOST or OLLAMA_MODEL environment variable")
-            raise RuntimeError("OLLAMA_HOST and OLLAMA_MODEL environment variables must be set")
-        logger.info("MessageManager initialized with model: %s", self.ollama_model)
-
-    def get_filters_results(self, message: str) -> ModelResponse:
-        logger.info("Received message: %s", message)
+        # With stage pools, every text fans out to all of them and the partial verdicts are merged.
+        self.filter_rpc = StageFanout(rabbitmq_service) if FILTER_STAGES else rabbitmq_service
+        self.ollama_client = ollama_client
+        self.admission = admission
+        self.verdict_cache = VerdictCache()
+        self.sessions = SessionStore()
+        self.recent_blocks = deque(maxlen=SPECULATION_WINDOW)
+        logger.info("MessageManager initialized with model: %s", self.ollama_client.model)
+
+    async def _filter(
+        self,
+        text: str,
+        stage: str,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        session_id: Optional[str] = None
+    ) -> ProcessingResult:
         try:
-            start_filter = time.time()
-            pre_filter = self.rabbitmq_service.process_request(message)
-            filter_time = time.time() - start_filter
-            FILTER_DURATION.observe(filter_time)
-            pre_result = ProcessingResult.parse_obj(pre_filter)
-            logger.info("Pre-filter result: %s", pre_result)
+            # A conversation turn is judged with its session, so its verdict is never cached.
+            raw_result = self.verdict_cache.get(text) if session_id is None else None
+            if raw_result is None:
+                session = self.sessions.get(session_id) if session_id is not None else None
+                start_filter = time.time()
+                raw_result = await self.filter_rpc.process_request(
+                    text, priority=priority, deadline=deadline, session=session
+                )
+                elapsed = time.time() - start_filter
+                FILTER_DURATION.observe(elapsed)
+                if self.admission is not None:
+                    self.admission.observe_filter_latency(elapsed)
+                self.verdict_cache.observe(raw_result)
+                if session_id is not None:
+                    self.sessions.put(session_id, raw_result.pop("session", None))
+                else:
+                    self.verdict_cache.put(text, raw_result)
+            result = ProcessingResult.parse_obj(raw_result)
+            logger.info("%s-filter result: %s", stage.capitalize(), result)
+            return result
+        except asyncio.TimeoutError as e:
+            if deadline is not None and time.time() >= deadline:
+                DEADLINE_EXCEEDED_COUNTER.labels(stage=stage).inc()
+                logger.warning("%s-filter abandoned, request deadline exceeded", stage.capitalize())
+                raise HTTPException(status_code=504, detail="Request deadline exceeded") from e
+            logger.exception("%s-filter timed out: %s", stage.capitalize(), e)
+            raise HTTPException(status_code=504, detail=f"{stage.capitalize()}-filter timed out") from e
         except Exception as e:
-            logger.exception("Pre-filter processing failed: %s", e)
-            raise HTTPException(status_code=500, detail="Pre-filter processing failed") from e
+            logger.exception("%s-filter processing failed: %s", stage.capitalize(), e)
+            raise HTTPException(status_code=500, detail=f"{stage.capitalize()}-filter processing failed") from e
 
-        if not pre_filter.get('status'):
-            FILTER_RESULT_COUNTER.labels(status="blocked", type="pre").inc()
-            logger.warning("Message blocked by pre-filter")
-            return ModelResponse(user_message=message, results=ModelResponsePayload(preprocessing_result=pre_result))
+    def _record_pre_filter(self, status: bool):
+        self.recent_blocks.append(not status)
+        PRE_FILTER_BLOCK_RATE.set(sum(self.recent_blocks) / len(self.recent_blocks))
+
+    def _should_speculate(self) -> bool:
+        if not SPECULATIVE_GENERATION:
+            return False
+        if self.recent_blocks and sum(self.recent_blocks) / len(self.recent_blocks) > SPECULATION_MAX_BLOCK_RATE:
+            SPECULATION_COUNTER.labels(outcome="skipped").inc()
+            return False
+        return True
 
+    async def _generate(self, message: str, deadline: Optional[float] = None) -> str:
         try:
             start_llm = time.time()
-            llm_output = self._send_http_request(message)
+            llm_output = await self.ollama_client.generate(message, deadline)
             LLM_RESPONSE_TIME.observe(time.time() - start_llm)
             logger.info("LLM output: %s", llm_output)
+            return llm_output
+        except HTTPException:
+            raise
         except Exception as e:
             logger.exception("LLM request failed with exception: %s", e)
             raise HTTPException(status_code=500, detail="LLM request failed") from e
 
+    async def _generate_speculatively(self, message: str, deadline: Optional[float] = None) -> str:
+        # Streamed so that cancelling the task closes the response and stops the generation upstream.
+        start_llm = time.time()
+        async with aclosing(self.ollama_client.stream(message, deadline)) as tokens:
+            llm_output = "".join([token async for token in tokens])
+        LLM_RESPONSE_TIME.observe(time.time() - start_llm)
+        logger.info("LLM output: %s", llm_output)
+        return llm_output
+
+    async def get_filters_results(
+        self,
+        message: str,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        session_id: Optional[str] = None
+    ) -> ModelResponse:
+        logger.info("Received message: %s", message)
+        speculation = (
+            asyncio.create_task(self._generate_speculatively(message, deadline)) if self._should_speculate() else None
+        )
         try:
-            post_filter = self.rabbitmq_service.process_request(llm_output)
-            post_result = ProcessingResult.parse_obj(post_filter)
-            logger.info("Post-filter result: %s", post_result)
-        except Exception as e:
-            logger.exception("Post-filter processing failed: %s", e)
-            raise HTTPException(status_code=500, detail="Post-filter processing failed") from e
+            pre_result = await self._filter(message, "pre", priority, deadline, session_id)
+        except BaseException:
+            if speculation:
+                speculation.cancel()
+            raise
+        self._record_pre_filter(pre_result.status)
+
+        if not pre_result.status:
+            if speculation:
+                speculation.cancel()
+                SPECULATION_COUNTER.labels(outcome="wasted").inc()
+                logger.info("Cancelled speculative generation for blocked message")
+            FILTER_RESULT_COUNTER.labels(status="blocked", type="pre").inc()
+            logger.warning("Message blocked by pre-filter")
+            return ModelResponse(user_message=message, results=ModelResponsePayload(preprocessing_result=pre_result))
 
-        if not post_filter.get('status'):
+        if speculation:
+            SPECULATION_COUNTER.labels(outcome="used").inc()
+            try:
+                llm_output = await speculation
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.exception("LLM request failed with exception: %s", e)
+                raise HTTPException(status_code=500, detail="LLM request failed") from e
+        else:
+            llm_output = await self._generate(message, deadline)
+
+        post_result = await self._filter(llm_output, "post", priority, deadline)
+
+        if not post_result.status:
             logger.warning("LLM output blocked by post-filter")
             llm_output = ""
             FILTER_RESULT_COUNTER.labels(status="blocked", type="post").inc()
@@ -73,17 +195,87 @@ class MessageManager:
             )
         )
 
-    def _send_http_request(self, message: str) -> str:
-        payload = {'model': self.ollama_model, 'prompt': message, 'stream': False}
-        logger.info("Sending request to LLM: %s", payload)
-        try:
-            with httpx.Client(timeout=500.0) as client:
-                response = client.post(self.ollama_url, json=payload)
-                logger.info("Received response with status: %s", response.status_code)
-                if response.status_code == 200:
-                    return response.json().get('response', '')
-                logger.error("Non-200 response from model: %s", response.text)
-                raise HTTPException(status_code=response.status_code, detail="Error from LLM model")
-        except httpx.RequestError as exc:
-            logger.exception("Request to LLM model failed")
-            raise HTTPException(status_code=500, detail=f'Request to LLM model failed: {exc}') from exc
+    async def get_batch_filters_results(self, messages: List[str], deadline: Optional[float] = None) -> BatchResponse:
+        """
+        Filters many texts without calling the LLM. Requests are sent
+        concurrently so the filter workers can micro-batch them; a failed text
+        gets an error result instead of failing the whole call.
+        """
+        logger.info("Received batch of %d messages", len(messages))
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def filter_one(message: str) -> ProcessingResult:
+            async with semaphore:
+                try:
+                    result = await self._filter(message, "batch", "bulk", deadline)
+                except HTTPException as e:
+                    return ProcessingResult(error=e.detail)
+            FILTER_RESULT_COUNTER.labels(status="passed" if result.status else "blocked", type="batch").inc()
+            return result
+
+        results = await asyncio.gather(*(filter_one(message) for message in messages))
+        return BatchResponse(results=results)
+
+    async def stream_filters_results(
+        self,
+        message: str,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Yields (event, data) pairs: the pre-filter result, then LLM text in
+        sentence-sized windows as soon as each window passes the post-filter.
+        The post-filter judges the whole output so far, as /prompt judges the
+        full response, so checks tuned for whole texts never see an isolated
+        sentence. The windows are exact slices of the output. The first
+        blocked window ends the stream and cancels the generation.
+        """
+        logger.info("Received streaming message: %s", message)
+        pre_result = await self._filter(message, "pre", priority, deadline, session_id)
+        self._record_pre_filter(pre_result.status)
+        yield "prefilter", pre_result.model_dump()
+
+        if not pre_result.status:
+            FILTER_RESULT_COUNTER.labels(status="blocked", type="pre").inc()
+            logger.warning("Message blocked by pre-filter")
+            return
+
+        start_llm = time.time()
+        first_token = True
+        output = ""
+        emitted = 0
+        async with aclosing(self.ollama_client.stream(message, deadline)) as tokens:
+            async for token in tokens:
+                if first_token:
+                    LLM_FIRST_TOKEN_TIME.observe(time.time() - start_llm)
+                    first_token = False
+                output += token
+
+                end = stream_window_end(output, emitted)
+                if end is None:
+                    continue
+
+                post_result = await self._filter(output[:end].strip(), "post", priority, deadline)
+                if not post_result.status:
+                    logger.warning("Streamed LLM output blocked by post-filter, cancelling generation")
+                    FILTER_RESULT_COUNTER.labels(status="blocked", type="post").inc()
+                    STREAM_ABORTED_COUNTER.inc()
+                    yield "blocked", post_result.model_dump()
+                    return
+                yield "text", {"text": output[emitted:end]}
+                emitted = end
+
+        LLM_RESPONSE_TIME.observe(time.time() - start_llm)
+        if output[emitted:].strip():
+            post_result = await self._filter(output.strip(), "post", priority, deadline)
+            if not post_result.status:
+                logger.warning("Streamed LLM output blocked by post-filter")
+                FILTER_RESULT_COUNTER.labels(status="blocked", type="post").inc()
+                yield "blocked", post_result.model_dump()
+                return
+        if output[emitted:]:
+            yield "text", {"text": output[emitted:]}
+
+        FILTER_RESULT_COUNTER.labels(status="passed", type="post").inc()
+        yield "done", {}
@@ -0,0 +1,172 @@
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import AsyncIterator, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from src.utils.config import (
+    OLLAMA_HOST, OLLAMA_MODEL, OLLAMA_MAX_CONCURRENCY, OLLAMA_MAX_QUEUE,
+    OLLAMA_POOL_SIZE, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT
+)
+from src.utils.metrics import (
+    LLM_IN_FLIGHT, LLM_POOL_SIZE, LLM_QUEUE_DEPTH, LLM_REJECTED_COUNTER, DEADLINE_EXCEEDED_COUNTER
+)
+
+logger = getLogger(__name__)
+
+class OllamaClient:
+    """
+    App-wide Ollama client: one pooled keep-alive httpx.AsyncClient, a cap on
+    in-flight generations and a bounded queue of callers waiting for a slot.
+    """
+
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        model: str = OLLAMA_MODEL,
+        max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+        max_queue: int = OLLAMA_MAX_QUEUE,
+        pool_size: int = OLLAMA_POOL_SIZE
+    ):
+        if not host or not model:
+            logger.error("Missing OLLAMA_HOST or OLLAMA_MODEL environment variable")
+            raise RuntimeError("OLLAMA_HOST and OLLAMA_MODEL environment variables must be set")
+
+        self.url = host + '/api/generate'
+        self.model = model
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(
+                OLLAMA_READ_TIMEOUT,
+                connect=OLLAMA_CONNECT_TIMEOUT,
+                pool=OLLAMA_CONNECT_TIMEOUT
+            )
+        )
+        LLM_POOL_SIZE.set(pool_size)
+        logger.info(
+            "OllamaClient initialized with model: %s (concurrency %d, queue %d, pool %d)",
+            model, max_concurrency, max_queue, pool_size
+        )
+
+    @staticmethod
+    def _deadline_exceeded() -> HTTPException:
+        DEADLINE_EXCEEDED_COUNTER.labels(stage="llm").inc()
+        logger.warning("Request deadline passed, abandoning LLM call")
+        return HTTPException(status_code=504, detail="Request deadline exceeded")
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        """Seconds left until `deadline`, None without one; raises 504 once it has passed."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        return remaining
+
+    def _timeout(self, deadline: Optional[float]) -> httpx.Timeout:
+        remaining = self._remaining(deadline)
+        read = OLLAMA_READ_TIMEOUT if remaining is None else min(OLLAMA_READ_TIMEOUT, remaining)
+        return httpx.Timeout(read, connect=OLLAMA_CONNECT_TIMEOUT, pool=OLLAMA_CONNECT_TIMEOUT)
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """
+        Waits for a free generation slot, rejecting the call when the wait
+        queue is full or the deadline passes while waiting.
+        """
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            LLM_REJECTED_COUNTER.inc()
+            logger.warning("LLM wait queue is full (%d), rejecting request", self._waiting)
+            raise HTTPException(status_code=503, detail="LLM is overloaded, try again later")
+
+        self._waiting += 1
+        LLM_QUEUE_DEPTH.set(self._waiting)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self._remaining(deadline))
+        except asyncio.TimeoutError:
+            raise self._deadline_exceeded()
+        finally:
+            self._waiting -= 1
+            LLM_QUEUE_DEPTH.set(self._waiting)
+
+        LLM_IN_FLIGHT.inc()
+        try:
+            yield
+        finally:
+            LLM_IN_FLIGHT.dec()
+            self._semaphore.release()
+
+    async def generate(self, message: str, deadline: Optional[float] = None) -> str:
+        payload = {'model': self.model, 'prompt': message, 'stream': False}
+        logger.info("Sending request to LLM: %s", payload)
+        async with self.slot(deadline):
+            try:
+                response = await asyncio.wait_for(
+                    self.client.post(self.url, json=payload, timeout=self._timeout(deadline)),
+                    timeout=self._remaining(deadline)
+                )
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded()
+            except httpx.TimeoutException as exc:
+                if deadline is not None and time.time() >= deadline:
+                    raise self._deadline_exceeded() from exc
+                logger.exception("Request to LLM model failed")
+                raise HTTPException(status_code=500, detail=f'Request to LLM model failed: {exc}') from exc
+            except httpx.RequestError as exc:
+                logger.exception("Request to LLM model failed")
+                raise HTTPException(status_code=500, detail=f'Request to LLM model failed: {exc}') from exc
+
+        logger.info("Received response with status: %s", response.status_code)
+        if response.status_code == 200:
+            return response.json().get('response', '')
+        logger.error("Non-200 response from model: %s", response.text)
+        raise HTTPException(status_code=response.status_code, detail="Error from LLM model")
+
+    async def stream(self, message: str, deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Yields generated tokens as Ollama produces them. Closing the generator
+        closes the HTTP response, which cancels the generation upstream; so
+        does reaching the deadline.
+        """
+        payload = {'model': self.model, 'prompt': message, 'stream': True}
+        logger.info("Sending streaming request to LLM: %s", payload)
+        async with self.slot(deadline):
+            try:
+                async with self.client.stream(
+                    'POST', self.url, json=payload, timeout=self._timeout(deadline)
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        logger.error("Non-200 response from model: %s", body)
+                        raise HTTPException(status_code=response.status_code, detail="Error from LLM model")
+
+                    async for line in response.aiter_lines():
+                        self._remaining(deadline)
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get('response'):
+                            yield chunk['response']
+                        if chunk.get('done'):
+                            break
+            except httpx.TimeoutException as exc:
+                if deadline is not None and time.time() >= deadline:
+                    raise self._deadline_exceeded() from exc
+                logger.exception("Streaming request to LLM model failed")
+                raise HTTPException(status_code=500, detail=f'Request to LLM model failed: {exc}') from exc
+            except httpx.RequestError as exc:
+                logger.exception("Streaming request to LLM model failed")
+                raise HTTPException(status_code=500, detail=f'Request to LLM model failed: {exc}') from exc
+
+    async def close(self):
+        await self.client.aclose()
@@ -1,99 +1,256 @@
 import uuid
-import json
+import time
+import asyncio
 import logging
-from threading import Event
+from typing import Dict, List, Optional, Set, Tuple
 
-from pika import BasicProperties, BlockingConnection, ConnectionParameters
-from dotenv import load_dotenv, find_dotenv
+from aio_pika import connect_robust, ExchangeType, Message
+from aio_pika.abc import (
+    AbstractChannel, AbstractExchange, AbstractIncomingMessage, AbstractQueue, AbstractRobustConnection
+)
+
+from src.core.protocol import CONTENT_TYPES, JSON, decode_results, encode_requests
+from src.utils.config import (
+    FILTER_STAGES, RABBITMQ_HOST, RPC_ENVELOPE_SIZE, RPC_ENVELOPE_WINDOW_MS, RPC_PROTOCOL, RPC_TIMEOUT
+)
+from src.utils.metrics import RPC_ENVELOPE_SIZE_HISTOGRAM
 
-load_dotenv(find_dotenv())
 logger = logging.getLogger(__name__)
 
+TASK_QUEUES = {"interactive": "task", "bulk": "task_bulk"}
+
+
+def task_queue(priority: str, stage: Optional[str] = None) -> str:
+    """Queue of the full cascade for a priority, or of one stage worker pool (task.classifier)."""
+    return TASK_QUEUES[priority] if stage is None else f"{TASK_QUEUES[priority]}.{stage}"
+
+
 class RabbitMQService:
+    """
+    Long-lived asyncio RPC client shared by every request of the app process.
+
+    Replies arrive on a private exclusive queue and are matched to their
+    request through a correlation_id -> Futures map, so concurrent requests
+    never compete for each other's replies.
 
-    def __init__(self):
-        self.connection = None
-        self.channel = None
-        self.correlation_id = None
-        self.response = None
-        self.response_event = Event()
-        self.initialize()
+    With the msgpack protocol, texts queued for the same task queue within
+    `envelope_window` seconds share one message of at most `envelope_size`
+    texts, and one reply brings back all their verdicts in order.
+    """
 
-    def initialize(self):
+    def __init__(
+        self,
+        host: str = RABBITMQ_HOST,
+        stages: List[str] = FILTER_STAGES,
+        protocol: str = RPC_PROTOCOL,
+        envelope_size: int = RPC_ENVELOPE_SIZE,
+        envelope_window: float = RPC_ENVELOPE_WINDOW_MS / 1000.0
+    ):
+        self.host = host
+        self.queues = [task_queue(priority, stage) for priority in TASK_QUEUES for stage in [None, *stages]]
+        self.content_type = CONTENT_TYPES[protocol]
+        self.envelope_size = max(1, envelope_size)
+        self.envelope_window = envelope_window
+        self.connection: Optional[AbstractRobustConnection] = None
+        self.channel: Optional[AbstractChannel] = None
+        self.exchange: Optional[AbstractExchange] = None
+        self.callback_queue: Optional[AbstractQueue] = None
+        # One future per text of the message, in envelope order.
+        self.futures: Dict[str, List[asyncio.Future]] = {}
+        self._outbox: Dict[str, List[Tuple[dict, asyncio.Future]]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._publishing: Set[asyncio.Task] = set()
+
+    async def initialize(self):
         try:
             logger.info("Initializing RabbitMQ in app")
-            params = ConnectionParameters(
-                host='rabbitmq',
-                blocked_connection_timeout=300
-            )
-            self.connection = BlockingConnection(params)
-            self.channel = self.connection.channel()
+            self.connection = await connect_robust(host=self.host)
+            self.channel = await self.connection.channel()
 
-            self.channel.exchange_declare(exchange='default', exchange_type='direct')
-            self.channel.queue_declare(queue='task', durable=True)
-            self.channel.queue_declare(queue='output', durable=True)
+            self.exchange = await self.channel.declare_exchange('default', ExchangeType.DIRECT)
+            # Interactive requests go to 'task', bulk requests to 'task_bulk', which the
+            # filter consumes with a smaller prefetch so it never crowds out interactive traffic.
+            # With stage pools, each pool has its own pair (task.classifier, task_bulk.classifier).
+            for name in self.queues:
+                queue = await self.channel.declare_queue(name, durable=True)
+                await queue.bind(self.exchange, routing_key=name)
 
-            self.channel.queue_bind(queue='task', exchange='default', routing_key='task')
-            self.channel.queue_bind(queue='output', exchange='default', routing_key='output')
-            self.channel.basic_qos(prefetch_count=1)
+            # Server-named, exclusive reply queue. The filter publishes replies to the
+            # 'default' exchange with routing_key=reply_to, so bind it under its own name.
+            self.callback_queue = await self.channel.declare_queue(exclusive=True, auto_delete=True)
+            await self.callback_queue.bind(self.exchange, routing_key=self.callback_queue.name)
+            await self.callback_queue.consume(self._on_response, no_ack=True)
 
-            logger.info("RabbitMQ setup complete")
+            logger.info("RabbitMQ setup complete, reply queue: %s", self.callback_queue.name)
         except Exception:
             logger.exception("Failed to initialize RabbitMQ")
             raise
 
-    def process_request(self, message: str):
-        self.response = None
-        self.response_event.clear()
+    async def _on_response(self, message: AbstractIncomingMessage):
+        futures = self.futures.pop(message.correlation_id, None)
+        if futures is None or all(future.done() for future in futures):
+            logger.warning("Ignored unmatched response with correlation_id: %s", message.correlation_id)
+            return
+
+        logger.info("Received matching response for correlation_id: %s", message.correlation_id)
+        try:
+            results = decode_results(message.body, message.content_type)
+            # A message the filter could not read at all gets a single error for all its texts.
+            if len(results) == 1 and len(futures) > 1:
+                results = results * len(futures)
+            if len(results) != len(futures):
+                raise ValueError(f"Expected {len(futures)} results, got {len(results)}")
+        except Exception as e:
+            logger.error("Failed to decode response: %s", e)
+            results = [{"status": False}] * len(futures)
+        for future, result in zip(futures, results):
+            # None: the text expired in the filter, its request times out on its own.
+            if result is not None and not future.done():
+                future.set_result(result)
+
+    async def queue_depths(self) -> Dict[str, int]:
+        """Messages waiting in each task queue, read with a passive declare."""
+        depths = {}
+        for name in self.queues:
+            queue = await self.channel.declare_queue(name, passive=True)
+            depths[name] = queue.declaration_result.message_count
+        return depths
 
-        self.correlation_id = str(uuid.uuid4())
-        logger.info("Publishing message with correlation_id: %s", self.correlation_id)
+    async def process_request(
+        self,
+        message: str,
+        timeout: float = RPC_TIMEOUT,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        session: Optional[dict] = None,
+        stage: Optional[str] = None
+    ) -> dict:
+        """
+        Sends one text to the filter and waits for its verdict. The message
+        expires, and the filter drops it unprocessed, once `deadline` (epoch
+        seconds) or the RPC timeout passes, whichever is first. A conversation
+        turn is sent with its `session` state; the reply carries it updated.
+        Given a `stage`, only that stage's worker pool judges the text.
+        """
+        published_at = time.time()
+        if deadline is not None:
+            timeout = min(timeout, deadline - published_at)
+        if timeout <= 0:
+            raise asyncio.TimeoutError("Request deadline passed before publishing")
+
+        request = {"message": message, "session": session, "deadline": published_at + timeout}
+        routing_key = task_queue(priority, stage)
+        if self.content_type != JSON:
+            return await self._process_enveloped(request, timeout, routing_key)
+
+        correlation_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.futures[correlation_id] = [future]
+        logger.info("Publishing message with correlation_id: %s", correlation_id)
+        RPC_ENVELOPE_SIZE_HISTOGRAM.observe(1)
 
         try:
-            self.channel.basic_publish(
-                exchange='default',
-                routing_key='task',
-                body=json.dumps({"message": message}),
-                properties=BasicProperties(
-                    reply_to='output',
-                    correlation_id=self.correlation_id
-                )
+            await self.exchange.publish(
+                Message(
+                    body=encode_requests([request], JSON),
+                    content_type=JSON,
+                    correlation_id=correlation_id,
+                    reply_to=self.callback_queue.name,
+                    expiration=timeout,
+                    # published_at lets the filter measure queue wait, deadline lets it drop stale work.
+                    headers={"published_at": published_at, "deadline": published_at + timeout}
+                ),
+                routing_key=routing_key
             )
+            result = await asyncio.wait_for(future, timeout=timeout)
+            logger.info("Returning response from worker")
+            return result
         except Exception as e:
-            logger.exception("Failed to publish message to RabbitMQ: %s", e)
+            logger.exception("RabbitMQ request failed for correlation_id %s: %s", correlation_id, e)
             raise
+        finally:
+            self.futures.pop(correlation_id, None)
 
-        def on_response(ch, method, props, body):
-            if props.correlation_id == self.correlation_id:
-                logger.info("Received matching response for correlation_id: %s", props.correlation_id)
-                try:
-                    self.response = json.loads(body)
-                except Exception as e:
-                    logger.error("Failed to decode JSON response: %s", e)
-                    self.response = {"status": False}
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                self.response_event.set()
-                ch.stop_consuming()
-            else:
-                logger.warning("Ignored unmatched response with correlation_id: %s", props.correlation_id)
-                ch.basic_nack(delivery_tag=method.delivery_tag)
-
+    async def _process_enveloped(self, request: dict, timeout: float, routing_key: str) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        outbox = self._outbox.setdefault(routing_key, [])
+        outbox.append((request, future))
+        if len(outbox) >= self.envelope_size:
+            self._flush(routing_key)
+        elif routing_key not in self._flush_handles:
+            self._flush_handles[routing_key] = loop.call_later(self.envelope_window, self._flush, routing_key)
         try:
-            logger.info("Starting consumption on output queue")
-            self.channel.basic_consume(
-                queue='output',
-                on_message_callback=on_response,
-                auto_ack=False
-            )
-            self.channel.start_consuming()
+            return await asyncio.wait_for(future, timeout=timeout)
         except Exception as e:
-            logger.exception("Error while consuming RabbitMQ message: %s", e)
+            logger.exception("RabbitMQ request failed in an envelope for %s: %s", routing_key, e)
             raise
 
-        logger.info("Returning response from worker")
-        return self.response
+    def _flush(self, routing_key: str):
+        handle = self._flush_handles.pop(routing_key, None)
+        if handle is not None:
+            handle.cancel()
+        entries, self._outbox[routing_key] = self._outbox[routing_key], []
+        if entries:
+            task = asyncio.get_running_loop().create_task(self._publish_envelope(entries, routing_key))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _publish_envelope(self, entries: List[Tuple[dict, asyncio.Future]], routing_key: str):
+        published_at = time.time()
+        # Requests that timed out or were cancelled while queued are left out.
+        entries = [(request, future) for request, future in entries
+                   if not future.done() and request["deadline"] > published_at]
+        if not entries:
+            return
+        requests = [request for request, _ in entries]
+        futures = [future for _, future in entries]
+        deadline = max(request["deadline"] for request in requests)
+
+        correlation_id = str(uuid.uuid4())
+        self.futures[correlation_id] = futures
+
+        def release(_):
+            # Forget the envelope once none of its requests waits any more, replied or not.
+            if all(future.done() for future in futures):
+                self.futures.pop(correlation_id, None)
+
+        for future in futures:
+            future.add_done_callback(release)
+        logger.info("Publishing %d texts with correlation_id: %s", len(requests), correlation_id)
+        RPC_ENVELOPE_SIZE_HISTOGRAM.observe(len(requests))
+
+        try:
+            await self.exchange.publish(
+                Message(
+                    body=encode_requests(requests, self.content_type),
+                    content_type=self.content_type,
+                    correlation_id=correlation_id,
+                    reply_to=self.callback_queue.name,
+                    expiration=deadline - published_at,
+                    # Each text carries its own deadline; the header holds the latest for the queue drop.
+                    headers={"published_at": published_at, "deadline": deadline}
+                ),
+                routing_key=routing_key
+            )
+        except Exception as e:
+            logger.exception("RabbitMQ publish failed for correlation_id %s: %s", correlation_id, e)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
 
-    def close(self):
+    async def close(self):
+        for handle in self._flush_handles.values():
+            handle.cancel()
+        self._flush_handles.clear()
+        for entries in self._outbox.values():
+            for _, future in entries:
+                future.cancel()
+            entries.clear()
+        for futures in self.futures.values():
+            for future in futures:
+                future.cancel()
+        self.futures.clear()
         if self.connection and not self.connection.is_closed:
             logger.info("Closing RabbitMQ connection")
-            self.connection.close()
+            await self.connection.close()
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Dict, Optional
+
+from src.utils.config import SESSION_STORE_SIZE, SESSION_TTL
+from src.utils.metrics import SESSION_COUNTER, SESSIONS_ACTIVE
+
+logger = getLogger(__name__)
+
+class SessionStore:
+    """
+    App-side LRU of conversation states with a TTL refreshed on every turn.
+    The filter keeps no state: each turn is sent with its session's state and
+    the reply carries the updated one, so any filter worker can take any turn.
+    """
+
+    def __init__(self, max_size: int = SESSION_STORE_SIZE, ttl: float = SESSION_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, session_id: str) -> Dict:
+        """The session's state; a new or expired session starts empty."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            SESSION_COUNTER.labels(event="created").inc()
+            return {}
+        expires_at, state = entry
+        if expires_at < time.monotonic():
+            del self._entries[session_id]
+            SESSIONS_ACTIVE.set(len(self._entries))
+            SESSION_COUNTER.labels(event="expired").inc()
+            SESSION_COUNTER.labels(event="created").inc()
+            return {}
+        SESSION_COUNTER.labels(event="continued").inc()
+        return state
+
+    def put(self, session_id: str, state: Optional[Dict]):
+        if not self.enabled or state is None:
+            return
+        self._entries[session_id] = (time.monotonic() + self.ttl, state)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            SESSION_COUNTER.labels(event="eviction").inc()
+        SESSIONS_ACTIVE.set(len(self._entries))
@@ -0,0 +1,118 @@
+import time
+import asyncio
+from logging import getLogger
+from typing import Dict, List, Optional
+
+from src.utils.config import FILTER_STAGES, FILTER_STAGE_FALLBACK, FILTER_STAGE_TIMEOUTS, RPC_TIMEOUT
+from src.utils.metrics import FILTER_STAGE_DURATION, FILTER_STAGE_FALLBACK_COUNTER
+
+logger = getLogger(__name__)
+
+# Verdict fields each stage pool computes; the filter's WORKER_STAGE pools run the same checks.
+STAGE_FIELDS = {
+    "heuristics": ("is_recurrent_result", "mixed_language_result", "anomaly_result"),
+    "classifier": ("classification_result",),
+    "semantic": ("semantic_result",),
+}
+# Conversation state is folded in by the pool that embeds the turns.
+SESSION_STAGE = "semantic"
+
+
+class StageFanout:
+    """
+    Filter RPC over separately scaled stage worker pools, with the same
+    process_request() interface as RabbitMQService.
+
+    Each text is sent to every pool in `stages` at once, so the filter latency
+    is that of the slowest pool instead of the sum of all checks. Every pool
+    has its own timeout; a pool that times out or fails is listed in
+    `failed_stages`, and `fallback` decides the verdict: 'block' fails the text
+    closed, 'pass' judges it on the pools that answered. Short-circuiting only
+    happens inside a pool, since the pools run in parallel.
+    """
+
+    def __init__(
+        self,
+        rabbitmq_service,
+        stages: List[str] = FILTER_STAGES,
+        timeouts: Dict[str, float] = FILTER_STAGE_TIMEOUTS,
+        fallback: str = FILTER_STAGE_FALLBACK
+    ):
+        self.rabbitmq_service = rabbitmq_service
+        self.stages = stages
+        self.timeouts = timeouts
+        self.fallback = fallback
+
+    async def _stage(self, stage: str, message: str, timeout: float, priority: str,
+                     deadline: Optional[float], session: Optional[dict]) -> dict:
+        start = time.time()
+        result = await self.rabbitmq_service.process_request(
+            message,
+            timeout=min(timeout, self.timeouts.get(stage, RPC_TIMEOUT)),
+            priority=priority,
+            deadline=deadline,
+            session=session if stage == SESSION_STAGE else None,
+            stage=stage
+        )
+        FILTER_STAGE_DURATION.labels(stage=stage).observe(time.time() - start)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
+
+    async def process_request(
+        self,
+        message: str,
+        timeout: float = RPC_TIMEOUT,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        session: Optional[dict] = None
+    ) -> dict:
+        tasks = {
+            stage: asyncio.create_task(self._stage(stage, message, timeout, priority, deadline, session))
+            for stage in self.stages
+        }
+        try:
+            await asyncio.wait(tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        partials, failures = {}, {}
+        for stage, task in tasks.items():
+            error = task.exception()
+            if error is None:
+                partials[stage] = task.result()
+                continue
+            reason = "timeout" if isinstance(error, asyncio.TimeoutError) else "error"
+            FILTER_STAGE_FALLBACK_COUNTER.labels(stage=stage, reason=reason).inc()
+            logger.warning("Stage %s failed (%s): %s", stage, reason, str(error) or type(error).__name__)
+            failures[stage] = error
+        if not partials:
+            # Nothing to merge: fail like a single filter request would.
+            raise next(iter(failures.values()))
+        return self.merge(partials, list(failures))
+
+    def merge(self, partials: Dict[str, dict], failed: List[str]) -> dict:
+        """
+        Combines partial verdicts: each pool contributes the fields of its own
+        checks plus whatever else it reports (near-duplicate hits, session
+        state), and the text passes only if every pool passed it.
+        """
+        owned = {field for fields in STAGE_FIELDS.values() for field in fields}
+        merged = {"status": all(partial.get("status", False) for partial in partials.values()), "skipped": []}
+        for stage in self.stages:
+            partial = partials.get(stage)
+            if partial is None:
+                continue
+            for key, value in partial.items():
+                if key in STAGE_FIELDS[stage] or key not in owned | {"status", "skipped", "fingerprint"}:
+                    merged[key] = value
+            merged["skipped"].extend(partial.get("skipped", []))
+        if failed:
+            merged["failed_stages"] = failed
+            if self.fallback == "block":
+                merged["status"] = False
+        else:
+            # Verdicts of the whole set of pools stay cacheable until any pool changes.
+            merged["fingerprint"] = "+".join(partials[stage].get("fingerprint") or "" for stage in self.stages)
+        return merged
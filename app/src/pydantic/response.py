@@ -1,8 +1,15 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
+from src.utils.config import BATCH_MAX_MESSAGES
+
 class UserInput(BaseModel):
     message: str
+    # Conversation mode: `message` is the new turn of this session and is judged with the earlier ones.
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
+
+class BatchInput(BaseModel):
+    messages: List[str] = Field(min_length=1, max_length=BATCH_MAX_MESSAGES)
 
 class ProcessingResult(BaseModel):
     status: bool = False
@@ -12,6 +19,11 @@ class ProcessingResult(BaseModel):
     is_recurrent_result: bool = False
     anomaly_result: float = 0.0
     mixed_language_result: float = 0.0
+    near_duplicate_result: float = 0.0
+    near_duplicate_cluster: Optional[str] = None
+    session_result: Optional[Dict[str, float]] = None
+    skipped: List[str] = []
+    failed_stages: List[str] = []
 
 class ModelResponsePayload(BaseModel): 
     preprocessing_result: ProcessingResult = Field(default_factory=ProcessingResult)
@@ -21,3 +33,6 @@ class ModelResponsePayload(BaseModel):
 class ModelResponse(BaseModel):
     user_message: str = ""
     results: ModelResponsePayload = Field(default_factory=ModelResponsePayload)
+
+class BatchResponse(BaseModel):
+    results: List[ProcessingResult] = []
@@ -0,0 +1,85 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
+# Seconds to wait for a filter worker reply before giving up on a request.
+RPC_TIMEOUT = float(os.environ.get('RPC_TIMEOUT', 60))
+# Filter RPC wire format: 'json' sends one text per message; 'msgpack' packs up to
+# RPC_ENVELOPE_SIZE texts queued within RPC_ENVELOPE_WINDOW_MS (0: the same event loop
+# iteration) into one message. Switch to msgpack only once every filter worker speaks it.
+RPC_PROTOCOL = os.environ.get('RPC_PROTOCOL', 'json').lower()
+if RPC_PROTOCOL not in ('json', 'msgpack'):
+    raise ValueError(f"Unsupported RPC_PROTOCOL: {RPC_PROTOCOL}")
+RPC_ENVELOPE_SIZE = int(os.environ.get('RPC_ENVELOPE_SIZE', 64))
+RPC_ENVELOPE_WINDOW_MS = float(os.environ.get('RPC_ENVELOPE_WINDOW_MS', 0))
+# Stage fan-out: with FILTER_STAGES set (any of heuristics, classifier, semantic), each text
+# goes in parallel to the worker pool of every listed stage on task.<stage> and the partial
+# verdicts are merged; empty sends it to the full cascade on 'task'. A stage that has not
+# answered within its FILTER_STAGE_TIMEOUTS seconds (RPC_TIMEOUT if unlisted) or failed is
+# handled by FILTER_STAGE_FALLBACK: 'block' fails the text closed, 'pass' judges it on the
+# stages that answered.
+FILTER_STAGES = [stage.strip() for stage in os.environ.get('FILTER_STAGES', '').split(',') if stage.strip()]
+if set(FILTER_STAGES) - {'heuristics', 'classifier', 'semantic'}:
+    raise ValueError(f"Unsupported FILTER_STAGES: {FILTER_STAGES}")
+FILTER_STAGE_TIMEOUTS = {
+    stage.strip(): float(timeout) for stage, _, timeout in (
+        item.partition('=') for item in
+        os.environ.get('FILTER_STAGE_TIMEOUTS', 'heuristics=2,classifier=10,semantic=10').split(',') if item.strip()
+    )
+}
+FILTER_STAGE_FALLBACK = os.environ.get('FILTER_STAGE_FALLBACK', 'block').lower()
+if FILTER_STAGE_FALLBACK not in ('block', 'pass'):
+    raise ValueError(f"Unsupported FILTER_STAGE_FALLBACK: {FILTER_STAGE_FALLBACK}")
+# End-to-end deadline of a request in seconds; clients may shorten it with X-Request-Timeout.
+# Filter messages carry it as an AMQP expiration and a 'deadline' header, and the
+# Ollama call gets whatever time is left. Disconnected clients are checked every
+# DISCONNECT_POLL_INTERVAL seconds.
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 600))
+DISCONNECT_POLL_INTERVAL = float(os.environ.get('DISCONNECT_POLL_INTERVAL', 0.5))
+
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST')
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL')
+# Shared Ollama client: at most OLLAMA_MAX_CONCURRENCY generations run at once,
+# up to OLLAMA_MAX_QUEUE more wait for a slot, anything beyond that is rejected.
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get('OLLAMA_MAX_CONCURRENCY', 4))
+OLLAMA_MAX_QUEUE = int(os.environ.get('OLLAMA_MAX_QUEUE', 64))
+OLLAMA_POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', 8))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get('OLLAMA_READ_TIMEOUT', 500))
+# Streaming: approved text is forwarded in sentence-sized windows of at least this many characters.
+# The post-filter judges the whole output so far; the first window waits for STREAM_MIN_WORDS
+# words, below which word-ratio checks such as is_recurrent flag ordinary sentences.
+STREAM_MIN_WINDOW_CHARS = int(os.environ.get('STREAM_MIN_WINDOW_CHARS', 40))
+STREAM_MIN_WORDS = int(os.environ.get('STREAM_MIN_WORDS', 50))
+# Optional verdict cache in front of the filter RPC; size 0 disables it.
+VERDICT_CACHE_SIZE = int(os.environ.get('VERDICT_CACHE_SIZE', 0))
+VERDICT_CACHE_TTL = float(os.environ.get('VERDICT_CACHE_TTL', 3600))
+# Conversation mode: states of at most SESSION_STORE_SIZE sessions, each dropped SESSION_TTL
+# seconds after its last turn. Size 0 filters every turn as a new conversation.
+SESSION_STORE_SIZE = int(os.environ.get('SESSION_STORE_SIZE', 10000))
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 1800))
+# Speculative generation: start the LLM call together with the pre-filter and cancel it
+# if the pre-filter blocks. Speculation pauses while more than SPECULATION_MAX_BLOCK_RATE
+# of the last SPECULATION_WINDOW pre-filtered prompts were blocked.
+SPECULATIVE_GENERATION = os.environ.get('SPECULATIVE_GENERATION', 'false').lower() in ('1', 'true', 'yes')
+SPECULATION_MAX_BLOCK_RATE = float(os.environ.get('SPECULATION_MAX_BLOCK_RATE', 0.2))
+SPECULATION_WINDOW = int(os.environ.get('SPECULATION_WINDOW', 100))
+# /prompt/batch: maximum texts per call and filter requests in flight per call.
+BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES', 1000))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 64))
+# Admission control: requests beyond ADMISSION_MAX_IN_FLIGHT per process get 429; while the
+# task queue holds ADMISSION_MAX_QUEUE_DEPTH messages or the filter p95 over the last
+# ADMISSION_LATENCY_WINDOW seconds exceeds ADMISSION_MAX_FILTER_LATENCY, requests get 503.
+# Bulk traffic (/prompt/batch, X-Priority: bulk) goes to its own queue and is shed at
+# ADMISSION_BULK_SHARE of those thresholds. A limit of 0 disables that check. While shedding
+# on latency, one request per ADMISSION_PROBE_INTERVAL still goes through to refresh the p95.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 256))
+ADMISSION_BULK_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_BULK_MAX_IN_FLIGHT', 16))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', 1000))
+ADMISSION_MAX_FILTER_LATENCY = float(os.environ.get('ADMISSION_MAX_FILTER_LATENCY', 10))
+ADMISSION_BULK_SHARE = float(os.environ.get('ADMISSION_BULK_SHARE', 0.5))
+ADMISSION_LATENCY_WINDOW = float(os.environ.get('ADMISSION_LATENCY_WINDOW', 10))
+ADMISSION_PROBE_INTERVAL = float(os.environ.get('ADMISSION_PROBE_INTERVAL', 1))
+ADMISSION_RETRY_AFTER = float(os.environ.get('ADMISSION_RETRY_AFTER', 1))
@@ -1,4 +1,4 @@
-from prometheus_client import Histogram, Counter
+from prometheus_client import Histogram, Counter, Gauge
 
 # Metrics:
 LLM_RESPONSE_TIME = Histogram(
@@ -14,5 +14,112 @@ FILTER_DURATION = Histogram(
 FILTER_RESULT_COUNTER = Counter(
     "filter_result_total",
     "Count of filtered messages",
-    ["status", "type"]  # status: passed / blocked, type: pre / post
+    ["status", "type"]  # status: passed / blocked, type: pre / post / batch
+)
+
+
+LLM_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight",
+    "LLM generations currently holding a connection from the Ollama pool"
+)
+
+LLM_POOL_SIZE = Gauge(
+    "llm_pool_size",
+    "Maximum number of connections in the Ollama client pool"
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "LLM generations waiting for a free concurrency slot"
+)
+
+LLM_REJECTED_COUNTER = Counter(
+    "llm_rejected_total",
+    "LLM generations rejected because the wait queue was full"
+)
+
+LLM_FIRST_TOKEN_TIME = Histogram(
+    "llm_first_token_duration_seconds",
+    "Time until the first streamed LLM token arrives"
+)
+
+STREAM_ABORTED_COUNTER = Counter(
+    "stream_aborted_total",
+    "Streamed generations cancelled because a window was blocked by the post-filter"
+)
+
+VERDICT_CACHE_COUNTER = Counter(
+    "app_verdict_cache_total",
+    "Verdict cache lookups and evictions in front of the filter RPC",
+    ["event"]  # event: hit / miss / eviction / expired / invalidation
+)
+
+RPC_ENVELOPE_SIZE_HISTOGRAM = Histogram(
+    "app_rpc_envelope_size",
+    "Texts per filter RPC message",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+FILTER_STAGE_DURATION = Histogram(
+    "filter_stage_round_trip_seconds",
+    "Round trip of one text to a stage worker pool",
+    ["stage"]  # stage: heuristics / classifier / semantic
+)
+
+FILTER_STAGE_FALLBACK_COUNTER = Counter(
+    "filter_stage_fallback_total",
+    "Texts judged without a stage's partial verdict",
+    ["stage", "reason"]  # reason: timeout / error
+)
+
+SESSION_COUNTER = Counter(
+    "app_sessions_total",
+    "Conversation session lookups and evictions",
+    ["event"]  # event: created / continued / expired / eviction
+)
+
+SESSIONS_ACTIVE = Gauge(
+    "app_sessions_active",
+    "Conversation sessions held in the session store"
+)
+
+SPECULATION_COUNTER = Counter(
+    "llm_speculation_total",
+    "Outcomes of speculative LLM generations",
+    ["outcome"]  # outcome: used / wasted / skipped
+)
+
+PRE_FILTER_BLOCK_RATE = Gauge(
+    "pre_filter_block_rate",
+    "Share of recent prompts blocked by the pre-filter"
+)
+
+ADMISSION_COUNTER = Counter(
+    "admission_total",
+    "Requests admitted or shed at the API edge",
+    ["priority", "outcome"]  # priority: interactive / bulk, outcome: admitted / shed_in_flight / shed_queue_depth / shed_latency
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Admitted requests currently being processed",
+    ["priority"]
+)
+
+TASK_QUEUE_DEPTH = Gauge(
+    "task_queue_depth",
+    "Messages waiting in the filter task queues",
+    ["queue"]  # queue: task / task_bulk
+)
+
+DEADLINE_EXCEEDED_COUNTER = Counter(
+    "request_deadline_exceeded_total",
+    "Requests abandoned because their deadline passed",
+    ["stage"]  # stage: pre / post / batch / llm
+)
+
+CLIENT_DISCONNECTED_COUNTER = Counter(
+    "client_disconnected_total",
+    "Requests cancelled because the client disconnected",
+    ["endpoint"]
 )
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from src.core.cache import VerdictCache
+
+VERDICT = {"status": True, "fingerprint": "old"}
+
+
+def test_hit_and_miss():
+    cache = VerdictCache(max_size=10, ttl=60)
+    assert cache.get("hello") is None
+    cache.put("hello", VERDICT)
+    assert cache.get("hello") == VERDICT
+
+
+def test_reply_with_a_new_fingerprint_invalidates_hot_keys():
+    cache = VerdictCache(max_size=10, ttl=60)
+    cache.put("hot", VERDICT)
+    assert cache.get("hot") == VERDICT
+    # An uncached reply, e.g. a conversation turn, from a worker with new models.
+    cache.observe({"status": True, "fingerprint": "new"})
+    assert cache.get("hot") is None
+
+
+def test_replies_without_a_fingerprint_keep_the_cache():
+    cache = VerdictCache(max_size=10, ttl=60)
+    cache.put("hot", VERDICT)
+    cache.observe({"error": "Invalid message format"})
+    cache.observe({"status": False, "failed_stages": ["semantic"]})
+    cache.observe(VERDICT)
+    assert cache.get("hot") == VERDICT
+
+
+def test_errors_and_partial_verdicts_are_not_cached():
+    cache = VerdictCache(max_size=10, ttl=60)
+    cache.put("a", {"error": "boom"})
+    cache.put("b", {"status": False, "failed_stages": ["classifier"]})
+    assert cache.get("a") is None and cache.get("b") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = VerdictCache(max_size=2, ttl=60)
+    cache.put("a", VERDICT)
+    cache.put("b", VERDICT)
+    cache.get("a")
+    cache.put("c", VERDICT)
+    assert cache.get("b") is None
+    assert cache.get("a") == VERDICT and cache.get("c") == VERDICT
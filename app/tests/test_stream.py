@@ -0,0 +1,100 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("aio_pika")
+pytest.importorskip("prometheus_client")
+
+from src.core.manager import MessageManager, stream_window_end
+from src.utils.config import STREAM_MIN_WINDOW_CHARS, STREAM_MIN_WORDS
+
+BENIGN = (
+    "The answer is that the function returns a list of the values.\n"
+    "Paris is the capital of France and the largest city in the country.\n\n"
+    "To sort the list, call sorted() on it; the original stays unchanged.  "
+    "If you need the result in reverse order, pass reverse=True as well. "
+    "Dictionaries keep insertion order since Python 3.7, so iterating over one "
+    "yields its keys in the order they were added.\n"
+    "- First, read the file line by line.\n"
+    "- Then, strip each line and skip empty ones!\n"
+    "Does that answer your question? Let me know if anything is unclear."
+)
+
+
+def recurrent(text: str) -> bool:
+    """The filter's is_recurrent rule: one word above 20% of all words."""
+    words = text.lower().split()
+    return bool(words) and max(Counter(words).values()) / len(words) > 0.2
+
+
+class FakeFilter:
+    def __init__(self):
+        self.texts = []
+
+    async def process_request(self, text, priority="interactive", deadline=None, session=None):
+        self.texts.append(text)
+        return {"status": not recurrent(text), "is_recurrent_result": recurrent(text), "skipped": []}
+
+
+class FakeOllama:
+    model = "fake"
+
+    def __init__(self, output: str, chunk: int = 7):
+        self.output = output
+        self.chunk = chunk
+
+    async def stream(self, message, deadline=None):
+        for i in range(0, len(self.output), self.chunk):
+            yield self.output[i:i + self.chunk]
+
+
+def stream(output: str):
+    rpc = FakeFilter()
+    manager = MessageManager(rpc, FakeOllama(output))
+
+    async def collect():
+        prompt = "Please explain how Python lists and dictionaries work"
+        return [event async for event in manager.stream_filters_results(prompt)]
+
+    return asyncio.run(collect()), rpc
+
+
+def test_benign_output_streams_unchanged():
+    # Each of the first two sentences alone trips the whole-text repetition check.
+    assert recurrent(BENIGN.splitlines()[0]) and recurrent(BENIGN.splitlines()[1])
+
+    events, rpc = stream(BENIGN)
+    names = [name for name, _ in events]
+    assert names[0] == "prefilter" and names[-1] == "done"
+    assert "blocked" not in names
+    texts = [data["text"] for name, data in events if name == "text"]
+    assert len(texts) > 1
+    # Windows are exact slices: newlines and spacing survive.
+    assert "".join(texts) == BENIGN
+    # The post-filter saw the growing output, never an isolated sentence.
+    post = rpc.texts[1:]
+    assert all(BENIGN.startswith(text) for text in post)
+    assert post[-1] == BENIGN.strip()
+
+
+def test_repetitive_output_is_blocked_and_not_emitted():
+    spam = BENIGN + "\n" + "buy buy buy buy now. " * 20
+    events, _ = stream(spam)
+    assert events[-1][0] == "blocked"
+    emitted = "".join(data["text"] for name, data in events if name == "text")
+    # The benign part went out; the stream stopped once the repetition dominated the output.
+    assert emitted.startswith(BENIGN)
+    assert len(emitted) < len(spam) and spam.startswith(emitted)
+
+
+def test_window_waits_for_enough_output():
+    sentence = "This sentence is comfortably longer than the minimum window. "
+    assert stream_window_end(sentence, 0) is None
+    output = sentence * (STREAM_MIN_WORDS // len(sentence.split()) + 1)
+    end = stream_window_end(output, 0)
+    assert end == len(output)
+    # A short tail after the last window is held back.
+    assert stream_window_end(output + "Short. ", end) is None
+    assert len("Short.") < STREAM_MIN_WINDOW_CHARS
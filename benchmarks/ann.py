@@ -0,0 +1,160 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILTER_DIR = os.path.join(ROOT, "filter")
+
+DEFAULT_BACKENDS = ["scann", "exact:dtype=float32", "exact:dtype=float16", "exact:dtype=int8", "hnsw"]
+BATCH_SIZES = (1, 32, 256)
+K = 5
+
+
+def parse_backend(spec: str):
+    """'exact:dtype=int8,block_size=8192' -> ('exact', {'dtype': 'int8', 'block_size': 8192})"""
+    name, _, options = spec.partition(":")
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return name, params
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_embeddings(count: int, dim: int, seed: int) -> np.ndarray:
+    """Normalized vectors around a few hundred centers, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(base: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """Perturbed copies of indexed vectors: near-duplicates of known toxic examples, like real hits."""
+    rng = np.random.default_rng(seed)
+    queries = base[rng.integers(len(base), size=count)] + noise * rng.normal(size=(count, base.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_neighbors(base: np.ndarray, queries: np.ndarray, block: int = 16384) -> np.ndarray:
+    """Ground truth: float32 brute force top-K."""
+    sys.path.insert(0, FILTER_DIR)
+    from src.core.ann import ExactSearcher
+
+    neighbors, _ = ExactSearcher(base, None, block).search_batched(queries, final_num_neighbors=K)
+    return neighbors
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row[:K].tolist()) & set(expected.tolist())) for row, expected in zip(found, truth))
+    return hits / (K * len(truth))
+
+
+def bench_backend(spec: str, data_dir: str, min_seconds: float) -> Dict[str, object]:
+    """Runs in a fresh process, so resident memory only reflects this backend."""
+    sys.path.insert(0, FILTER_DIR)
+    from src.core.ann import get_backend
+
+    name, params = parse_backend(spec)
+    base = np.load(os.path.join(data_dir, "base.npy"))
+    queries = np.load(os.path.join(data_dir, "queries.npy"))
+    truth = np.load(os.path.join(data_dir, "truth.npy"))
+    result = {"backend": spec}
+    try:
+        backend = get_backend(name, **params)
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        searcher = backend.build(base)
+        result["build_seconds"] = time.perf_counter() - start
+        result["index_rss_mb"] = rss_mb() - rss_before
+        result["rss_mb"] = rss_mb()
+
+        found, _ = searcher.search_batched(queries, final_num_neighbors=K)
+        result["recall@5"] = recall(np.asarray(found), truth)
+
+        for batch_size in BATCH_SIZES:
+            searched, start = 0, time.perf_counter()
+            while True:
+                for offset in range(0, len(queries), batch_size):
+                    searcher.search_batched(queries[offset:offset + batch_size], final_num_neighbors=K)
+                    searched += len(queries[offset:offset + batch_size])
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_seconds:
+                    break
+            result[f"qps[{batch_size}]"] = searched / elapsed
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def print_table(results: List[Dict[str, object]]):
+    columns = ["recall@5", *(f"qps[{b}]" for b in BATCH_SIZES), "build_seconds", "index_rss_mb", "rss_mb"]
+    print(f"{'backend':<28}" + "".join(f"{column:>14}" for column in columns))
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<28}  {result['error']}")
+            continue
+        print(f"{result['backend']:<28}" + "".join(f"{result[column]:>14.3f}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare semantic index backends: recall@5 against exact search, QPS, build time and memory."
+    )
+    parser.add_argument("backends", nargs="*", default=DEFAULT_BACKENDS,
+                        help="Backend specs such as 'scann:num_leaves_to_search=20' or 'exact:dtype=int8'.")
+    parser.add_argument("--embeddings", default=None,
+                        help="Indexed vectors (.npy), e.g. INDEX_DIR/embeddings.npy (default: synthetic).")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Number of synthetic vectors.")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of synthetic vectors.")
+    parser.add_argument("--queries", type=int, default=1024)
+    parser.add_argument("--noise", type=float, default=0.05, help="Perturbation of the query vectors.")
+    parser.add_argument("--min-seconds", type=float, default=2.0, help="Minimum timing per batch size.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        base = np.asarray(np.load(args.embeddings, mmap_mode="r"), dtype=np.float32)
+    else:
+        base = synthetic_embeddings(args.synthetic, args.dim, args.seed)
+    queries = make_queries(base, args.queries, args.noise, args.seed + 1)
+    print(f"{len(base)} vectors of dimension {base.shape[1]}, {len(queries)} queries")
+
+    with tempfile.TemporaryDirectory(prefix="llm-filter-ann-") as data_dir:
+        np.save(os.path.join(data_dir, "base.npy"), base)
+        np.save(os.path.join(data_dir, "queries.npy"), queries)
+        np.save(os.path.join(data_dir, "truth.npy"), exact_neighbors(base, queries))
+        del base
+
+        context = multiprocessing.get_context("spawn")
+        results = []
+        for spec in args.backends:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(bench_backend, (spec, data_dir, args.min_seconds)))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import csv
+import os
+import random
+from typing import List
+
+# Small synthetic stand-in for the Jigsaw dataset. The phrases are mild on
+# purpose: they only need to give the semantic index something to match.
+TOXIC_PHRASES = [
+    "you are an idiot", "shut up you loser", "nobody likes you, go away", "you are so stupid",
+    "what a pathetic moron", "get lost you clown", "you are a worthless fool", "stop being such a jerk",
+]
+CLEAN_PHRASES = [
+    "thanks for the help with the article", "can you explain how photosynthesis works",
+    "what is the capital of france", "please summarize this paragraph for me",
+    "i think the citation in section two is wrong", "how do i bake sourdough bread",
+    "write a short poem about autumn", "what are the rules of chess",
+]
+LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+
+
+def synthetic_texts(count: int, toxic_share: float = 0.5, seed: int = 0) -> List[str]:
+    """Returns `count` prompts, about `toxic_share` of them toxic, with light random variation."""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        phrases = TOXIC_PHRASES if rng.random() < toxic_share else CLEAN_PHRASES
+        text = rng.choice(phrases)
+        if rng.random() < 0.5:
+            text = f"{text} {rng.choice(CLEAN_PHRASES)}"
+        texts.append(f"{text} ({i})")
+    return texts
+
+
+def write_dataset(data_path: str, size: int = 2000, seed: int = 0):
+    """Writes train.csv/test.csv in the Jigsaw column layout under data_path."""
+    os.makedirs(data_path, exist_ok=True)
+    rng = random.Random(seed)
+    for name, rows in (("train.csv", size), ("test.csv", 10)):
+        with open(os.path.join(data_path, name), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "comment_text", *LABELS])
+            for i, text in enumerate(synthetic_texts(rows, toxic_share=0.5, seed=seed + len(name))):
+                toxic = any(text.startswith(phrase) for phrase in TOXIC_PHRASES)
+                scores = [1 if toxic and rng.random() < 0.8 else 0 for _ in LABELS]
+                if toxic:
+                    scores[0] = 1
+                writer.writerow([f"{name}-{i}", text, *scores])
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+
+from corpus import synthetic_texts, write_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+APP_DIR = os.path.join(ROOT, "app")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+async def run_level(send: Callable[[str], Awaitable[None]], texts: List[str], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(text: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await send(text)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in texts))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(texts),
+        "errors": errors,
+        "msgs_per_s": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def build_app(filter_client, ollama_port: int, stage_times: Dict[str, List[float]]):
+    """The real FastAPI app with the broker and Ollama swapped for the local stand-ins."""
+    sys.path.insert(0, APP_DIR)
+    from main import app
+    from src.core.admission import AdmissionController
+    from src.core.manager import MessageManager
+    from src.core.ollama import OllamaClient
+
+    class TimedMessageManager(MessageManager):
+        async def _filter(self, text, stage, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super()._filter(text, stage, *args, **kwargs)
+            finally:
+                stage_times[f"{stage}-filter"].append(time.perf_counter() - start)
+
+        async def _generate(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super()._generate(*args, **kwargs)
+            finally:
+                stage_times["llm"].append(time.perf_counter() - start)
+
+        async def _generate_speculatively(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super()._generate_speculatively(*args, **kwargs)
+            finally:
+                stage_times["llm"].append(time.perf_counter() - start)
+
+    ollama = OllamaClient(host=f"http://127.0.0.1:{ollama_port}", model="fake")
+    # The queue depth probe needs RabbitMQ, so only the in-flight and latency checks apply here.
+    admission = AdmissionController(filter_client, max_queue_depth=0)
+    app.state.admission = admission
+    app.state.message_manager = TimedMessageManager(filter_client, ollama, admission)
+    return app, ollama
+
+
+async def benchmark(args) -> List[dict]:
+    sys.path.insert(0, BENCH_DIR)
+    from local_broker import LocalFilterClient
+
+    filter_client = LocalFilterClient(port=args.broker_port)
+    await filter_client.initialize()
+    stage_times: Dict[str, List[float]] = defaultdict(list)
+    reports = []
+
+    if args.target == "app":
+        import httpx
+
+        app, ollama = build_app(filter_client, args.ollama_port, stage_times)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600)
+
+        async def send(text: str):
+            response = await client.post("/prompt", json={"message": text})
+            response.raise_for_status()
+    else:
+        async def send(text: str):
+            await filter_client.process_request(text)
+
+    for i, concurrency in enumerate(args.concurrency):
+        stage_times.clear()
+        texts = synthetic_texts(args.requests, toxic_share=args.toxic_share, seed=1000 + i)
+        report = await run_level(send, texts, concurrency)
+        report["stages"] = {
+            stage: {"mean": sum(times) / len(times), "p95": percentile(times, 95)}
+            for stage, times in stage_times.items() if times
+        }
+        reports.append(report)
+        print_report(report)
+
+    if args.target == "app":
+        await client.aclose()
+        await ollama.close()
+    await filter_client.close()
+    return reports
+
+
+def print_report(report: dict):
+    print(f"concurrency={report['concurrency']:<4} requests={report['requests']:<6} errors={report['errors']:<4} "
+          f"{report['msgs_per_s']:8.1f} msgs/s  p50={report['p50'] * 1000:8.1f}ms  "
+          f"p95={report['p95'] * 1000:8.1f}ms  p99={report['p99'] * 1000:8.1f}ms")
+    for stage, times in sorted(report["stages"].items()):
+        print(f"    {stage:<12} mean={times['mean'] * 1000:8.1f}ms  p95={times['p95'] * 1000:8.1f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Drive /prompt or the filter at fixed concurrency levels against local stand-ins."
+    )
+    parser.add_argument("--target", choices=("app", "filter"), default="app")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument("--toxic-share", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens generated by the fake Ollama.")
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    parser.add_argument("--data-dir", default=None, help="Synthetic dataset/index directory (default: temp dir).")
+    parser.add_argument("--filter-python", default=sys.executable,
+                        help="Interpreter with the filter requirements, if they live in another environment.")
+    parser.add_argument("--broker-port", type=int, default=5680)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--startup-timeout", type=float, default=1800)
+    parser.add_argument("--output", default=None, help="Write the reports as JSON to this file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="llm-filter-bench-")
+    if not os.path.exists(os.path.join(data_dir, "train.csv")):
+        write_dataset(data_dir)
+
+    env = dict(os.environ, DATA_PATH=data_dir, INDEX_DIR=os.path.join(data_dir, "semantic_index"),
+               VERDICT_CACHE_SIZE="0", NEAR_DUPLICATE_SIZE="0", PYTHONUNBUFFERED="1")
+    processes = [subprocess.Popen(
+        [args.filter_python, os.path.join(BENCH_DIR, "local_broker.py"), "--port", str(args.broker_port)],
+        cwd=os.path.join(ROOT, "filter"), env=env
+    )]
+    if args.target == "app":
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"), "--port", str(args.ollama_port),
+             "--tokens", str(args.tokens), "--token-latency-ms", str(args.token_latency_ms)],
+            env=env
+        ))
+
+    try:
+        wait_for_port(args.broker_port, processes[0], args.startup_timeout)
+        if args.target == "app":
+            wait_for_port(args.ollama_port, processes[1], 60)
+        reports = asyncio.run(benchmark(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(reports, f, indent=2)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+if __name__ == '__main__':
+    main()
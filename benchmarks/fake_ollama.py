@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import json
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Stand-in for Ollama's /api/generate: emits `--tokens` words, one every
+# `--token-latency-ms`, streamed as NDJSON or returned at once.
+app = FastAPI()
+settings = {"tokens": 50, "token_latency": 0.02}
+
+WORDS = "the quick brown fox jumps over the lazy dog and then rests in the warm sun .".split()
+
+
+async def tokens():
+    for i in range(settings["tokens"]):
+        await asyncio.sleep(settings["token_latency"])
+        yield WORDS[i % len(WORDS)] + " "
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    payload = await request.json()
+    if not payload.get("stream", True):
+        return {"model": payload.get("model"), "response": "".join([token async for token in tokens()]), "done": True}
+
+    async def ndjson():
+        async for token in tokens():
+            yield json.dumps({"response": token, "done": False}) + "\n"
+        yield json.dumps({"response": "", "done": True}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Ollama server with configurable token latency.")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    settings.update(tokens=args.tokens, token_latency=args.token_latency_ms / 1000)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
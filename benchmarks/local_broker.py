@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Local stand-in for RabbitMQ + the filter worker: the server runs in the filter
+# environment and micro-batches requests into is_safe_batch like the worker does;
+# LocalFilterClient gives the app the same process_request() as RabbitMQService.
+# Messages are newline-delimited JSON over TCP.
+
+FILTER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filter")
+LINE_LIMIT = 1 << 24
+
+logger = logging.getLogger(__name__)
+
+
+async def serve(port: int, batch_size: int, timeout_ms: float):
+    sys.path.insert(0, FILTER_DIR)
+    from src.core.filter import init_models, is_safe_batch, warm_up
+
+    init_models()
+    warm_up()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def batcher():
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + timeout_ms / 1000
+            while len(batch) < batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            results = await loop.run_in_executor(executor, is_safe_batch, [message for _, _, message in batch])
+            for (writer, request_id, _), result in zip(batch, results):
+                writer.write((json.dumps({"id": request_id, "result": result}) + "\n").encode())
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async for line in reader:
+            request = json.loads(line)
+            await queue.put((writer, request["id"], request["message"]))
+
+    batch_task = asyncio.create_task(batcher())
+    server = await asyncio.start_server(handle, "127.0.0.1", port, limit=LINE_LIMIT)
+    logger.info("Local broker listening on %d (batch size %d, timeout %.1f ms)", port, batch_size, timeout_ms)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # serve_forever only ends by cancellation (Ctrl+C / task cancel), so clean up here.
+        batch_task.cancel()
+
+
+class LocalFilterClient:
+    """Drop-in for the app's RabbitMQService that talks to the local broker."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5680):
+        self.host = host
+        self.port = port
+        self.futures = {}
+        self._next_id = 0
+        self._reader = self._writer = self._read_task = None
+
+    async def initialize(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+        self._read_task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for line in self._reader:
+            reply = json.loads(line)
+            future = self.futures.pop(reply["id"], None)
+            if future and not future.done():
+                future.set_result(reply["result"])
+
+    async def process_request(self, message: str, timeout: float = 60, **_) -> dict:
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self.futures[request_id] = future
+        self._writer.write((json.dumps({"id": request_id, "message": message}) + "\n").encode())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.futures.pop(request_id, None)
+
+    async def close(self):
+        if self._read_task:
+            self._read_task.cancel()
+        if self._writer:
+            self._writer.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Local broker substitute serving the filter over TCP.")
+    parser.add_argument("--port", type=int, default=5680)
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get("BATCH_SIZE", 16)))
+    parser.add_argument("--batch-timeout-ms", type=float, default=float(os.environ.get("BATCH_TIMEOUT_MS", 5)))
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.batch_size, args.batch_timeout_ms))
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from corpus import synthetic_texts, write_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILTER_DIR = os.path.join(ROOT, "filter")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Text lengths (in repetitions of a synthetic prompt) each function is timed on.
+LENGTHS = {"short": 1, "medium": 8, "long": 64}
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Median seconds per call after one warm-up call."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(repeat: int) -> Dict[str, float]:
+    sys.path.insert(0, FILTER_DIR)
+    from src.core import filter as f
+
+    f.init_models()
+    base = synthetic_texts(64, toxic_share=0.5, seed=7)
+    functions = {
+        "classification_score": lambda text: f.classification_score(
+            text, f.tokenizer, f.classifier_model, f.DEVICE, f.SELECTED_KEYS
+        ),
+        "semantic_score": f.semantic_score,
+        "is_recurrent": f.is_recurrent,
+        "character_anomalies": f.character_anomalies,
+        "mixed_script_ratio": f.mixed_script_ratio,
+        "is_safe": f.is_safe,
+    }
+
+    results = {}
+    for label, size in LENGTHS.items():
+        text = " ".join(base[:size])
+        for name, fn in functions.items():
+            results[f"{name}[{label}]"] = time_call(lambda: fn(text), repeat)
+    for batch_size in (8, 32):
+        results[f"is_safe_batch[{batch_size}]"] = time_call(lambda: f.is_safe_batch(base[:batch_size]), repeat)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> bool:
+    """Prints current vs baseline timings and returns False if anything got slower than the tolerance."""
+    ok = True
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<36} {seconds * 1e3:10.3f}ms   (no baseline)")
+            continue
+        ratio = seconds / before if before else float("inf")
+        regressed = ratio > 1 + tolerance
+        ok &= not regressed
+        print(f"{name:<36} {seconds * 1e3:10.3f}ms  baseline {before * 1e3:10.3f}ms  "
+              f"x{ratio:5.2f}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark every check in filter/src/core/filter.py.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%).")
+    parser.add_argument("--data-dir", default=None, help="Dataset/index directory (default: synthetic temp dir).")
+    args = parser.parse_args()
+
+    if "DATA_PATH" not in os.environ:
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix="llm-filter-micro-")
+        if not os.path.exists(os.path.join(data_dir, "train.csv")):
+            write_dataset(data_dir)
+        os.environ["DATA_PATH"] = data_dir
+        os.environ.setdefault("INDEX_DIR", os.path.join(data_dir, "semantic_index"))
+    # Every call must reach the checks, not the verdict cache or the near-duplicate index.
+    os.environ["VERDICT_CACHE_SIZE"] = "0"
+    os.environ["NEAR_DUPLICATE_SIZE"] = "0"
+
+    results = run(args.repeat)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline with {len(results)} entries to {args.baseline}")
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+from corpus import synthetic_texts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+
+# The classifier labels a filter verdict carries with the default configuration.
+LABELS = ["toxic", "severe_toxic", "obscene", "identity_attack", "insult", "threat", "sexual_explicit"]
+DEFAULT_ENVELOPES = "1,8,64"
+
+
+def synthetic_results(count: int, seed: int) -> List[Dict]:
+    """Verdicts shaped like is_safe_batch output: full cascades, short-circuited ones and near-duplicate hits."""
+    rng = random.Random(seed)
+    results = []
+    for _ in range(count):
+        skipped = rng.choice([[], [], ["semantic"], ["classifier", "semantic"]])
+        result = {
+            "status": rng.random() < 0.7,
+            "is_recurrent_result": rng.random() < 0.05,
+            "mixed_language_result": rng.random() * 0.1,
+            "anomaly_result": rng.random() * 0.5,
+            "classification_result": {} if "classifier" in skipped else {label: rng.random() for label in LABELS},
+            "semantic_result": 0.0 if "semantic" in skipped else rng.random(),
+            "skipped": skipped,
+            "fingerprint": "3f9a1c0b7d2e4a65",
+        }
+        if rng.random() < 0.1:
+            result["near_duplicate_result"] = 0.7 + 0.3 * rng.random()
+            result["near_duplicate_cluster"] = f"{rng.randint(1, 64)}-{rng.randint(0, 10000)}"
+        results.append(result)
+    return results
+
+
+def cpu_per_round(fn, min_seconds: float) -> float:
+    """CPU seconds per call, so scheduling noise does not count."""
+    calls, start = 0, time.process_time()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def bench(name: str, content_type: str, envelope: int, texts: List[str], results: List[Dict],
+          min_seconds: float) -> Dict:
+    from src.core.protocol import decode_requests, decode_results, encode_requests, encode_results
+
+    deadline = time.time() + 60
+    requests = [{"message": text, "session": None, "deadline": deadline} for text in texts]
+    chunks = [(requests[i:i + envelope], results[i:i + envelope]) for i in range(0, len(texts), envelope)]
+    request_bytes = sum(len(encode_requests(chunk, content_type)) for chunk, _ in chunks)
+    reply_bytes = sum(len(encode_results(verdicts, content_type)) for _, verdicts in chunks)
+
+    def round_trip():
+        # App encodes, filter decodes, filter encodes the verdicts, app decodes them.
+        for chunk, verdicts in chunks:
+            decode_requests(encode_requests(chunk, content_type), content_type)
+            decode_results(encode_results(verdicts, content_type), content_type)
+
+    return {
+        "protocol": name,
+        "messages_per_1k_texts": 1000 * len(chunks) / len(texts),
+        "request_bytes": request_bytes / len(texts),
+        "reply_bytes": reply_bytes / len(texts),
+        "cpu_us": 1e6 * cpu_per_round(round_trip, min_seconds) / len(texts),
+    }
+
+
+def print_table(rows: List[Dict]):
+    baseline = rows[0]
+    columns = ["messages_per_1k_texts", "request_bytes", "reply_bytes", "cpu_us"]
+    print(f"{'protocol':<16}" + "".join(f"{column:>22}" for column in columns) + f"{'bytes saved':>14}{'cpu saved':>12}")
+    for row in rows:
+        total, baseline_total = row["request_bytes"] + row["reply_bytes"], baseline["request_bytes"] + baseline["reply_bytes"]
+        print(
+            f"{row['protocol']:<16}" + "".join(f"{row[column]:>22.1f}" for column in columns)
+            + f"{1 - total / baseline_total:>14.1%}{1 - row['cpu_us'] / baseline['cpu_us']:>12.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the filter RPC wire formats: messages, bytes and encode/decode CPU per text."
+    )
+    parser.add_argument("--texts", type=int, default=4096)
+    parser.add_argument("--envelopes", default=DEFAULT_ENVELOPES, help="Comma-separated msgpack envelope sizes.")
+    parser.add_argument("--repeat-text", type=int, default=1, help="Repeat each synthetic prompt to lengthen it.")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum CPU time per protocol.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    from src.core.protocol import JSON, MSGPACK
+
+    texts = [" ".join([text] * args.repeat_text) for text in synthetic_texts(args.texts, seed=args.seed)]
+    results = synthetic_results(args.texts, args.seed)
+    # JSON, one text per message, is the baseline the savings are relative to.
+    rows = [bench("json", JSON, 1, texts, results, args.min_seconds)]
+    for envelope in (int(size) for size in args.envelopes.split(",")):
+        try:
+            rows.append(bench(f"msgpack x{envelope}", MSGPACK, envelope, texts, results, args.min_seconds))
+        except RuntimeError as e:
+            print(f"msgpack x{envelope}: {e}")
+
+    print(f"{len(texts)} texts, {sum(map(len, texts)) / len(texts):.0f} characters on average")
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
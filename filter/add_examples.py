@@ -0,0 +1,65 @@
+import argparse
+import hashlib
+import json
+import logging
+import sys
+
+from pika import BasicProperties, BlockingConnection, ConnectionParameters
+
+from src.utils.config import CONTROL_EXCHANGE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Add toxic examples to the semantic index of every running filter worker."
+    )
+    parser.add_argument("input", help="Text file with one example per line, or JSONL with --field.")
+    parser.add_argument("--field", default=None, help="Read the example from this field of each JSONL line.")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Examples per control message.")
+    parser.add_argument("--host", default="rabbitmq", help="RabbitMQ host.")
+    return parser.parse_args()
+
+def read_examples(path: str, field: str = None):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            text = json.loads(line)[field] if field else line
+            if isinstance(text, str) and text:
+                yield text
+
+def publish(args) -> int:
+    texts = list(read_examples(args.input, args.field))
+    connection = BlockingConnection(ConnectionParameters(host=args.host))
+    try:
+        channel = connection.channel()
+        channel.exchange_declare(exchange=CONTROL_EXCHANGE, exchange_type='fanout')
+        for start in range(0, len(texts), args.chunk_size):
+            chunk = texts[start:start + args.chunk_size]
+            # Content-derived ids make re-running the same file a no-op.
+            example_id = hashlib.sha256(json.dumps(chunk).encode()).hexdigest()[:16]
+            channel.basic_publish(
+                exchange=CONTROL_EXCHANGE,
+                routing_key='',
+                properties=BasicProperties(content_type='application/json'),
+                body=json.dumps({"action": "add_examples", "id": example_id, "texts": chunk})
+            )
+            logger.info("Published %d examples as %s", len(chunk), example_id)
+    finally:
+        connection.close()
+    return len(texts)
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        count = publish(args)
+        logger.info("Sent %d examples to %s", count, CONTROL_EXCHANGE)
+    except Exception as e:
+        logger.exception("Adding examples failed: %s", e)
+        sys.exit(1)
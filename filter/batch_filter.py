@@ -0,0 +1,121 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from src.core.filter import init_models, is_safe_batch
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Stream a JSONL file through the filter in large batches and write the verdicts as JSONL."
+    )
+    parser.add_argument("input", help="Input JSONL file, one object per line.")
+    parser.add_argument("output", help="Output JSONL file, one verdict per input line.")
+    parser.add_argument("--field", default="message", help="Field holding the text to filter (e.g. 'body').")
+    parser.add_argument("--id-field", default=None, help="Field copied into each result to identify it.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Texts per is_safe_batch call.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint).")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint offset.")
+    return parser.parse_args()
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"offset": 0, "output_bytes": 0}
+
+def save_checkpoint(path: str, offset: int, output_bytes: int):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"offset": offset, "output_bytes": output_bytes}, f)
+    os.replace(tmp_path, path)
+
+def run(args) -> dict:
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else {"offset": 0, "output_bytes": 0}
+    skip = checkpoint["offset"]
+
+    out = open(args.output, "r+b" if args.resume and os.path.exists(args.output) else "wb")
+    # Drop anything written after the last checkpoint so resumed runs never duplicate lines.
+    out.truncate(checkpoint["output_bytes"])
+    out.seek(checkpoint["output_bytes"])
+    if skip:
+        logger.info("Resuming from line %d", skip)
+
+    timings = {}
+    processed = 0
+    start = time.perf_counter()
+
+    def flush(batch):
+        nonlocal processed
+        texts = [text for _, _, text, _ in batch if text is not None]
+        verdicts = iter(is_safe_batch(texts, timings=timings))
+        for line_no, record_id, text, error in batch:
+            result = {"line": line_no}
+            if args.id_field:
+                result[args.id_field] = record_id
+            if text is not None:
+                result.update(next(verdicts))
+            else:
+                result["error"] = error
+            out.write((json.dumps(result) + "\n").encode("utf-8"))
+        out.flush()
+        os.fsync(out.fileno())
+        processed += len(batch)
+        save_checkpoint(checkpoint_path, batch[-1][0] + 1, out.tell())
+
+    with open(args.input, encoding="utf-8") as f:
+        batch = []
+        for line_no, line in enumerate(f):
+            if line_no < skip:
+                continue
+            record_id, text, error = None, None, None
+            try:
+                record = json.loads(line)
+                record_id = record.get(args.id_field) if args.id_field else None
+                text = record[args.field]
+                if not isinstance(text, str):
+                    raise ValueError(f"field '{args.field}' is not a string")
+            except Exception as e:
+                text, error = None, f"ERROR: {e}"
+            batch.append((line_no, record_id, text, error))
+
+            if len(batch) >= args.batch_size:
+                flush(batch)
+                batch = []
+                elapsed = time.perf_counter() - start
+                logger.info("Processed %d messages (%.1f msgs/s)", processed, processed / elapsed)
+        if batch:
+            flush(batch)
+
+    out.close()
+    return {"processed": processed, "elapsed": time.perf_counter() - start, "timings": timings}
+
+def report(stats: dict):
+    elapsed = stats["elapsed"] or 1e-9
+    logger.info("Done: %d messages in %.1fs (%.1f msgs/s)",
+                stats["processed"], stats["elapsed"], stats["processed"] / elapsed)
+    total = sum(stats["timings"].values()) or 1e-9
+    for stage, seconds in sorted(stats["timings"].items(), key=lambda item: -item[1]):
+        logger.info("  %-14s %8.2fs  %5.1f%%", stage, seconds, 100 * seconds / total)
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        init_models()
+        report(run(args))
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, rerun with --resume to continue from the last checkpoint")
+        sys.exit(130)
+    except Exception as e:
+        logger.exception("Batch filtering failed: %s", e)
+        sys.exit(1)
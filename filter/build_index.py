@@ -0,0 +1,30 @@
+import argparse
+import logging
+import sys
+
+from src.core.models import load_or_build_semantic_index, load_semantic_encoder, semantic_index_fingerprint
+from src.utils.config import INDEX_DIR
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prebuild the semantic embeddings and nearest-neighbour index artifact.")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Directory to write the artifact to.")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the fingerprint matches.")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        logger.info("Building semantic index %s into %s", semantic_index_fingerprint(), args.index_dir)
+        # The encoder of the configured INFERENCE_BACKEND, so the index matches the workers' queries.
+        model = load_semantic_encoder()
+        artifact = load_or_build_semantic_index(model, index_dir=args.index_dir, force=args.force)
+        logger.info("Semantic index ready with %d vectors", len(artifact.embeddings))
+    except Exception as e:
+        logger.exception("Index build failed: %s", e)
+        sys.exit(1)
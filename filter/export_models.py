@@ -0,0 +1,87 @@
+import argparse
+import logging
+import sys
+
+import numpy as np
+import torch
+
+from src.core.models import (
+    export_classifier_onnx, export_semantic_onnx, init_classifier_model, load_semantic_encoder
+)
+from src.utils.config import DATA_PATH
+from src.utils.data import load_sample_texts
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch-int8', 'onnx', 'onnx-int8')
+
+def classifier_probs(tokenizer, model, texts, batch_size=32) -> np.ndarray:
+    probs = []
+    for i in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[i:i + batch_size], return_tensors="pt", truncation=True, padding=True, max_length=128
+        ).to("cpu")
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        probs.append(torch.sigmoid(logits).float().numpy())
+    return np.concatenate(probs)
+
+def embeddings(model, texts) -> np.ndarray:
+    return np.asarray(model.encode(texts, normalize_embeddings=True, device="cpu"), dtype=np.float32)
+
+def parity(backend: str, limit: int) -> bool:
+    """
+    Scores a sample of the dataset with the PyTorch baseline and with `backend`
+    and reports the largest drift. Returns False when the sample is empty.
+    """
+    texts = [text for text in load_sample_texts(limit, DATA_PATH) if text]
+    if not texts:
+        logger.error("No sample texts found in %s", DATA_PATH)
+        return False
+
+    base_tokenizer, base_classifier = init_classifier_model(backend="torch")
+    tokenizer, classifier = init_classifier_model(backend=backend)
+    base_probs = classifier_probs(base_tokenizer, base_classifier.float().cpu(), texts)
+    probs = classifier_probs(tokenizer, classifier, texts)
+    drift = np.abs(base_probs - probs)
+    flips = int(np.sum((base_probs > 0.5) != (probs > 0.5)))
+
+    base_vectors = embeddings(load_semantic_encoder("torch"), texts)
+    vectors = embeddings(load_semantic_encoder(backend), texts)
+    cosine = np.sum(base_vectors * vectors, axis=1)
+
+    logger.info("Parity of %s against torch on %d texts:", backend, len(texts))
+    logger.info("  classifier: max |prob drift| %.6f, mean %.6f, label flips at 0.5: %d",
+                drift.max(), drift.mean(), flips)
+    logger.info("  semantic:   max (1 - cosine) %.6f, mean %.6f",
+                float(np.max(1 - cosine)), float(np.mean(1 - cosine)))
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export filter models for CPU backends and check their parity.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export the classifier and semantic model to ONNX (fp32 + int8).")
+    export.add_argument("--no-quantize", action="store_true", help="Skip the int8 copies.")
+
+    check = sub.add_parser("parity", help="Report score drift of a backend against PyTorch eager.")
+    check.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    check.add_argument("--limit", type=int, default=256, help="Number of sample texts.")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        if args.command == "export":
+            export_classifier_onnx(quantize=not args.no_quantize)
+            export_semantic_onnx(quantize=not args.no_quantize)
+            logger.info("Export complete")
+        elif not parity(args.backend, args.limit):
+            sys.exit(1)
+    except Exception as e:
+        logger.exception("%s failed: %s", args.command, e)
+        sys.exit(1)
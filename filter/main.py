@@ -1,7 +1,17 @@
 import logging
+import os
 import sys
 
+import torch
+
+from src.core.filter import LOAD_SEMANTIC, init_models, warm_up
+from src.core.models import semantic_index_ready
 from src.core.rabbitmq import RabbitMQService
+from src.core.supervisor import (
+    WorkerSupervisor, choose_pool_size, prepare_semantic_index_in_child, remove_ready_file, write_ready_file
+)
+from src.utils.config import ADMIN_PORT, METRICS_PORT, READY_FILE, TORCH_THREADS, WARMUP, WORKER_PROCESSES
+from src.utils.metrics import start_metrics_server
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,8 +22,31 @@ logger = logging.getLogger(__name__)
 if __name__ == '__main__':
     try:
         logger.info("Worker initializing...")
-        service = RabbitMQService()
-        service.initialize()
+        remove_ready_file(READY_FILE)
+        start_metrics_server(METRICS_PORT)
+        logger.info("Serving metrics on port %d", METRICS_PORT)
+        # Anything that encodes runs in a child: this process must not start torch's thread pool before forking.
+        if LOAD_SEMANTIC and not semantic_index_ready():
+            prepare_semantic_index_in_child()
+        # Loaded once here so forked workers share the weights copy-on-write.
+        init_models(prepared=True)
+        if WORKER_PROCESSES == 'auto':
+            processes, threads = choose_pool_size(os.cpu_count() or 1, TORCH_THREADS)
+        else:
+            processes, threads = int(WORKER_PROCESSES), TORCH_THREADS
+
+        if processes > 1:
+            WorkerSupervisor(processes, threads, ready_file=READY_FILE, admin_port=ADMIN_PORT).run()
+        else:
+            if threads:
+                torch.set_num_threads(threads)
+            if WARMUP:
+                warm_up()
+            service = RabbitMQService(admin_port=ADMIN_PORT, on_ready=lambda: write_ready_file(READY_FILE))
+            try:
+                service.initialize()
+            finally:
+                remove_ready_file(READY_FILE)
         logger.info("Worker shutdown cleanly")
     except KeyboardInterrupt:
         logger.warning("Worker interrupted by user")
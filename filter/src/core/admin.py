@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+from src.core.profiler import Profiler
+
+logger = logging.getLogger(__name__)
+
+
+class AdminServer:
+    """
+    Small HTTP control port of a worker process, served from a daemon thread:
+
+    - GET /ready answers 200 once the worker is warm and consuming, 503 before
+    - GET /near-duplicates?limit=N lists the busiest near-duplicate clusters
+    - POST /profile?mode=sampling|torch&seconds=N&messages=N starts a profile
+    - POST /profile/stop ends it after the current batch
+    - GET /profile returns the running session and the last result
+    - GET /profile/folded returns the folded stacks of the last result
+    """
+
+    def __init__(self, port: int, profiler: Optional[Profiler] = None, ready: Callable[[], bool] = lambda: False,
+                 near_duplicates: Optional[Callable[[Optional[int]], list]] = None):
+        self.port = port
+        self.profiler = profiler
+        self.ready = ready
+        self.near_duplicates = near_duplicates
+        self.server = None
+
+    def start(self):
+        admin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                admin.handle(self, "GET")
+
+            def do_POST(self):
+                admin.handle(self, "POST")
+
+            def log_message(self, format, *args):
+                logger.debug("Admin request: " + format, *args)
+
+        self.server = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="admin", daemon=True).start()
+        logger.info("Admin port listening on %d", self.port)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str):
+        url = urlparse(request.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if method == "GET" and url.path == "/ready":
+                ready = self.ready()
+                self._send_json(request, 200 if ready else 503, {"ready": ready})
+            elif method == "GET" and url.path == "/near-duplicates" and self.near_duplicates is not None:
+                self._send_json(request, 200, {"clusters": self.near_duplicates(int(params.get("limit", 20)))})
+            elif self.profiler is None:
+                self._send_json(request, 404, {"detail": "Not found"})
+            elif method == "POST" and url.path == "/profile":
+                status = self.profiler.start(
+                    mode=params.get("mode", "sampling"),
+                    seconds=float(params.get("seconds", 30)),
+                    messages=int(params.get("messages", 0)),
+                )
+                self._send_json(request, 202, status)
+            elif method == "POST" and url.path == "/profile/stop":
+                self.profiler.stop()
+                self._send_json(request, 202, self.profiler.status())
+            elif method == "GET" and url.path == "/profile":
+                self._send_json(request, 200, self.profiler.status())
+            elif method == "GET" and url.path == "/profile/folded":
+                folded = ((self.profiler.last_result or {}).get("files") or {}).get("folded")
+                if not folded:
+                    self._send_json(request, 404, {"detail": "No profile recorded yet"})
+                    return
+                with open(folded, "rb") as f:
+                    self._send(request, 200, f.read(), "text/plain; charset=utf-8")
+            else:
+                self._send_json(request, 404, {"detail": "Not found"})
+        except ValueError as e:
+            self._send_json(request, 400, {"detail": str(e)})
+        except RuntimeError as e:
+            self._send_json(request, 409, {"detail": str(e)})
+        except Exception as e:
+            logger.exception("Admin request failed: %s", e)
+            self._send_json(request, 500, {"detail": f"ERROR: {e}"})
+
+    def _send_json(self, request: BaseHTTPRequestHandler, code: int, payload: dict):
+        self._send(request, code, json.dumps(payload).encode(), "application/json")
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, code: int, body: bytes, content_type: str):
+        request.send_response(code)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+from src.utils.config import (
+    ANN_BACKEND, ANN_EXACT_DTYPE, ANN_EXACT_BLOCK_SIZE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+)
+
+logger = logging.getLogger(__name__)
+
+# Every searcher follows ScaNN's contract: search_batched(queries, final_num_neighbors)
+# returns (neighbors, scores) with the best match first, scores being dot products
+# of normalized vectors.
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k columns of each row, sorted by descending score."""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class ExactSearcher:
+    """
+    Brute-force search over a float16 or int8 copy of the embeddings. Rows are
+    scored block by block with a float32 BLAS matmul, so only one block is
+    ever widened to float32. int8 rows carry a per-row scale.
+    """
+
+    def __init__(self, matrix: np.ndarray, scales, block_size: int):
+        self.matrix = matrix
+        self.scales = scales
+        self.block_size = block_size
+
+    def search_batched(self, queries: np.ndarray, final_num_neighbors: int = 5):
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(final_num_neighbors, len(self.matrix))
+        neighbors = np.empty((len(queries), 0), dtype=np.int64)
+        scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.matrix), self.block_size):
+            block = np.asarray(self.matrix[start:start + self.block_size], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + self.block_size]
+            block_ids = np.broadcast_to(np.arange(start, start + len(block)), block_scores.shape)
+            neighbors, scores = _top_k(
+                np.concatenate([scores, block_scores], axis=1), np.concatenate([neighbors, block_ids], axis=1), k
+            )
+        return neighbors, scores
+
+
+class HnswSearcher:
+    """hnswlib graph index; it reports 1 - dot product, converted back to scores here."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def search_batched(self, queries: np.ndarray, final_num_neighbors: int = 5):
+        labels, distances = self.index.knn_query(np.asarray(queries, dtype=np.float32), k=final_num_neighbors)
+        return labels.astype(np.int64), 1.0 - distances
+
+
+class AnnBackend:
+    """
+    Builds, saves and loads one kind of searcher. `params` are the build and
+    search settings; they are part of the semantic index fingerprint.
+    """
+
+    name = ""
+
+    def __init__(self, **params):
+        self.params = params
+
+    def describe(self) -> Dict[str, object]:
+        return {"backend": self.name, **self.params}
+
+    def build(self, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def save(self, searcher, directory: str):
+        raise NotImplementedError
+
+    def load(self, directory: str):
+        raise NotImplementedError
+
+
+class ScannBackend(AnnBackend):
+    name = "scann"
+
+    def __init__(self, k: int = 5, num_leaves: int = 200, num_leaves_to_search: int = 10,
+                 training_sample_size: int = 250000, dimensions_per_block: int = 2,
+                 anisotropic_quantization_threshold: float = 0.2):
+        super().__init__(
+            k=k, num_leaves=num_leaves, num_leaves_to_search=num_leaves_to_search,
+            training_sample_size=training_sample_size, dimensions_per_block=dimensions_per_block,
+            anisotropic_quantization_threshold=anisotropic_quantization_threshold
+        )
+
+    def build(self, vectors: np.ndarray):
+        import scann
+
+        p = self.params
+        return scann.scann_ops_pybind.builder(
+            vectors, p["k"], "dot_product"
+        ).tree(
+            # A tree needs fewer leaves than vectors, which small indexes do not have.
+            num_leaves=min(p["num_leaves"], len(vectors)),
+            num_leaves_to_search=min(p["num_leaves_to_search"], len(vectors)),
+            training_sample_size=min(p["training_sample_size"], len(vectors))
+        ).score_ah(
+            p["dimensions_per_block"],
+            anisotropic_quantization_threshold=p["anisotropic_quantization_threshold"]
+        ).build()
+
+    def save(self, searcher, directory: str):
+        searcher.serialize(directory)
+
+    def load(self, directory: str):
+        import scann
+
+        return scann.scann_ops_pybind.load_searcher(directory)
+
+
+class ExactBackend(AnnBackend):
+    name = "exact"
+
+    def __init__(self, dtype: str = ANN_EXACT_DTYPE, block_size: int = ANN_EXACT_BLOCK_SIZE):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported exact search dtype: {dtype}")
+        super().__init__(dtype=dtype, block_size=block_size)
+
+    def build(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dtype = self.params["dtype"]
+        if dtype != "int8":
+            return ExactSearcher(vectors.astype(dtype), None, self.params["block_size"])
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+        return ExactSearcher(matrix, scales.astype(np.float32), self.params["block_size"])
+
+    def save(self, searcher: ExactSearcher, directory: str):
+        np.save(os.path.join(directory, "matrix.npy"), searcher.matrix)
+        if searcher.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), searcher.scales)
+
+    def load(self, directory: str):
+        # Memory-mapped like the embeddings, so forked workers share the pages.
+        matrix = np.load(os.path.join(directory, "matrix.npy"), mmap_mode="r")
+        scales_path = os.path.join(directory, "scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        return ExactSearcher(matrix, scales, self.params["block_size"])
+
+
+class HnswBackend(AnnBackend):
+    name = "hnsw"
+
+    def __init__(self, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, ef_search: int = HNSW_EF_SEARCH):
+        super().__init__(m=m, ef_construction=ef_construction, ef_search=ef_search)
+
+    def _index(self, dim: int):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise RuntimeError("ANN_BACKEND=hnsw needs the optional hnswlib package") from e
+        return hnswlib.Index(space="ip", dim=dim)
+
+    def build(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = self._index(vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=self.params["ef_construction"],
+                         M=self.params["m"])
+        index.add_items(vectors, np.arange(len(vectors)))
+        index.set_ef(self.params["ef_search"])
+        return HnswSearcher(index)
+
+    def save(self, searcher: HnswSearcher, directory: str):
+        searcher.index.save_index(os.path.join(directory, "index.bin"))
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"dim": searcher.index.dim, "count": searcher.index.get_current_count()}, f)
+
+    def load(self, directory: str):
+        with open(os.path.join(directory, "index.json")) as f:
+            meta = json.load(f)
+        index = self._index(meta["dim"])
+        index.load_index(os.path.join(directory, "index.bin"), max_elements=meta["count"])
+        index.set_ef(self.params["ef_search"])
+        return HnswSearcher(index)
+
+
+BACKENDS = {backend.name: backend for backend in (ScannBackend, ExactBackend, HnswBackend)}
+
+
+def get_backend(name: str = ANN_BACKEND, **params) -> AnnBackend:
+    """Returns the configured backend; `params` override its defaults."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ANN backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**params)
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+from src.utils.metrics import VERDICT_CACHE_COUNTER
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str, fingerprint: str) -> str:
+    """
+    Content address of a verdict: the text itself is not normalized because
+    the heuristics score case, punctuation and length, so any rewrite of the
+    text could change its verdict.
+    """
+    return hashlib.sha256(f"{fingerprint}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def make_fingerprint(**parts) -> str:
+    """Returns a short, stable hash of everything a verdict depends on."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class VerdictCache:
+    """
+    Size-bounded LRU of is_safe results with a per-entry TTL. Keys include
+    the models/index/thresholds fingerprint; changing it drops every entry.
+    """
+
+    def __init__(self, max_size: int, ttl: float, fingerprint: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint = fingerprint
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def set_fingerprint(self, fingerprint: str):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                logger.info("Verdict cache fingerprint changed (%s -> %s), clearing %d entries",
+                            self.fingerprint, fingerprint, len(self._entries))
+                self.fingerprint = fingerprint
+                self._entries.clear()
+
+    def get(self, text: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            key = text_key(text, self.fingerprint)
+            entry = self._entries.get(key)
+            if entry is None:
+                VERDICT_CACHE_COUNTER.labels(event="miss").inc()
+                return None
+            expires_at, verdict = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                VERDICT_CACHE_COUNTER.labels(event="expired").inc()
+                VERDICT_CACHE_COUNTER.labels(event="miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            VERDICT_CACHE_COUNTER.labels(event="hit").inc()
+            return dict(verdict)
+
+    def put(self, text: str, verdict: Dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = text_key(text, self.fingerprint)
+            self._entries[key] = (time.monotonic() + self.ttl, dict(verdict))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                VERDICT_CACHE_COUNTER.labels(event="eviction").inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
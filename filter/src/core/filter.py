@@ -1,18 +1,179 @@
-from typing import Dict
-from collections import Counter
-import re, unicodedata
+from typing import Dict, List, Optional
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 
-from src.core.models import init_classifier_model, init_semantic_model
-from src.utils.config import DEVICE, KEYS
+from src.core.cache import VerdictCache, make_fingerprint
+from src.core.heuristics import HeuristicScanner
+from src.core.models import (
+    encode_examples, init_classifier_model, init_semantic_model, semantic_index_fingerprint, startup_phase
+)
+from src.core.near_duplicates import NearDuplicateIndex
+from src.core.semantic_index import ExampleStore
+from src.core.sessions import SessionState
+from src.utils.config import (
+    DEVICE, KEYS, HF_MODEL, INFERENCE_BACKEND, CLASSIFIER_THRESHOLD, SEMANTIC_THRESHOLD,
+    ANOMALY_THRESHOLD, MIXED_SCRIPT_THRESHOLD, VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL,
+    CASCADE_ORDER, CASCADE_SHORT_CIRCUIT, CLASSIFIER_CONFIDENT_TOXIC, CLASSIFIER_CONFIDENT_CLEAN,
+    MIXED_SCRIPT_ALL_SCRIPTS, CLASSIFIER_MAX_LENGTH, CLASSIFIER_WINDOW_STRIDE, CLASSIFIER_MAX_WINDOWS,
+    CLASSIFIER_BATCH_SIZE, CLASSIFIER_WINDOW_REDUCER, WARMUP_LENGTHS, WARMUP_BATCH_SIZES, SEMANTIC_EXAMPLES_FILE,
+    NEAR_DUPLICATE_SIZE, NEAR_DUPLICATE_TTL, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_MIN_LENGTH,
+    NEAR_DUPLICATE_RATE_WINDOW, NEAR_DUPLICATE_TOP_CLUSTERS, SESSION_MAX_TURNS, SESSION_MAX_WORDS, SESSION_MIN_WORDS,
+    SESSION_MAX_REPEATS, SESSION_ANOMALY_ALPHA, SESSION_ANOMALY_THRESHOLD, WORKER_STAGE, WORKER_CASCADE
+)
+from src.utils.metrics import (
+    STAGE_SKIPPED_COUNTER, CLASSIFIER_WINDOWS_COUNTER, CLASSIFIER_TOKENS_COUNTER, STAGE_DURATION, EXPIRED_COUNTER,
+    SESSION_BLOCKED_COUNTER
+)
 
 logger = logging.getLogger(__name__)
 
-semantic_model, semantic_index = init_semantic_model()
-tokenizer, classifier_model = init_classifier_model()
+# Set by init_models(), which the entry points call once per process (before forking workers).
+# Workers of a stage pool leave the models their checks do not use unloaded.
+semantic_model = semantic_index = None
+tokenizer = classifier_model = None
+_models_loaded = False
+LOAD_CLASSIFIER = WORKER_STAGE in ("all", "classifier")
+LOAD_SEMANTIC = WORKER_STAGE in ("all", "semantic")
+# Embeddings of the conversation turns of the batch being filtered, see encode_texts.
+_batch_vectors: Dict[str, np.ndarray] = {}
+
+SELECTED_KEYS = {"toxic", "severe_toxic", "obscene", "insult"}
+
+# Everything a verdict depends on; replies carry it so callers can invalidate their caches.
+# Examples added to the semantic index at runtime extend it (see _refresh_fingerprint).
+BASE_FINGERPRINT = FINGERPRINT = make_fingerprint(
+    classifier=HF_MODEL,
+    backend=INFERENCE_BACKEND,
+    semantic_index=semantic_index_fingerprint(),
+    selected_keys=sorted(SELECTED_KEYS),
+    all_scripts=MIXED_SCRIPT_ALL_SCRIPTS,
+    windows=[CLASSIFIER_MAX_LENGTH, CLASSIFIER_WINDOW_STRIDE, CLASSIFIER_MAX_WINDOWS, CLASSIFIER_WINDOW_REDUCER],
+    thresholds=[CLASSIFIER_THRESHOLD, SEMANTIC_THRESHOLD, ANOMALY_THRESHOLD, MIXED_SCRIPT_THRESHOLD],
+    cascade=[CASCADE_ORDER, CASCADE_SHORT_CIRCUIT, CLASSIFIER_CONFIDENT_TOXIC, CLASSIFIER_CONFIDENT_CLEAN],
+    worker_stage=WORKER_STAGE,
+    near_duplicates=[NEAR_DUPLICATE_SIZE > 0, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_MIN_LENGTH]
+)
+verdict_cache = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL, FINGERPRINT)
+near_duplicates = NearDuplicateIndex(
+    NEAR_DUPLICATE_SIZE, NEAR_DUPLICATE_TTL, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_MIN_LENGTH,
+    NEAR_DUPLICATE_RATE_WINDOW, NEAR_DUPLICATE_TOP_CLUSTERS, FINGERPRINT
+)
+scanner = HeuristicScanner(all_scripts=MIXED_SCRIPT_ALL_SCRIPTS)
+
+WINDOW_REDUCERS = {
+    "max": lambda rows: rows.max(axis=0),
+    "mean": lambda rows: rows.mean(axis=0),
+}
+if CLASSIFIER_WINDOW_REDUCER not in WINDOW_REDUCERS:
+    raise ValueError(f"Unknown CLASSIFIER_WINDOW_REDUCER: {CLASSIFIER_WINDOW_REDUCER}")
+
+
+def _select_windows(windows: List[int]) -> List[int]:
+    """Caps a text's windows at CLASSIFIER_MAX_WINDOWS, keeping its beginning and its end."""
+    if len(windows) <= CLASSIFIER_MAX_WINDOWS:
+        return windows
+    head = CLASSIFIER_MAX_WINDOWS // 2
+    return windows[:head] + windows[len(windows) - (CLASSIFIER_MAX_WINDOWS - head):]
+
+
+def classification_scores(
+    texts: List[str],
+    hf_tokenizer,
+    hf_classifier_model,
+    device: str,
+    selected_keys: set
+) -> List[Dict[str, float]]:
+    """
+    Returns classification scores for a batch of texts using a Hugging Face multi-label model.
+
+    Texts longer than CLASSIFIER_MAX_LENGTH tokens are split into windows
+    overlapping by CLASSIFIER_WINDOW_STRIDE tokens. The windows of all texts
+    are sorted by length and classified in batches padded only to their own
+    longest window, then each text gets the reduced (max by default) score
+    of its windows.
+
+    Args:
+        texts: Input texts to classify.
+        hf_tokenizer: HF tokenizer.
+        hf_classifier_model: HF multi-label classification model.
+        device: 'cpu' or 'cuda'.
+        selected_keys: Optional subset of labels to include in output.
+
+    Returns:
+        List of dictionaries mapping labels to probabilities (0–1), one per text.
+    """
+    if selected_keys is None:
+        selected_keys = KEYS
+    if not texts:
+        return []
+
+    try:
+        start = time.perf_counter()
+        encoded = hf_tokenizer(
+            texts,
+            truncation=True,
+            max_length=CLASSIFIER_MAX_LENGTH,
+            stride=CLASSIFIER_WINDOW_STRIDE,
+            return_overflowing_tokens=True,
+            padding=False
+        )
+        owners = encoded.pop("overflow_to_sample_mapping")
+        features = {key: encoded[key] for key in ("input_ids", "attention_mask", "token_type_ids") if key in encoded}
+
+        windows_of = [[] for _ in texts]
+        for window, owner in enumerate(owners):
+            windows_of[owner].append(window)
+        selected = [window for windows in windows_of for window in _select_windows(windows)]
+        selected.sort(key=lambda window: len(features["input_ids"][window]))
+        STAGE_DURATION.labels(stage="classifier_tokenize").observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        probs = {}
+        real_tokens = padded_tokens = 0
+        for offset in range(0, len(selected), CLASSIFIER_BATCH_SIZE):
+            chunk = selected[offset:offset + CLASSIFIER_BATCH_SIZE]
+            inputs = hf_tokenizer.pad(
+                {key: [values[window] for window in chunk] for key, values in features.items()},
+                padding=True,
+                return_tensors="pt"
+            ).to(device)
+            real_tokens += sum(len(features["input_ids"][window]) for window in chunk)
+            padded_tokens += inputs["input_ids"].numel()
+
+            with torch.no_grad():
+                outputs = hf_classifier_model(**inputs)
+
+            # Multi-label: sigmoid activation
+            for window, row in zip(chunk, torch.sigmoid(outputs.logits).float().cpu().numpy()):
+                probs[window] = row
+
+        STAGE_DURATION.labels(stage="classifier_forward").observe(time.perf_counter() - start)
+        CLASSIFIER_WINDOWS_COUNTER.inc(len(selected))
+        CLASSIFIER_TOKENS_COUNTER.labels(kind="real").inc(real_tokens)
+        CLASSIFIER_TOKENS_COUNTER.labels(kind="padding").inc(padded_tokens - real_tokens)
+        logger.debug("Classified %d texts as %d windows, %d padding tokens out of %d",
+                     len(texts), len(selected), padded_tokens - real_tokens, padded_tokens)
+
+        reduce = WINDOW_REDUCERS[CLASSIFIER_WINDOW_REDUCER]
+        labels = hf_classifier_model.config.id2label
+        results = []
+        for windows in windows_of:
+            row = reduce(np.stack([probs[window] for window in _select_windows(windows)]))
+            full_scores = {labels[i]: float(row[i]) for i in range(len(row))}
+            results.append(
+                {k: float(f"{full_scores[k]:.6f}") for k in selected_keys if k in full_scores}
+            )
+        return results
+
+    except Exception as e:
+        logger.exception("Classification error: %s", e)
+        return [{k: 0.0 for k in selected_keys} for _ in texts]
+
 
 def classification_score(
     text: str,
@@ -34,43 +195,49 @@ def classification_score(
     Returns:
         Dictionary mapping labels to probabilities (0–1).
     """
-    if selected_keys is None:
-        selected_keys = KEYS
+    return classification_scores(
+        [text], hf_tokenizer, hf_classifier_model, device, selected_keys
+    )[0]
 
-    try:
-        inputs = tokenizer(
-            text,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=128
-        ).to(device)
 
-        with torch.no_grad():
-            outputs = classifier_model(**inputs)
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Normalized embeddings of a batch of texts. Texts already encoded in the
+    current is_safe_batch call (conversation turns) are not encoded again.
+    """
+    missing = [text for text in dict.fromkeys(texts) if text not in _batch_vectors]
+    encoded = {}
+    if missing:
+        start = time.perf_counter()
+        encoded = dict(zip(missing, semantic_model.encode(missing, normalize_embeddings=True)))
+        STAGE_DURATION.labels(stage="semantic_encode").observe(time.perf_counter() - start)
+    return np.asarray([_batch_vectors.get(text, encoded.get(text)) for text in texts], dtype=np.float32)
 
-        # Multi-label: sigmoid activation
-        probs = torch.sigmoid(outputs.logits)[0]
-        labels = classifier_model.config.id2label
 
-        full_scores = {labels[i]: float(probs[i].item()) for i in range(len(probs))}
-        filtered_scores = {k: float(f"{full_scores[k]:.6f}") for k in selected_keys if k in full_scores}
+def search_scores(vectors: np.ndarray) -> List[float]:
+    """Mean similarity of each vector to its 5 nearest toxic examples."""
+    start = time.perf_counter()
+    _, distances = semantic_index.search_batched(vectors, final_num_neighbors=5)
+    STAGE_DURATION.labels(stage="semantic_search").observe(time.perf_counter() - start)
+    return [float(np.mean(row)) for row in distances]
 
-        return filtered_scores
 
+def semantic_scores(texts: List[str]) -> List[Dict[str, float]]:
+    """
+    Encodes a batch of texts at once and returns, for each one, the mean
+    similarity to its 5 nearest toxic examples in the semantic index.
+    """
+    if not texts:
+        return []
+    try:
+        return [{ "score": score } for score in search_scores(encode_texts(texts))]
     except Exception as e:
-        logger.exception("Classification error: %s", e)
-        return {k: 0.0 for k in selected_keys}
+        logger.exception("Semantic search error: %s", e)
+        return [{ "score": 0.0 } for _ in texts]
 
 
 def semantic_score(text: str) -> Dict[str, float]:
-    try:
-        vec = semantic_model.encode([text], normalize_embeddings=True)
-        D, _ = semantic_index.search(vec, k=5)
-        return { "score": float(np.mean(D[0])) }
-    except Exception as e:
-        logger.exception("Semantic search error: %s", e)
-        return { "score": 0.0 }
+    return semantic_scores([text])[0]
 
 
 def is_recurrent(text: str) -> bool:
@@ -78,98 +245,346 @@ def is_recurrent(text: str) -> bool:
     for test purposes we won't allow text
     where single word appears more that 20% of the time
     """
-    max_repetition_ratio = 0.2
-    words = text.lower().split()
-    if not words:
-        return False
-    word_counts = Counter(words)
-    _, freq = word_counts.most_common(1)[0]
-    ratio = freq / len(words)
-    if ratio > max_repetition_ratio:
-        return True
-    return False
+    return scanner.scan(text).recurrent
 
 def character_anomalies(text: str) -> float:
     """
-    Returns a single anomaly score (0–1) based on character-level irregularities.
+    Returns a single anomaly score (0–1) based on character-level irregularities:
+    punctuation, caps and symbol ratios, 4+ repeated characters and control characters.
     Higher values mean more anomalous content.
     """
-    length = len(text) or 1
-
-    punctuation_ratio = sum(c in "!?." for c in text) / length
-    caps_ratio = sum(c.isupper() for c in text) / length
-    repeat_chars = 1.0 if re.search(r"(.)\1{3,}", text) else 0.0
-    non_printable = 1.0 if any(unicodedata.category(c).startswith("C") for c in text) else 0.0
-    symbol_ratio = sum(not c.isalnum() and not c.isspace() for c in text) / length
-
-    # Weighted aggregation
-    score = (
-        0.2 * punctuation_ratio +
-        0.2 * caps_ratio +
-        0.2 * symbol_ratio +
-        0.2 * repeat_chars +
-        0.2 * non_printable
-    )
-
-    return min(score, 1.0)
+    return scanner.scan(text).anomaly
 
 def mixed_script_ratio(text: str) -> float:
     """
     Returns the ratio of tokens containing mixed scripts (e.g., Latin + Cyrillic).
     Higher values indicate more mixed-script content.
     """
-    if not text:
-        return 0.0
+    return scanner.scan(text).mixed_script
 
-    def script_of_char(c):
-        if 'LATIN' in unicodedata.name(c, ''):
-            return 'LATIN'
-        if 'CYRILLIC' in unicodedata.name(c, ''):
-            return 'CYRILLIC'
-        return 'OTHER'
 
-    tokens = text.split()
-    mixed_count = 0
+def is_safe_batch(
+    texts: List[str],
+    timings: Optional[Dict[str, float]] = None,
+    deadlines: Optional[List[Optional[float]]] = None,
+    sessions: Optional[List[Optional[dict]]] = None
+) -> List[Optional[Dict[str, float]]]:
+    """
+    Returns overall safety status for each input text combining classification,
+    semantic similarity, and repetition checks. Model-based checks run once
+    over the batch of texts that are neither in the verdict cache nor near
+    duplicates of a recently blocked text.
+    When given, `timings` accumulates the seconds spent in each stage, and
+    `deadlines` holds an epoch deadline per text (or None): a text whose
+    deadline passes before a stage is dropped and its result is None.
+    `sessions` holds the conversation state sent with each text (or None);
+    those texts are also judged on their conversation, see _apply_sessions.
+    """
+    if not LOAD_SEMANTIC:
+        # Session checks need turn embeddings; with stage pools the app sends sessions to the semantic pool.
+        sessions = None
+    turns = [text for text, session in zip(texts, sessions or []) if session is not None]
+    try:
+        if turns:
+            # Session checks need the embedding of every turn; the semantic check reuses it.
+            try:
+                _batch_vectors.update(zip(turns, encode_texts(turns)))
+            except Exception as e:
+                logger.exception("Failed to encode conversation turns: %s", e)
+        results = _verdicts(texts, timings, deadlines)
+        if turns:
+            start = time.perf_counter()
+            _apply_sessions(texts, results, sessions)
+            _record_timing(timings, "session", start)
+    finally:
+        _batch_vectors.clear()
+    return results
 
-    for token in tokens:
-        scripts = set(script_of_char(c) for c in token if c.isalpha())
-        if len(scripts) > 1:
-            mixed_count += 1
 
-    return mixed_count / max(len(tokens), 1)
+def _verdicts(
+    texts: List[str],
+    timings: Optional[Dict[str, float]] = None,
+    deadlines: Optional[List[Optional[float]]] = None
+) -> List[Optional[Dict[str, float]]]:
+    results = [verdict_cache.get(text) for text in texts]
+    missing = [i for i, result in enumerate(results) if result is None]
+    signatures = {}
+    if missing and near_duplicates.enabled:
+        start = time.perf_counter()
+        for i in missing:
+            signatures[i] = near_duplicates.signature(texts[i])
+            result = near_duplicates.match(signatures[i])
+            if result is not None:
+                result.update(skipped=list(WORKER_CASCADE), fingerprint=FINGERPRINT)
+                for stage in WORKER_CASCADE:
+                    STAGE_SKIPPED_COUNTER.labels(stage=stage).inc()
+                results[i] = result
+        _record_timing(timings, "near_duplicate", start)
+        missing = [i for i in missing if results[i] is None]
+    if missing:
+        missing_deadlines = [deadlines[i] for i in missing] if deadlines else None
+        for i, result in zip(missing, _compute_verdicts([texts[i] for i in missing], timings, missing_deadlines)):
+            if result is not None:
+                verdict_cache.put(texts[i], result)
+                if not result["status"]:
+                    near_duplicates.add(signatures.get(i), texts[i], result)
+            results[i] = result
+    near_duplicates.export_metrics()
+    return results
 
 
-def is_safe(text: str) -> Dict[str, float]:
+def _apply_sessions(texts: List[str], results: List[Optional[Dict]], sessions: List[Optional[dict]]):
     """
-    Returns overall safety status for the input text combining classification,
-    semantic similarity, and repetition checks.
+    Folds each conversation turn into its session state and blocks turns that
+    pass on their own but not as part of the conversation. Only the new turn
+    is scanned and encoded; earlier turns are represented by the state, so a
+    turn costs the same however long the conversation is. Results gain
+    `session_result` and the updated `session` to send back to the app.
     """
-    classification = classification_score(
-        text,
+    rows = [i for i, session in enumerate(sessions) if session is not None and results[i] is not None]
+    if not rows:
+        return
+    try:
+        vectors = encode_texts([texts[i] for i in rows])
+        heuristics = scanner.scan_batch([texts[i] for i in rows])
+        states, contexts = [], {}
+        for k, (i, vector, score) in enumerate(zip(rows, vectors, heuristics)):
+            state = SessionState.from_dict(sessions[i], vectors.shape[1])
+            context = state.context(vector)
+            if context is not None:
+                contexts[k] = context
+            repeats = state.add_turn(
+                texts[i], score.anomaly, vector, SESSION_MAX_TURNS, SESSION_MAX_WORDS, SESSION_ANOMALY_ALPHA
+            )
+            states.append((i, state, repeats))
+        context_scores = dict(zip(contexts, search_scores(np.asarray(list(contexts.values()))))) if contexts else {}
+    except Exception as e:
+        # The turn keeps its own verdict and the app keeps the previous state.
+        logger.exception("Session checks failed: %s", e)
+        return
+
+    for k, (i, state, repeats) in enumerate(states):
+        result = results[i]
+        repetition = state.repetition_ratio()
+        semantic = context_scores.get(k, 0.0)
+        signals = {
+            "recurrent": state.total_words >= SESSION_MIN_WORDS and repetition > scanner.max_repetition_ratio,
+            "repeated": repeats >= SESSION_MAX_REPEATS,
+            # On the first turn the running score is the turn's own, which the anomaly check already judged.
+            "anomaly": state.turns > 1 and state.anomaly > SESSION_ANOMALY_THRESHOLD,
+            "semantic": semantic >= SEMANTIC_THRESHOLD,
+        }
+        if result["status"] and any(signals.values()):
+            result["status"] = False
+            for signal, blocked in signals.items():
+                if blocked:
+                    SESSION_BLOCKED_COUNTER.labels(signal=signal).inc()
+        result["session_result"] = {
+            "turns": state.turns,
+            "repetition": repetition,
+            "repeats": repeats,
+            "anomaly": state.anomaly,
+            "semantic": semantic,
+        }
+        result["session"] = state.to_dict()
+
+
+def _classify(texts: List[str], _) -> List[Dict[str, float]]:
+    non_empty = [text for text in texts if text]
+    classified = iter(classification_scores(
+        non_empty,
         hf_tokenizer=tokenizer,
         hf_classifier_model=classifier_model,
         device=DEVICE,
-        selected_keys={"toxic", "severe_toxic", "obscene", "insult"}
-    ) if text else {}
-    semantic = semantic_score(text)
-    recurrent = is_recurrent(text)
-    anomalies = character_anomalies(text)
-    mixed_text = mixed_script_ratio(text)
-    toxic_flag = any(classification.get(label, 0) > 0.5 for label in KEYS)
-
-    status = not (
-        toxic_flag
-        or semantic["score"] >= 0.45
-        or recurrent 
-        or anomalies > 0.4
-        or mixed_text > 0.35
-    )
-
-    return {
-        "status": status,
-        "classification_result": classification,
-        "semantic_result": semantic["score"],
-        "is_recurrent_result": recurrent,
-        "anomaly_result": anomalies,
-        "mixed_language_result": mixed_text
-    }
+        selected_keys=SELECTED_KEYS
+    ))
+    return [next(classified) if text else {} for text in texts]
+
+
+def _classifier_blocks(classification: Dict[str, float]) -> bool:
+    top = max((classification.get(label, 0) for label in KEYS), default=0)
+    return top > CLASSIFIER_THRESHOLD or top >= CLASSIFIER_CONFIDENT_TOXIC
+
+
+# stage -> (batch check over (texts, heuristic scores), result field, default when skipped, blocking rule)
+STAGES = {
+    "recurrent": (
+        lambda _, scores: [score.recurrent for score in scores],
+        "is_recurrent_result", False, bool
+    ),
+    "mixed_script": (
+        lambda _, scores: [score.mixed_script for score in scores],
+        "mixed_language_result", 0.0, lambda value: value > MIXED_SCRIPT_THRESHOLD
+    ),
+    "anomaly": (
+        lambda _, scores: [score.anomaly for score in scores],
+        "anomaly_result", 0.0, lambda value: value > ANOMALY_THRESHOLD
+    ),
+    "classifier": (
+        _classify,
+        "classification_result", {}, _classifier_blocks
+    ),
+    "semantic": (
+        lambda texts, _: [result["score"] for result in semantic_scores(texts)],
+        "semantic_result", 0.0, lambda value: value >= SEMANTIC_THRESHOLD
+    ),
+}
+HEURISTIC_STAGES = {"recurrent", "mixed_script", "anomaly"}
+
+_unknown_stages = set(CASCADE_ORDER) - STAGES.keys()
+if _unknown_stages:
+    raise ValueError(f"Unknown stages in CASCADE_ORDER: {sorted(_unknown_stages)}")
+
+
+def _record_timing(timings: Optional[Dict[str, float]], stage: str, start: float):
+    elapsed = time.perf_counter() - start
+    STAGE_DURATION.labels(stage=stage).observe(elapsed)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def _expire(deadlines: Optional[List[Optional[float]]], expired: set, stage: str):
+    """Adds the texts whose deadline has passed to `expired`, counting them against `stage`."""
+    if not deadlines:
+        return
+    now = time.time()
+    for i, deadline in enumerate(deadlines):
+        if deadline is not None and i not in expired and now >= deadline:
+            expired.add(i)
+            EXPIRED_COUNTER.labels(stage=stage).inc()
+
+
+def _compute_verdicts(
+    texts: List[str],
+    timings: Optional[Dict[str, float]] = None,
+    deadlines: Optional[List[Optional[float]]] = None
+) -> List[Optional[Dict[str, float]]]:
+    """
+    Runs the checks in CASCADE_ORDER over the batch; a worker of a stage pool
+    only runs the checks of its pool (WORKER_CASCADE). With short-circuiting on,
+    each check only sees the texts no earlier check has blocked, and texts the
+    classifier is confidently clean on skip the semantic check. Texts whose
+    deadline passes are dropped before the next check and get None.
+    """
+    results = [
+        {"status": True, **{field: default for _, field, default, _ in STAGES.values()}}
+        for _ in texts
+    ]
+    ran = [set() for _ in texts]
+    skip_semantic = set()
+    expired = set()
+    # One vectorized pass computes every heuristic feature of the batch.
+    start = time.perf_counter()
+    scores = scanner.scan_batch(texts) if HEURISTIC_STAGES & set(WORKER_CASCADE) else [None] * len(texts)
+    _record_timing(timings, "heuristics", start)
+
+    for stage in WORKER_CASCADE:
+        check, field, _, blocks = STAGES[stage]
+        _expire(deadlines, expired, stage)
+        active = [
+            i for i in range(len(texts))
+            if i not in expired and (
+                not CASCADE_SHORT_CIRCUIT
+                or (results[i]["status"] and not (stage == "semantic" and i in skip_semantic))
+            )
+        ]
+        if not active:
+            continue
+
+        start = time.perf_counter()
+        values = check([texts[i] for i in active], [scores[i] for i in active])
+        _record_timing(timings, stage, start)
+        for i, value in zip(active, values):
+            results[i][field] = value
+            ran[i].add(stage)
+            if blocks(value):
+                results[i]["status"] = False
+            elif stage == "classifier" and max(value.values(), default=0) <= CLASSIFIER_CONFIDENT_CLEAN:
+                skip_semantic.add(i)
+
+    for i, (result, stages_ran) in enumerate(zip(results, ran)):
+        if i in expired:
+            results[i] = None
+            continue
+        result["skipped"] = [stage for stage in WORKER_CASCADE if stage not in stages_ran]
+        result["fingerprint"] = FINGERPRINT
+        for stage in result["skipped"]:
+            STAGE_SKIPPED_COUNTER.labels(stage=stage).inc()
+    return results
+
+
+def is_safe(text: str) -> Dict[str, float]:
+    """
+    Returns overall safety status for the input text combining classification,
+    semantic similarity, and repetition checks.
+    """
+    return is_safe_batch([text])[0]
+
+
+def init_models(prepared: bool = False):
+    """
+    Loads the classifier and the semantic model with its index concurrently;
+    both spend most of their time in file I/O and native code. A worker of a
+    stage pool only loads the models of its own checks. With `prepared`, the
+    semantic index artifact is current and is loaded without encoding
+    anything. Safe to call more than once.
+    """
+    global semantic_model, semantic_index, tokenizer, classifier_model, _models_loaded
+    if _models_loaded:
+        return
+    with startup_phase("models"), ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-init") as pool:
+        semantic = pool.submit(init_semantic_model, prepared) if LOAD_SEMANTIC else None
+        classifier = pool.submit(init_classifier_model) if LOAD_CLASSIFIER else None
+        if semantic is not None:
+            semantic_model, semantic_index = semantic.result()
+        if classifier is not None:
+            tokenizer, classifier_model = classifier.result()
+    _models_loaded = True
+    _refresh_fingerprint()
+
+
+def _refresh_fingerprint():
+    global FINGERPRINT
+    version = semantic_index.version if semantic_index is not None else 0
+    FINGERPRINT = make_fingerprint(base=BASE_FINGERPRINT, examples=version) if version else BASE_FINGERPRINT
+    verdict_cache.set_fingerprint(FINGERPRINT)
+    near_duplicates.set_fingerprint(FINGERPRINT)
+
+
+def add_examples(example_id: str, texts: List[str]) -> bool:
+    """
+    Embeds new toxic examples and adds them to the semantic index; verdicts
+    cached and near-duplicates remembered before are dropped. Returns False for an id that was already added,
+    or on a worker without a semantic index.
+    """
+    texts = [text for text in texts if text]
+    if semantic_index is None or not texts or example_id in semantic_index.example_ids:
+        return False
+    semantic_index.add(example_id, encode_examples(semantic_model, texts))
+    if SEMANTIC_EXAMPLES_FILE:
+        ExampleStore(SEMANTIC_EXAMPLES_FILE).append(example_id, texts)
+    _refresh_fingerprint()
+    return True
+
+
+def warm_up(lengths: List[int] = WARMUP_LENGTHS, batch_sizes: List[int] = WARMUP_BATCH_SIZES):
+    """
+    Runs every check once per (text length, batch size) pair so lazy kernel
+    initialization and allocator growth happen before real traffic. It calls
+    the checks directly: the verdict cache stays empty and no check is
+    short-circuited away.
+    """
+    words = "the quick brown fox jumps over a lazy dog while warm up text keeps going".split()
+    with startup_phase("warmup"):
+        for batch_size in batch_sizes:
+            for length in lengths:
+                texts = [
+                    " ".join(words[(i + j) % len(words)] for j in range(length))
+                    for i in range(batch_size)
+                ]
+                scanner.scan_batch(texts)
+                if LOAD_CLASSIFIER:
+                    _classify(texts, None)
+                if LOAD_SEMANTIC:
+                    semantic_scores(texts)
+
@@ -0,0 +1,277 @@
+import unicodedata
+from array import array
+from threading import Lock
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+# Per-codepoint flag bits.
+PUNCT = 1       # one of "!?."
+UPPER = 2       # str.isupper()
+ALNUM = 4       # str.isalnum()
+SPACE = 8       # str.isspace(), the separator used by str.split()
+CONTROL = 16    # general category C* (control, format, surrogate, private use, unassigned)
+ALPHA = 32      # str.isalpha(), the characters mixed_script_ratio looks at
+
+BLOCK_BITS = 8
+BLOCK_SIZE = 1 << BLOCK_BITS
+MAX_CODEPOINT = 0x110000
+
+# First words of character names that describe a style rather than a script.
+COMMON_PREFIXES = {
+    "MATHEMATICAL", "MODIFIER", "CIRCLED", "PARENTHESIZED", "SQUARED", "NEGATIVE",
+    "SUPERSCRIPT", "SUBSCRIPT", "COMBINING", "TAG", "REGIONAL", "DOUBLE-STRUCK",
+}
+# Scripts whose names take two words.
+TWO_WORD_PREFIXES = {"OLD", "LINEAR", "NEW", "TAI", "INSCRIPTIONAL", "CAUCASIAN", "MEETEI", "ZANABAZAR"}
+# Scripts that are routinely written together in one word.
+SCRIPT_ALIASES = {
+    "HIRAGANA": "CJK", "KATAKANA": "CJK", "HANGUL": "CJK", "BOPOMOFO": "CJK", "IDEOGRAPHIC": "CJK",
+}
+
+
+class HeuristicScores(NamedTuple):
+    recurrent: bool
+    anomaly: float
+    mixed_script: float
+
+
+class CodepointTable:
+    """
+    Codepoint -> (flags, script) lookup, filled lazily one 256-codepoint block
+    at a time so only the blocks that actually occur are ever computed.
+
+    Scripts are derived from Unicode character names. Latin and Cyrillic are
+    matched anywhere in the name, exactly as the original per-character check
+    did; other scripts take the name's leading word(s).
+    """
+
+    def __init__(self):
+        self.flags = bytearray(MAX_CODEPOINT)
+        self.scripts = array("H", bytes(2 * MAX_CODEPOINT))
+        self.built = bytearray(MAX_CODEPOINT >> BLOCK_BITS)
+        self.script_names = ["", "OTHER", "LATIN", "CYRILLIC"]
+        self._script_ids = {name: i for i, name in enumerate(self.script_names)}
+        self._lock = Lock()
+        self.flags_np = np.frombuffer(self.flags, dtype=np.uint8)
+        self.scripts_np = np.frombuffer(self.scripts, dtype=np.uint16)
+
+    def script_id(self, name: str) -> int:
+        script = self._script_ids.get(name)
+        if script is None:
+            script = self._script_ids[name] = len(self.script_names)
+            self.script_names.append(name)
+        return script
+
+    @staticmethod
+    def script_of(ch: str) -> str:
+        name = unicodedata.name(ch, "")
+        if "LATIN" in name:
+            return "LATIN"
+        if "CYRILLIC" in name:
+            return "CYRILLIC"
+        words = name.split()
+        if not words or words[0] in COMMON_PREFIXES:
+            return "OTHER"
+        script = " ".join(words[:2]) if words[0] in TWO_WORD_PREFIXES else words[0]
+        return SCRIPT_ALIASES.get(script, script)
+
+    def build_block(self, block: int):
+        with self._lock:
+            if self.built[block]:
+                return
+            for cp in range(block << BLOCK_BITS, (block + 1) << BLOCK_BITS):
+                ch = chr(cp)
+                f = 0
+                if ch in "!?.":
+                    f |= PUNCT
+                if ch.isupper():
+                    f |= UPPER
+                if ch.isalnum():
+                    f |= ALNUM
+                if ch.isspace():
+                    f |= SPACE
+                if unicodedata.category(ch).startswith("C"):
+                    f |= CONTROL
+                if ch.isalpha():
+                    f |= ALPHA
+                    self.scripts[cp] = self.script_id(self.script_of(ch))
+                self.flags[cp] = f
+            self.built[block] = 1
+
+    def ensure(self, codepoints: np.ndarray):
+        for block in np.unique(codepoints >> BLOCK_BITS):
+            if not self.built[block]:
+                self.build_block(int(block))
+
+
+table = CodepointTable()
+
+
+class HeuristicScanner:
+    """
+    Computes the repetition, character-anomaly and mixed-script scores of a
+    text in one pass over its characters.
+
+    With all_scripts=False every script other than Latin and Cyrillic counts
+    as one group, which reproduces the original mixed_script_ratio exactly;
+    with all_scripts=True any two distinct scripts in a token count as mixed.
+    """
+
+    def __init__(self, max_repetition_ratio: float = 0.2, all_scripts: bool = False):
+        self.max_repetition_ratio = max_repetition_ratio
+        self.all_scripts = all_scripts
+
+    def _group(self, script: int) -> int:
+        # Script ids 2 and 3 are LATIN and CYRILLIC, everything else folds into OTHER (1).
+        if self.all_scripts or script in (2, 3):
+            return script
+        return 1
+
+    def scan(self, text: str) -> HeuristicScores:
+        flags, scripts, built = table.flags, table.scripts, table.built
+        punct = upper = symbol = 0
+        control = repeat = False
+        prev, run = None, 0
+
+        counts: Dict[str, int] = {}
+        tokens = mixed = 0
+        start = -1
+        token_script, token_mixed = 0, False
+
+        for i, ch in enumerate(text):
+            cp = ord(ch)
+            if not built[cp >> BLOCK_BITS]:
+                table.build_block(cp >> BLOCK_BITS)
+            f = flags[cp]
+
+            if f & PUNCT:
+                punct += 1
+            if f & UPPER:
+                upper += 1
+            if not f & (ALNUM | SPACE):
+                symbol += 1
+            if f & CONTROL:
+                control = True
+
+            # Same as re.search(r"(.)\1{3,}"): four equal characters in a row, "." never matching "\n".
+            if ch == prev:
+                run += 1
+                if run >= 4 and ch != "\n":
+                    repeat = True
+            else:
+                prev, run = ch, 1
+
+            if f & SPACE:
+                if start >= 0:
+                    word = text[start:i].lower()
+                    counts[word] = counts.get(word, 0) + 1
+                    tokens += 1
+                    mixed += token_mixed
+                    start = -1
+            else:
+                if start < 0:
+                    start, token_script, token_mixed = i, 0, False
+                if f & ALPHA:
+                    group = self._group(scripts[cp])
+                    if not token_script:
+                        token_script = group
+                    elif group != token_script:
+                        token_mixed = True
+
+        if start >= 0:
+            word = text[start:].lower()
+            counts[word] = counts.get(word, 0) + 1
+            tokens += 1
+            mixed += token_mixed
+
+        length = len(text) or 1
+        anomaly = (
+            0.2 * (punct / length) +
+            0.2 * (upper / length) +
+            0.2 * (symbol / length) +
+            0.2 * (1.0 if repeat else 0.0) +
+            0.2 * (1.0 if control else 0.0)
+        )
+        recurrent = bool(tokens) and max(counts.values()) / tokens > self.max_repetition_ratio
+        mixed_ratio = mixed / max(tokens, 1) if text else 0.0
+
+        return HeuristicScores(recurrent, min(anomaly, 1.0), mixed_ratio)
+
+    def scan_batch(self, texts: List[str]) -> List[HeuristicScores]:
+        """
+        Vectorized path for a batch: all character-level features are computed
+        with NumPy over the concatenated codepoints of every text. Only word
+        counting for the repetition check stays per text.
+        """
+        if not texts:
+            return []
+
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        n = int(lengths.sum())
+        cps = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        table.ensure(cps)
+
+        bounds = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=bounds[1:])
+        owner = np.repeat(np.arange(len(texts)), lengths)
+
+        def per_text(mask: np.ndarray) -> np.ndarray:
+            totals = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(mask, out=totals[1:])
+            return totals[bounds[1:]] - totals[bounds[:-1]]
+
+        f = table.flags_np[cps]
+        punct = per_text((f & PUNCT) != 0)
+        upper = per_text((f & UPPER) != 0)
+        symbol = per_text((f & (ALNUM | SPACE)) == 0)
+        control = per_text((f & CONTROL) != 0) > 0
+
+        repeat = np.zeros(len(texts), dtype=bool)
+        if n >= 4:
+            same = cps[1:] == cps[:-1]
+            run4 = same[:-2] & same[1:-1] & same[2:] & (cps[:-3] != 10) & (owner[:-3] == owner[3:])
+            repeat[np.unique(owner[:-3][run4])] = True
+
+        safe_lengths = np.maximum(lengths, 1)
+        anomaly = (
+            0.2 * (punct / safe_lengths) +
+            0.2 * (upper / safe_lengths) +
+            0.2 * (symbol / safe_lengths) +
+            0.2 * repeat.astype(np.float64) +
+            0.2 * control.astype(np.float64)
+        )
+        anomaly = np.minimum(anomaly, 1.0)
+
+        # Tokens are maximal runs of non-space characters; a text boundary always starts a new one.
+        space = (f & SPACE) != 0
+        starts = ~space
+        if n:
+            starts[1:] &= space[:-1] | (owner[1:] != owner[:-1])
+        token_ids = np.cumsum(starts) - 1
+        tokens = np.bincount(owner[starts], minlength=len(texts))
+
+        alpha = (f & ALPHA) != 0
+        groups = table.scripts_np[cps[alpha]].astype(np.int64)
+        if not self.all_scripts:
+            groups = np.where((groups == 2) | (groups == 3), groups, 1)
+        mixed = np.zeros(len(texts), dtype=np.int64)
+        if groups.size:
+            alpha_tokens = token_ids[alpha]
+            _, first = np.unique(alpha_tokens, return_index=True)
+            is_mixed = np.minimum.reduceat(groups, first) != np.maximum.reduceat(groups, first)
+            mixed = np.bincount(owner[alpha][first][is_mixed], minlength=len(texts))
+        mixed_ratio = np.where(lengths > 0, mixed / np.maximum(tokens, 1), 0.0)
+
+        results = []
+        for i, text in enumerate(texts):
+            words = text.lower().split()
+            if words:
+                counts: Dict[str, int] = {}
+                for word in words:
+                    counts[word] = counts.get(word, 0) + 1
+                recurrent = max(counts.values()) / len(words) > self.max_repetition_ratio
+            else:
+                recurrent = False
+            results.append(HeuristicScores(recurrent, float(anomaly[i]), float(mixed_ratio[i])))
+        return results
@@ -1,66 +1,486 @@
+import fcntl
+import json
 import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, Tuple
 import numpy as np
 import torch
-import scann
 
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
-from src.utils.config import DEVICE, HF_MODEL, HF_TOKEN, SEMANTIC_MODEL
-from src.utils.data import load_toxic_texts
+from src.core.ann import get_backend
+from src.core.cache import make_fingerprint
+from src.core.semantic_index import ExampleStore, SemanticIndex
+from src.utils.config import (
+    DEVICE, HF_MODEL, HF_TOKEN, SEMANTIC_MODEL, DATA_PATH, INDEX_DIR,
+    INFERENCE_BACKEND, ONNX_DIR, ONNX_QUANTIZATION, SEMANTIC_DELTA_COMPACT_THRESHOLD, SEMANTIC_EXAMPLES_FILE
+)
+from src.utils.data import dataset_fingerprint, load_toxic_texts
+from src.utils.metrics import STARTUP_PHASE_SECONDS
 
 logger = logging.getLogger(__name__)
 
 
-def init_semantic_model():
+# Which examples are indexed; part of the index fingerprint with the ANN backend settings.
+INDEX_PARAMS = {
+    "toxic_threshold": 0.7,
+}
+# Nearest-neighbour backend chosen by ANN_BACKEND; its searcher is saved in a directory named after it.
+SEARCH_BACKEND = get_backend()
+
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+@contextmanager
+def startup_phase(phase: str):
+    """Logs and exports how long one startup phase took."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    STARTUP_PHASE_SECONDS.labels(phase=phase).set(elapsed)
+    logger.info("Startup phase %s took %.2fs", phase, elapsed)
+
+
+def semantic_index_fingerprint(
+    model_name: str = SEMANTIC_MODEL,
+    data_path: str = DATA_PATH,
+    backend: str = INFERENCE_BACKEND
+) -> str:
+    """
+    Identity of the semantic index: dataset contents, embedding model, the
+    inference backend that encodes it and build parameters. Quantized and
+    ONNX encoders embed differently, so the index is built with the same
+    backend that encodes the queries.
+    """
+    return make_fingerprint(
+        dataset=dataset_fingerprint(data_path), model=model_name, backend=backend, params=INDEX_PARAMS,
+        ann=SEARCH_BACKEND.describe()
+    )
+
+
+def build_searcher(vectors: np.ndarray):
+    """Builds the configured searcher over normalized float32 vectors."""
+    return SEARCH_BACKEND.build(vectors)
+
+
+class SemanticArtifact(NamedTuple):
+    """The semantic index as stored in INDEX_DIR."""
+    embeddings: np.ndarray             # memory-mapped vectors behind the searcher
+    searcher: object
+    examples: List[str]                # ids of the added examples compacted into `embeddings`
+    delta: np.ndarray                  # vectors of added examples not compacted yet
+    delta_examples: List[Tuple[str, int]]  # (example id, vector count) of the `delta` rows, in order
+
+
+def _read_manifest(index_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _index_lock(index_dir: str):
+    """Serializes builds and compactions of the artifact across workers."""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_semantic_artifact(index_dir: str, fingerprint: str) -> Optional[SemanticArtifact]:
     """
-    Initializes the semantic model and ScaNN index for similarity search.
-    Returns the SentenceTransformer model and a ScaNN searcher.
+    Returns the artifact in index_dir, or None when it is missing or was built
+    from a different dataset, model or parameters. The embeddings are
+    memory-mapped, not read into memory.
     """
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    manifest = _read_manifest(index_dir)
+    if manifest is None:
+        logger.info("No semantic index artifact in %s", index_dir)
+        return None
+
+    if manifest.get("fingerprint") != fingerprint:
+        logger.info("Semantic index artifact is stale (%s != %s)", manifest.get("fingerprint"), fingerprint)
+        return None
+
     try:
-        model = SentenceTransformer(SEMANTIC_MODEL)
-        texts = load_toxic_texts()
-        vectors = model.encode(
-            texts,
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-            device=device
-        ).astype(np.float32)  # ScaNN requires float32
-
-        # Build ScaNN index
-        searcher = scann.scann_ops_pybind.builder(
-            vectors, 5, "dot_product"  # k=5 nearest neighbors
-        ).tree(
-            num_leaves=200, num_leaves_to_search=10, training_sample_size=min(250000, len(vectors))
-        ).score_ah(
-            2, anisotropic_quantization_threshold=0.2
-        ).build()
-
-        return model, searcher
+        # Artifacts written before compactions were persisted use the fixed names.
+        embeddings = np.load(os.path.join(index_dir, manifest.get("embeddings", EMBEDDINGS_FILE)), mmap_mode="r")
+        searcher = SEARCH_BACKEND.load(os.path.join(index_dir, manifest.get("searcher", SEARCH_BACKEND.name)))
+        if manifest.get("delta"):
+            delta = np.load(os.path.join(index_dir, manifest["delta"]))
+        else:
+            delta = np.empty((0, embeddings.shape[1] if embeddings.ndim == 2 else 0), dtype=np.float32)
+    except Exception as e:
+        logger.warning("Failed to load semantic index artifact from %s: %s", index_dir, e)
+        return None
+    examples = list(manifest.get("examples", []))
+    delta_examples = [(example_id, int(count)) for example_id, count in manifest.get("delta_examples", [])]
+    logger.info("Loaded semantic index artifact with %d vectors and %d added examples from %s",
+                manifest.get("count", 0), len(examples) + len(delta_examples), index_dir)
+    return SemanticArtifact(embeddings, searcher, examples, delta, delta_examples)
+
+
+def _write_artifact(
+    index_dir: str,
+    fingerprint: str,
+    vectors: Optional[np.ndarray],
+    searcher,
+    examples: List[str],
+    delta: np.ndarray,
+    delta_examples: List[Tuple[str, int]]
+) -> SemanticArtifact:
+    """
+    Writes one generation of the artifact. Every generation has files of its
+    own and the manifest is swapped in by an atomic rename, so workers that
+    memory-mapped the previous generation keep reading intact files. With
+    `vectors` None only the delta changes and the current embeddings and
+    searcher are kept. Files of older generations are removed; on Linux a
+    mapped file stays readable until it is unmapped.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    previous = _read_manifest(index_dir) or {}
+    generation = f"{time.time_ns():x}"
+    manifest = {
+        "fingerprint": fingerprint,
+        "model": SEMANTIC_MODEL,
+        "backend": INFERENCE_BACKEND,
+        "params": INDEX_PARAMS,
+        "ann": SEARCH_BACKEND.describe(),
+        "examples": examples,
+        "delta_examples": [[example_id, count] for example_id, count in delta_examples],
+        "delta": None,
+    }
+    if vectors is None:
+        manifest["embeddings"] = previous.get("embeddings", EMBEDDINGS_FILE)
+        manifest["searcher"] = previous.get("searcher", SEARCH_BACKEND.name)
+        for key in ("count", "dim", "built_at"):
+            manifest[key] = previous.get(key)
+    else:
+        manifest["embeddings"] = f"embeddings-{generation}.npy"
+        manifest["searcher"] = f"{SEARCH_BACKEND.name}-{generation}"
+        np.save(os.path.join(index_dir, manifest["embeddings"]), vectors)
+        searcher_dir = os.path.join(index_dir, manifest["searcher"])
+        os.makedirs(searcher_dir)
+        SEARCH_BACKEND.save(searcher, searcher_dir)
+        manifest["count"] = int(len(vectors))
+        manifest["dim"] = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+        manifest["built_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    if len(delta):
+        manifest["delta"] = f"delta-{generation}.npy"
+        np.save(os.path.join(index_dir, manifest["delta"]), delta)
+
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    stale = {previous.get(key) for key in ("embeddings", "searcher", "delta")} - {
+        manifest[key] for key in ("embeddings", "searcher", "delta")
+    }
+    for name in stale - {None}:
+        path = os.path.join(index_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    logger.info("Wrote semantic index artifact to %s", index_dir)
+
+    embeddings = np.load(os.path.join(index_dir, manifest["embeddings"]), mmap_mode="r")
+    if searcher is None:
+        searcher = SEARCH_BACKEND.load(os.path.join(index_dir, manifest["searcher"]))
+    return SemanticArtifact(embeddings, searcher, examples, delta, delta_examples)
+
+
+def build_semantic_artifact(
+    model, index_dir: str, fingerprint: str, data_path: str = DATA_PATH
+) -> SemanticArtifact:
+    """Encodes the toxic examples, builds the searcher and writes both to index_dir."""
+    start = time.time()
+    texts = load_toxic_texts(threshold=INDEX_PARAMS["toxic_threshold"], data_path=data_path)
+    vectors = model.encode(
+        texts,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        device=str(DEVICE)
+    ).astype(np.float32)  # every backend takes float32
+    searcher = build_searcher(vectors)
+    logger.info("Built semantic index over %d vectors in %.1fs", len(vectors), time.time() - start)
+    empty = np.empty((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+    return _write_artifact(index_dir, fingerprint, vectors, searcher, [], empty, [])
+
+
+def load_or_build_semantic_index(model, index_dir: str = INDEX_DIR, force: bool = False) -> SemanticArtifact:
+    """
+    Loads the semantic index artifact when its fingerprint matches and builds
+    it otherwise. A file lock keeps concurrently starting workers from
+    building the same artifact twice.
+    """
+    fingerprint = semantic_index_fingerprint()
+    if not force:
+        artifact = load_semantic_artifact(index_dir, fingerprint)
+        if artifact is not None:
+            return artifact
+
+    with _index_lock(index_dir):
+        if not force:
+            # Another worker may have built it while we were waiting for the lock.
+            artifact = load_semantic_artifact(index_dir, fingerprint)
+            if artifact is not None:
+                return artifact
+        return build_semantic_artifact(model, index_dir, fingerprint)
+
+
+def compact_semantic_artifact(
+    embeddings: np.ndarray,
+    delta: np.ndarray,
+    examples: List[str],
+    index_dir: str = INDEX_DIR
+) -> Tuple[np.ndarray, object]:
+    """
+    Rebuilds the searcher over the main and delta vectors, which hold the
+    added `examples`, and persists the result as the artifact. Every worker
+    of a pool sees the same examples and compacts at the same point, so the
+    first one builds and the others load its artifact. Returns the
+    memory-mapped embeddings and the searcher.
+    """
+    fingerprint = semantic_index_fingerprint()
+    with _index_lock(index_dir):
+        artifact = load_semantic_artifact(index_dir, fingerprint)
+        if artifact is not None and not artifact.delta_examples and sorted(artifact.examples) == sorted(examples):
+            logger.info("Semantic index with these examples was already compacted, loading it")
+            return artifact.embeddings, artifact.searcher
+        vectors = np.concatenate([np.asarray(embeddings, dtype=np.float32), delta])
+        artifact = _write_artifact(
+            index_dir, fingerprint, vectors, build_searcher(vectors), list(examples), delta[:0], []
+        )
+        return artifact.embeddings, artifact.searcher
+
+
+def rebuild_semantic_index(
+    embeddings: np.ndarray, delta: np.ndarray, examples: List[str]
+) -> Tuple[np.ndarray, object]:
+    """Compaction of the SemanticIndex: persisted, unless added examples are kept in memory only."""
+    if not SEMANTIC_EXAMPLES_FILE:
+        vectors = np.concatenate([np.asarray(embeddings, dtype=np.float32), delta])
+        return vectors, build_searcher(vectors)
+    return compact_semantic_artifact(embeddings, delta, examples)
+
+
+def _pending_examples(examples: List[str], delta_examples: List[Tuple[str, int]]) -> List[dict]:
+    """Records of SEMANTIC_EXAMPLES_FILE the artifact does not hold yet."""
+    known = set(examples) | {example_id for example_id, _ in delta_examples}
+    return [record for record in ExampleStore(SEMANTIC_EXAMPLES_FILE).load() if record["id"] not in known]
+
+
+def semantic_index_ready(index_dir: str = INDEX_DIR) -> bool:
+    """Whether the artifact is current and holds every added example, judged from its manifest alone."""
+    manifest = _read_manifest(index_dir)
+    if manifest is None or manifest.get("fingerprint") != semantic_index_fingerprint():
+        return False
+    return not SEMANTIC_EXAMPLES_FILE or not _pending_examples(
+        manifest.get("examples", []), manifest.get("delta_examples", [])
+    )
+
+
+def prepare_semantic_index(model, index_dir: str = INDEX_DIR) -> SemanticArtifact:
+    """
+    Brings the artifact up to date: builds it when missing or stale and adds
+    the examples of SEMANTIC_EXAMPLES_FILE it does not hold yet. Only those
+    are encoded; they are stored as the artifact's delta, which is compacted
+    into the main index once it reaches SEMANTIC_DELTA_COMPACT_THRESHOLD.
+    """
+    artifact = load_or_build_semantic_index(model, index_dir)
+    if not SEMANTIC_EXAMPLES_FILE:
+        return artifact
+
+    if not _pending_examples(artifact.examples, artifact.delta_examples):
+        return artifact
+    with _index_lock(index_dir):
+        fingerprint = semantic_index_fingerprint()
+        artifact = load_semantic_artifact(index_dir, fingerprint) or artifact
+        records = _pending_examples(artifact.examples, artifact.delta_examples)
+        if not records:
+            return artifact
+        start = time.time()
+        encoded = [encode_examples(model, record["texts"]) for record in records]
+        delta = np.concatenate([artifact.delta, *encoded])
+        delta_examples = artifact.delta_examples + [
+            (record["id"], len(vectors)) for record, vectors in zip(records, encoded)
+        ]
+        logger.info("Encoded %d added examples in %.1fs", len(records), time.time() - start)
+        if len(delta) < SEMANTIC_DELTA_COMPACT_THRESHOLD:
+            return _write_artifact(
+                index_dir, fingerprint, None, artifact.searcher, artifact.examples, delta, delta_examples
+            )
+        vectors = np.concatenate([np.asarray(artifact.embeddings, dtype=np.float32), delta])
+        examples = artifact.examples + [example_id for example_id, _ in delta_examples]
+        return _write_artifact(index_dir, fingerprint, vectors, build_searcher(vectors), examples, delta[:0], [])
+
+
+def onnx_dir(kind: str, model_name: str) -> str:
+    """
+    Export directory of one model. Exports only run when the file is missing,
+    so the directory is named after the model and the int8 target: changing
+    either exports afresh instead of reusing the old graph.
+    """
+    return os.path.join(ONNX_DIR, kind, make_fingerprint(model=model_name, quantization=ONNX_QUANTIZATION))
+
+
+CLASSIFIER_ONNX_DIR = onnx_dir("classifier", HF_MODEL)
+SEMANTIC_ONNX_DIR = onnx_dir("semantic", SEMANTIC_MODEL)
+
+
+def _onnx_quantization_config():
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    return getattr(AutoQuantizationConfig, ONNX_QUANTIZATION)(is_static=False, per_channel=False)
+
+
+def classifier_onnx_file(backend: str) -> str:
+    return "model_quantized.onnx" if backend == "onnx-int8" else "model.onnx"
+
+
+def semantic_onnx_file(backend: str) -> str:
+    return f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx" if backend == "onnx-int8" else "onnx/model.onnx"
+
+
+def export_classifier_onnx(
+    model_name: str = HF_MODEL,
+    token: str = HF_TOKEN,
+    output_dir: Optional[str] = None,
+    quantize: bool = True
+):
+    """Exports the classifier to ONNX and, optionally, a dynamically quantized int8 copy next to it."""
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+
+    output_dir = output_dir or onnx_dir("classifier", model_name)
+    logger.info("Exporting classifier %s to ONNX in %s", model_name, output_dir)
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True, token=token)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name, token=token).save_pretrained(output_dir)
+    if quantize:
+        quantizer = ORTQuantizer.from_pretrained(output_dir, file_name="model.onnx")
+        quantizer.quantize(save_dir=output_dir, quantization_config=_onnx_quantization_config())
+
+
+def export_semantic_onnx(model_name: str = SEMANTIC_MODEL, output_dir: Optional[str] = None, quantize: bool = True):
+    """Exports the sentence encoder to ONNX and, optionally, a dynamically quantized int8 copy next to it."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    output_dir = output_dir or onnx_dir("semantic", model_name)
+    logger.info("Exporting semantic model %s to ONNX in %s", model_name, output_dir)
+    model = SentenceTransformer(model_name, backend="onnx")
+    model.save_pretrained(output_dir)
+    if quantize:
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, output_dir)
+
+
+def load_semantic_encoder(backend: str = INFERENCE_BACKEND):
+    """Returns the SentenceTransformer for the selected inference backend."""
+    if backend in ("onnx", "onnx-int8"):
+        file_name = semantic_onnx_file(backend)
+        if not os.path.exists(os.path.join(SEMANTIC_ONNX_DIR, file_name)):
+            export_semantic_onnx(quantize=backend == "onnx-int8")
+        return SentenceTransformer(SEMANTIC_ONNX_DIR, backend="onnx", model_kwargs={"file_name": file_name})
+
+    model = SentenceTransformer(SEMANTIC_MODEL, device=str(DEVICE))
+    if backend == "torch-int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def encode_examples(model, texts):
+    """Normalized float32 embeddings of toxic examples, as stored in the index."""
+    return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+
+def init_semantic_model(prepared: bool = False):
+    """
+    Initializes the semantic model and the index for similarity search: the
+    artifact, including the examples added at runtime so far.
+    With `prepared`, the artifact was already brought up to date (see
+    prepare_semantic_index_in_child) and is only loaded: nothing is encoded.
+    Returns the SentenceTransformer model and a SemanticIndex.
+    """
+    try:
+        with startup_phase("semantic_model"):
+            model = load_semantic_encoder()
+        with startup_phase("semantic_index"):
+            if prepared:
+                artifact = load_semantic_artifact(INDEX_DIR, semantic_index_fingerprint())
+                if artifact is None:
+                    raise RuntimeError(f"No current semantic index artifact in {INDEX_DIR}")
+            else:
+                artifact = prepare_semantic_index(model)
+            index = SemanticIndex(
+                artifact.embeddings, artifact.searcher, rebuild_semantic_index, SEMANTIC_DELTA_COMPACT_THRESHOLD,
+                examples=artifact.examples
+            )
+            offset = 0
+            for example_id, count in artifact.delta_examples:
+                index.add(example_id, artifact.delta[offset:offset + count], compact=False)
+                offset += count
+        return model, index
     except Exception as e:
         logger.exception("Semantic model init failed: %s", e)
         raise
 
-def init_classifier_model(model_name: str = HF_MODEL, token: str = HF_TOKEN):
+def load_classifier_weights(model_name: str, token: str):
+    """
+    Loads the classifier from memory-mapped safetensors, falling back to the
+    pickled weights for checkpoints that do not ship them.
+    """
+    try:
+        return AutoModelForSequenceClassification.from_pretrained(model_name, token=token, use_safetensors=True)
+    except OSError:
+        logger.warning("No safetensors weights for %s, loading the pickled checkpoint", model_name)
+        return AutoModelForSequenceClassification.from_pretrained(model_name, token=token)
+
+
+def init_classifier_model(model_name: str = HF_MODEL, token: str = HF_TOKEN, backend: str = INFERENCE_BACKEND):
     """
     Initializes any Hugging Face sequence classification model and tokenizer.
 
     Args:
         model_name: Hugging Face model name.
         token: Optional authentication token for private HF models.
+        backend: 'torch', 'torch-int8', 'onnx' or 'onnx-int8'.
 
     Returns:
         tokenizer, model
     """
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name, token=token)
-        model = AutoModelForSequenceClassification.from_pretrained(model_name, token=token).to(DEVICE)
-        
-        if torch.cuda.is_available():
-            model = model.half()
-        model.eval()
-        return tokenizer, model
+        with startup_phase("classifier"):
+            if backend in ("onnx", "onnx-int8"):
+                from optimum.onnxruntime import ORTModelForSequenceClassification
+
+                file_name = classifier_onnx_file(backend)
+                export_dir = onnx_dir("classifier", model_name)
+                if not os.path.exists(os.path.join(export_dir, file_name)):
+                    export_classifier_onnx(model_name, token, export_dir, quantize=backend == "onnx-int8")
+                tokenizer = AutoTokenizer.from_pretrained(export_dir)
+                model = ORTModelForSequenceClassification.from_pretrained(export_dir, file_name=file_name)
+                return tokenizer, model
+
+            tokenizer = AutoTokenizer.from_pretrained(model_name, token=token)
+            model = load_classifier_weights(model_name, token).to(DEVICE)
+
+            if backend == "torch-int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif DEVICE.type == "cuda":
+                model = model.half()
+            model.eval()
+            return tokenizer, model
     except Exception as e:
         logger.exception("Classifier model init failed: %s", e)
-        raise
\ No newline at end of file
+        raise
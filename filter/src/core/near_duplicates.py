@@ -0,0 +1,271 @@
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.metrics import NEAR_DUPLICATE_CLUSTERS, NEAR_DUPLICATE_COUNTER, NEAR_DUPLICATE_FLOOD_RATE
+
+logger = logging.getLogger(__name__)
+
+SHINGLE = 4
+NUM_PERM = 128
+# Mersenne prime below the 32-bit shingle hashes: (a * x + b) wraps around it many times, which is
+# what makes the permutations independent. A prime far above a * x would leave every permutation
+# ordered like x itself, all picking the same minimum.
+_PRIME = np.uint64((1 << 31) - 1)
+# Fixed permutations, so every worker process computes the same kind of signature.
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, with punctuation, symbols and whitespace collapsed to single spaces."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    MinHash signature of the set of character 4-grams of a normalized text.
+    The share of equal positions between two signatures estimates the Jaccard
+    similarity of the sets. Shingles are hashed with hash(), so signatures are
+    only comparable within one process, which is all the index needs.
+    Returns None for a text without a single 4-gram once normalized, such as
+    punctuation, symbols or emoji, which would otherwise all look identical.
+    """
+    normalized = normalize(text)
+    if len(normalized) < SHINGLE:
+        return None
+    shingles = {normalized[i:i + SHINGLE] for i in range(len(normalized) - SHINGLE + 1)}
+    hashes = np.fromiter((hash(shingle) & 0xFFFFFFFF for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # (a * x + b) stays below 2**64 for 32-bit a, x and b.
+    return ((hashes[:, None] * _PERM_A + _PERM_B) % _PRIME).min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def band_rows(threshold: float, recall: float = 0.99) -> int:
+    """
+    Rows per LSH band: the most selective split of the signature into bands
+    that still makes a text at `threshold` a candidate with probability `recall`.
+    """
+    rows = 1
+    for r in (2, 4, 8, 16, 32):
+        if 1 - (1 - threshold ** r) ** (NUM_PERM // r) >= recall:
+            rows = r
+    return rows
+
+
+@dataclass
+class Entry:
+    signature: np.ndarray
+    verdict: Dict
+    cluster: str
+    expires_at: float
+
+
+@dataclass
+class Cluster:
+    """Blocked texts within the similarity threshold of each other: one campaign."""
+    sample: str
+    first_seen: float
+    entries: int = 0
+    hits: int = 0
+    rate: float = 0.0      # hits per second, exponentially decayed
+    updated: float = 0.0
+
+    def decayed_rate(self, now: float, window: float) -> float:
+        return self.rate * math.exp(-(now - self.updated) / window)
+
+
+class NearDuplicateIndex:
+    """
+    Size-bounded MinHash LSH index of recently blocked texts. A text whose
+    estimated Jaccard similarity to one of them reaches `threshold` gets that
+    verdict without running any check.
+
+    Signatures are split into bands and only entries sharing a whole band
+    with the text are compared. Entries expire `ttl` seconds after their last
+    hit; the least recently hit are evicted first. Hits are counted per
+    cluster to expose floods as they happen. Like the verdict cache, the index
+    is emptied when the verdict fingerprint changes.
+    """
+
+    def __init__(self, max_size: int, ttl: float, threshold: float, min_length: int,
+                 rate_window: float, top_clusters: int, fingerprint: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_length = min_length
+        self.rate_window = rate_window
+        self.top_clusters = top_clusters
+        self.fingerprint = fingerprint
+        self.rows = band_rows(threshold)
+        self._entries: "OrderedDict[int, Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], set] = {}
+        self._clusters: Dict[str, Cluster] = {}
+        self._next_id = 0
+        self._lock = Lock()
+        self._exported_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def set_fingerprint(self, fingerprint: str):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                logger.info("Near-duplicate index fingerprint changed (%s -> %s), clearing %d entries",
+                            self.fingerprint, fingerprint, len(self._entries))
+                self.fingerprint = fingerprint
+                self._entries.clear()
+                self._buckets.clear()
+                self._clusters.clear()
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        The text's MinHash signature, or None when it is too short to be
+        compared reliably. The length is that of the normalized text, so
+        runs of punctuation or emoji do not count.
+        """
+        if not self.enabled:
+            return None
+        normalized = normalize(text)
+        if len(normalized) < self.min_length:
+            return None
+        return minhash(normalized)
+
+    def _band_keys(self, signature: np.ndarray):
+        return [
+            (band, signature[start:start + self.rows].tobytes())
+            for band, start in enumerate(range(0, NUM_PERM, self.rows))
+        ]
+
+    def _nearest(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+        best = max(
+            ((entry_id, similarity(signature, self._entries[entry_id].signature)) for entry_id in candidates),
+            key=lambda candidate: candidate[1], default=None
+        )
+        return best if best is not None and best[1] >= self.threshold else None
+
+    def _expire(self, now: float):
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.expires_at >= now:
+                break
+            self._remove(entry_id)
+            NEAR_DUPLICATE_COUNTER.labels(event="expired").inc()
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        cluster = self._clusters[entry.cluster]
+        cluster.entries -= 1
+        if not cluster.entries:
+            del self._clusters[entry.cluster]
+
+    def _touch(self, entry_id: int, now: float):
+        self._entries[entry_id].expires_at = now + self.ttl
+        self._entries.move_to_end(entry_id)
+
+    def match(self, signature: Optional[np.ndarray]) -> Optional[Dict]:
+        """
+        Returns a copy of the verdict of the most similar blocked text with
+        `near_duplicate_result` (the similarity) and `near_duplicate_cluster`
+        added, or None.
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            nearest = self._nearest(signature)
+            if nearest is None:
+                NEAR_DUPLICATE_COUNTER.labels(event="miss").inc()
+                return None
+            entry_id, score = nearest
+            self._touch(entry_id, now)
+            entry = self._entries[entry_id]
+            cluster = self._clusters[entry.cluster]
+            cluster.rate = cluster.decayed_rate(now, self.rate_window) + 1.0 / self.rate_window
+            cluster.updated = now
+            cluster.hits += 1
+            NEAR_DUPLICATE_COUNTER.labels(event="hit").inc()
+            return {**entry.verdict, "near_duplicate_result": score, "near_duplicate_cluster": entry.cluster}
+
+    def add(self, signature: Optional[np.ndarray], text: str, verdict: Dict):
+        """Remembers a blocked text; one similar to a known text joins that text's cluster."""
+        if signature is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            nearest = self._nearest(signature)
+            if nearest is not None and nearest[1] == 1.0:
+                self._touch(nearest[0], now)
+                return
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            if nearest is not None:
+                cluster_id = self._entries[nearest[0]].cluster
+            else:
+                # Named after the worker process and the first text, since every worker keeps its own index.
+                cluster_id = f"{os.getpid()}-{entry_id}"
+                self._clusters[cluster_id] = Cluster(sample=text[:80], first_seen=time.time(), updated=now)
+            self._clusters[cluster_id].entries += 1
+            self._entries[entry_id] = Entry(signature, dict(verdict), cluster_id, now + self.ttl)
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            NEAR_DUPLICATE_COUNTER.labels(event="added").inc()
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                NEAR_DUPLICATE_COUNTER.labels(event="eviction").inc()
+
+    def clusters(self, limit: Optional[int] = None) -> List[dict]:
+        """Active clusters, busiest first, with their flood rate in hits per minute."""
+        with self._lock:
+            now, wall = time.monotonic(), time.time()
+            self._expire(now)
+            clusters = [
+                {
+                    "cluster": cluster_id,
+                    "hits_per_minute": 60 * cluster.decayed_rate(now, self.rate_window),
+                    "hits": cluster.hits,
+                    "entries": cluster.entries,
+                    "age_seconds": wall - cluster.first_seen,
+                    "sample": cluster.sample,
+                }
+                for cluster_id, cluster in self._clusters.items()
+            ]
+        clusters.sort(key=lambda cluster: cluster["hits_per_minute"], reverse=True)
+        return clusters[:limit] if limit else clusters
+
+    def export_metrics(self, interval: float = 1.0):
+        """Updates the cluster gauges, at most once per `interval` seconds."""
+        now = time.monotonic()
+        if not self.enabled or now - self._exported_at < interval:
+            return
+        self._exported_at = now
+        top = self.clusters()
+        NEAR_DUPLICATE_CLUSTERS.set(len(top))
+        for rank in range(self.top_clusters):
+            NEAR_DUPLICATE_FLOOD_RATE.labels(rank=str(rank + 1)).set(
+                top[rank]["hits_per_minute"] if rank < len(top) else 0.0
+            )
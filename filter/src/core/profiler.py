@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sampling", "torch")
+
+
+class ProfileSession:
+    """
+    One profiling run, limited to a number of seconds and/or messages. It is
+    opened and closed on the inference thread, which torch.profiler requires.
+    """
+
+    def __init__(self, mode: str, seconds: float, messages: int, output_dir: str):
+        self.mode = mode
+        self.seconds = seconds
+        self.messages = messages
+        self.started = time.time()
+        self.path = os.path.join(output_dir, f"profile-{os.getpid()}-{int(self.started)}-{mode}")
+        self.timings: Dict[str, float] = {}
+        self.seen = 0
+        self.batches = 0
+        self.opened = False  # set under the Profiler lock once open() has returned
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def count(self, messages: int) -> bool:
+        """Records a finished batch and returns True once the message limit is reached."""
+        self.seen += messages
+        self.batches += 1
+        return bool(self.messages) and self.seen >= self.messages
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "started": self.started,
+            "seconds": self.seconds,
+            "messages": self.messages,
+            "seen": self.seen,
+            "batches": self.batches,
+        }
+
+
+class SamplingSession(ProfileSession):
+    """
+    Samples the Python stack of every thread with sys._current_frames() and
+    aggregates them into folded stacks ("frame;frame;frame count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, *args, interval: float):
+        super().__init__(*args)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def open(self):
+        self._thread.start()
+
+    def close(self) -> Dict[str, str]:
+        self._stop.set()
+        self._thread.join()
+        folded = self.path + ".folded"
+        with open(folded, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        return {"folded": folded}
+
+
+class TorchSession(ProfileSession):
+    """
+    Records torch operators with torch.profiler: a per-op table, folded stacks
+    weighted by self CPU time and a Chrome trace.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profile = torch.profiler.profile(activities=activities, record_shapes=True, with_stack=True)
+
+    def open(self):
+        self.profile.start()
+
+    def close(self) -> Dict[str, str]:
+        self.profile.stop()
+        files = {
+            "ops": self.path + ".ops.txt",
+            "folded": self.path + ".folded",
+            "trace": self.path + ".trace.json",
+        }
+        with open(files["ops"], "w") as f:
+            f.write(self.profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=50))
+        self.profile.export_stacks(files["folded"], "self_cpu_time_total")
+        self.profile.export_chrome_trace(files["trace"])
+        return files
+
+
+class Profiler:
+    """
+    On-demand profiler of one worker process. While no session runs, the hot
+    path only reads `session` once per batch.
+
+    `run_on_inference_thread` schedules a callable on the thread that runs
+    is_safe_batch, so sessions start and stop between batches on that thread.
+    """
+
+    def __init__(self, run_on_inference_thread: Callable, output_dir: str, sample_interval: float,
+                 max_seconds: float):
+        self.run_on_inference_thread = run_on_inference_thread
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self.session: Optional[ProfileSession] = None
+        self.last_result: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def start(self, mode: str = "sampling", seconds: float = 30, messages: int = 0) -> dict:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', expected one of {MODES}")
+        if seconds <= 0 and messages <= 0:
+            raise ValueError("Either seconds or messages must be positive")
+        # Sessions always end: the time limit is capped even when only a message count was asked for.
+        seconds = min(seconds, self.max_seconds) if seconds > 0 else self.max_seconds
+
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError("A profiling session is already running")
+            os.makedirs(self.output_dir, exist_ok=True)
+            if mode == "sampling":
+                session = SamplingSession(mode, seconds, messages, self.output_dir, interval=self.sample_interval)
+            else:
+                session = TorchSession(mode, seconds, messages, self.output_dir)
+            self.session = session
+
+        def open_session():
+            with self._lock:
+                if self.session is not session:
+                    return  # stopped before it opened
+                try:
+                    session.open()
+                except Exception as e:
+                    logger.exception("Failed to start profiling: %s", e)
+                    self.session = None
+                    self.last_result = {**session.status(), "error": f"ERROR: {e}"}
+                    return
+                session.opened = True
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            logger.info("Profiling started: %s for %.0fs / %s messages", mode, seconds, messages or "any")
+
+        self.run_on_inference_thread(open_session)
+        return session.status()
+
+    def stop(self):
+        """Ends the running session after the current batch."""
+        if self.session is not None:
+            self.run_on_inference_thread(self._finish)
+
+    def begin_batch(self) -> Optional[Dict[str, float]]:
+        """Returns the timings dict to pass to is_safe_batch, or None when not profiling."""
+        session = self.session
+        return session.timings if session is not None and session.opened else None
+
+    def end_batch(self, messages: int):
+        session = self.session
+        if session is not None and session.opened and session.count(messages):
+            self._finish()
+
+    def _finish(self):
+        # Always runs on the inference thread.
+        with self._lock:
+            session, self.session = self.session, None
+            if session is not None and not session.opened:
+                # Stopped before open_session ran: there is nothing to close.
+                self.last_result = {**session.status(), "error": "Stopped before profiling started"}
+                return
+        if session is None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            files = session.close()
+            result = {**session.status(), "elapsed": time.time() - session.started,
+                      "stage_timings": session.timings, "files": files}
+            files["summary"] = session.path + ".json"
+            with open(files["summary"], "w") as f:
+                json.dump(result, f, indent=2)
+            logger.info("Profiling finished: %d messages in %d batches, written to %s",
+                        session.seen, session.batches, files["summary"])
+        except Exception as e:
+            logger.exception("Failed to write profile: %s", e)
+            result = {**session.status(), "error": f"ERROR: {e}"}
+        self.last_result = result
+
+    def status(self) -> dict:
+        session = self.session
+        return {
+            "active": session.status() if session is not None else None,
+            "last_result": self.last_result,
+        }
@@ -0,0 +1,210 @@
+"""
+Wire format of the filter RPC. The app and the filter each ship a copy of
+this module (app/src/core/protocol.py, filter/src/core/protocol.py); keep
+them identical.
+
+`application/json` is the original format: one text per message
+({"message": ..., "session": ...}) and one JSON verdict per reply. Every app
+and filter version speaks it.
+
+`application/vnd.llm-filter.v1+msgpack` carries an envelope of many texts per
+message and all their verdicts in a single reply. Scores travel as one packed
+float32 matrix, with a column per score field and per classifier label.
+
+The filter reads a request in its content type and replies in the same one,
+so upgraded filters serve old and new apps side by side. Apps only switch to
+msgpack (RPC_PROTOCOL) once every filter worker has been upgraded.
+"""
+import json
+import math
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+JSON = "application/json"
+MSGPACK = "application/vnd.llm-filter.v1+msgpack"
+CONTENT_TYPES = {"json": JSON, "msgpack": MSGPACK}
+VERSION = 1
+
+# Float columns of the score matrix, followed by one column per classifier label.
+# NaN marks a missing value.
+SCORE_FIELDS = ("semantic_result", "anomaly_result", "mixed_language_result", "near_duplicate_result")
+_PACKED = {*SCORE_FIELDS, "status", "is_recurrent_result", "classification_result", "skipped", "fingerprint"}
+# Per-result flag bits. A raw result (an error) travels unpacked in `extra`.
+_PRESENT, _RAW, _STATUS, _RECURRENT = 1, 2, 4, 8
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise RuntimeError(f"{MSGPACK} needs the msgpack package") from e
+    return msgpack
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    # Replies of filters that predate content types carry none.
+    return not content_type or content_type == JSON
+
+
+def supported(content_type: Optional[str]) -> bool:
+    return _is_json(content_type) or content_type == MSGPACK
+
+
+def _float32_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array("f", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _float32_array(data: bytes) -> array:
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def encode_requests(requests: List[Dict], content_type: str) -> bytes:
+    """
+    Serializes requests of the form {"message": str, "session": dict or None,
+    "deadline": epoch seconds or None}. JSON carries exactly one request, whose
+    deadline travels in the message headers instead.
+    """
+    if _is_json(content_type):
+        if len(requests) != 1:
+            raise ValueError(f"{JSON} carries one text per message, got {len(requests)}")
+        request = requests[0]
+        body = {"message": request["message"]}
+        if request.get("session") is not None:
+            body["session"] = request["session"]
+        return json.dumps(body).encode()
+    if content_type != MSGPACK:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    items = []
+    for request in requests:
+        item = {"m": request["message"]}
+        if request.get("deadline") is not None:
+            item["d"] = request["deadline"]
+        if request.get("session") is not None:
+            item["s"] = request["session"]
+        items.append(item)
+    return _msgpack().packb({"v": VERSION, "items": items})
+
+
+def decode_requests(body: bytes, content_type: Optional[str]) -> List[Dict]:
+    """Inverse of encode_requests; fields are validated by the caller."""
+    if _is_json(content_type):
+        request = json.loads(body)
+        if not isinstance(request, dict):
+            raise ValueError("Invalid message format")
+        return [{"message": request.get("message"), "session": request.get("session"), "deadline": None}]
+    if content_type != MSGPACK:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    envelope = _msgpack().unpackb(body, raw=False)
+    if not isinstance(envelope, dict) or envelope.get("v") != VERSION:
+        raise ValueError("Unsupported envelope version")
+    items = envelope.get("items")
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Invalid envelope")
+    return [{"message": item.get("m"), "session": item.get("s"), "deadline": item.get("d")} for item in items]
+
+
+def encode_results(results: List[Optional[Dict]], content_type: Optional[str]) -> bytes:
+    """
+    Serializes the verdicts of one message, in request order. None stands for
+    a text that expired unprocessed; JSON replies carry exactly one verdict.
+    """
+    if _is_json(content_type):
+        if len(results) != 1 or results[0] is None:
+            raise ValueError(f"{JSON} carries one verdict per reply")
+        return json.dumps(results[0]).encode()
+    if content_type != MSGPACK:
+        raise ValueError(f"Unsupported content type: {content_type}")
+
+    packed = [result for result in results if result is not None and "error" not in result]
+    labels = sorted({label for result in packed for label in result.get("classification_result") or {}})
+    stages = sorted({stage for result in packed for stage in result.get("skipped") or []})
+    fingerprints = sorted({result["fingerprint"] for result in packed if result.get("fingerprint")})
+    columns = {name: i for i, name in enumerate([*SCORE_FIELDS, *labels])}
+    stage_ids = {stage: i for i, stage in enumerate(stages)}
+    fingerprint_ids = {fingerprint: i for i, fingerprint in enumerate(fingerprints)}
+
+    width = len(columns)
+    scores = array("f", [math.nan]) * (len(results) * width)
+    flags = bytearray(len(results))
+    skipped, fingerprint_index, extra = [], [], []
+    for i, result in enumerate(results):
+        if result is None:
+            skipped.append(None)
+            fingerprint_index.append(-1)
+            extra.append(None)
+            continue
+        if "error" in result:
+            flags[i] = _PRESENT | _RAW
+            skipped.append(None)
+            fingerprint_index.append(-1)
+            extra.append(result)
+            continue
+        flags[i] = (_PRESENT | (_STATUS if result.get("status") else 0)
+                    | (_RECURRENT if result.get("is_recurrent_result") else 0))
+        row = i * width
+        for name in SCORE_FIELDS:
+            if name in result:
+                scores[row + columns[name]] = float(result[name])
+        for label, score in (result.get("classification_result") or {}).items():
+            scores[row + columns[label]] = float(score)
+        skipped.append([stage_ids[stage] for stage in result.get("skipped") or []])
+        fingerprint_index.append(fingerprint_ids.get(result.get("fingerprint"), -1))
+        extra.append({key: value for key, value in result.items() if key not in _PACKED} or None)
+
+    return _msgpack().packb({
+        "v": VERSION,
+        "fields": list(SCORE_FIELDS),
+        "labels": labels,
+        "stages": stages,
+        "fingerprints": fingerprints,
+        "flags": bytes(flags),
+        "scores": _float32_bytes(scores),
+        "skipped": skipped,
+        "fingerprint": fingerprint_index,
+        "extra": extra,
+    }, use_bin_type=True)
+
+
+def decode_results(body: bytes, content_type: Optional[str]) -> List[Optional[Dict]]:
+    """Inverse of encode_results: the verdicts of one message, in request order."""
+    if _is_json(content_type):
+        return [json.loads(body)]
+    if content_type != MSGPACK:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    envelope = _msgpack().unpackb(body, raw=False)
+    if not isinstance(envelope, dict) or envelope.get("v") != VERSION:
+        raise ValueError("Unsupported envelope version")
+
+    fields, labels = envelope["fields"], envelope["labels"]
+    stages, fingerprints = envelope["stages"], envelope["fingerprints"]
+    width = len(fields) + len(labels)
+    scores = _float32_array(envelope["scores"])
+    results = []
+    for i, flag in enumerate(envelope["flags"]):
+        extra = envelope["extra"][i]
+        if not flag & _PRESENT:
+            results.append(None)
+            continue
+        if flag & _RAW:
+            results.append(extra)
+            continue
+        row = scores[i * width:(i + 1) * width]
+        result = {"status": bool(flag & _STATUS), "is_recurrent_result": bool(flag & _RECURRENT)}
+        result.update((name, value) for name, value in zip(fields, row) if not math.isnan(value))
+        result["classification_result"] = {
+            label: value for label, value in zip(labels, row[len(fields):]) if not math.isnan(value)
+        }
+        result["skipped"] = [stages[stage] for stage in envelope["skipped"][i]]
+        if envelope["fingerprint"][i] >= 0:
+            result["fingerprint"] = fingerprints[envelope["fingerprint"][i]]
+        result.update(extra or {})
+        results.append(result)
+    return results
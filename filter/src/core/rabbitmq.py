@@ -1,25 +1,59 @@
+import hashlib
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
 
 from pika import BasicProperties, SelectConnection, ConnectionParameters, PlainCredentials
 
-from src.core.filter import is_safe
+from src.core.admin import AdminServer
+from src.core.filter import add_examples, is_safe_batch, near_duplicates
+from src.core.profiler import Profiler
+from src.core.protocol import JSON, decode_requests, encode_results, supported
+from src.utils.config import (
+    BATCH_SIZE, BATCH_TIMEOUT_MS, BULK_PREFETCH, BULK_QUEUE, CONTROL_EXCHANGE, PROFILE_DIR, PROFILE_MAX_SECONDS,
+    PROFILE_SAMPLE_INTERVAL_MS, TASK_QUEUE, WORKER_STAGE
+)
+from src.utils.metrics import (
+    BATCH_SIZE_HISTOGRAM, BATCH_WAIT, EXPIRED_COUNTER, IN_FLIGHT, MESSAGES_COUNTER, QUEUE_WAIT
+)
 
 logger = logging.getLogger(__name__)
 
 class RabbitMQService:
 
-    def __init__(self):
+    def __init__(self, admin_port: Optional[int] = None, on_ready: Optional[Callable[[], None]] = None):
         self.connection_params = ConnectionParameters(
             host='rabbitmq',
             blocked_connection_timeout=300,
         )
         self.connection = None
         self.channel = None
+        self.bulk_channel = None
+        self.ready = False
+        self.on_ready = on_ready
+        self._pending = []
+        self._pending_texts = 0
+        self._flush_timer = None
+        # Inference runs off the pika ioloop so heartbeats keep flowing during long batches.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.profiler = Profiler(
+            run_on_inference_thread=self._executor.submit,
+            output_dir=PROFILE_DIR,
+            sample_interval=PROFILE_SAMPLE_INTERVAL_MS / 1000.0,
+            max_seconds=PROFILE_MAX_SECONDS,
+        )
+        self.admin = AdminServer(
+            admin_port, self.profiler, ready=lambda: self.ready, near_duplicates=near_duplicates.clusters
+        ) if admin_port else None
 
     def initialize(self):
         try:
             logger.info("Initializing RabbitMQ in filter")
+            if self.admin is not None:
+                self.admin.start()
             self.connection = SelectConnection(
                 parameters=self.connection_params,
                 on_open_callback=self.on_connected,
@@ -46,44 +80,225 @@ class RabbitMQService:
 
     def setup_queues(self, channel):
         def on_output_declared(_):
-            channel.queue_bind(queue='task', exchange='default', routing_key='task')
+            # Workers of a stage pool consume task.<stage> / task_bulk.<stage> instead.
+            channel.queue_bind(queue=TASK_QUEUE, exchange='default', routing_key=TASK_QUEUE)
+            channel.queue_bind(queue=BULK_QUEUE, exchange='default', routing_key=BULK_QUEUE)
             channel.queue_bind(queue='output', exchange='default', routing_key='output')
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(queue='task', on_message_callback=self._process_message)
-            logger.info("Worker ready and consuming")
+            # Two batches in flight: one being inferred, the next one filling up.
+            channel.basic_qos(prefetch_count=2 * BATCH_SIZE)
+            channel.basic_consume(queue=TASK_QUEUE, on_message_callback=self._process_message)
+            self.connection.channel(on_open_callback=self.on_bulk_channel_open)
+            self.setup_control(channel)
+            logger.info("Worker ready and consuming %s checks from %s (batch size %d, timeout %.1f ms)",
+                        WORKER_STAGE, TASK_QUEUE, BATCH_SIZE, BATCH_TIMEOUT_MS)
+            self.ready = True
+            if self.on_ready is not None:
+                self.on_ready()
 
-        def on_task_declared(_):
+        def on_bulk_declared(_):
             channel.queue_declare(queue='output', durable=True, callback=on_output_declared)
 
-        channel.queue_declare(queue='task', durable=True, callback=on_task_declared)
+        def on_task_declared(_):
+            channel.queue_declare(queue=BULK_QUEUE, durable=True, callback=on_bulk_declared)
 
-    def _process_message(self, ch, method, properties, body):
-        response = {}
+        channel.queue_declare(queue=TASK_QUEUE, durable=True, callback=on_task_declared)
+
+    def setup_control(self, channel):
+        # Fanout exchange: every worker gets its own exclusive queue and sees every control message.
+        def on_queue_declared(frame):
+            queue = frame.method.queue
+            channel.queue_bind(
+                queue=queue, exchange=CONTROL_EXCHANGE,
+                callback=lambda _: channel.basic_consume(
+                    queue=queue, on_message_callback=self._process_control, auto_ack=True
+                )
+            )
+            logger.info("Listening for control messages on %s", CONTROL_EXCHANGE)
+
+        channel.exchange_declare(
+            exchange=CONTROL_EXCHANGE,
+            exchange_type='fanout',
+            callback=lambda _: channel.queue_declare(queue='', exclusive=True, callback=on_queue_declared)
+        )
+
+    def _process_control(self, ch, method, properties, body):
         try:
             request = json.loads(body)
-            input_message = request.get('message')
-            correlation_id = properties.correlation_id
+            action = request.get('action')
+            if action == 'add_examples':
+                texts = request.get('texts') or []
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("'texts' must be a list of strings")
+                # The id makes redelivered or replayed messages idempotent.
+                example_id = request.get('id') or hashlib.sha256(json.dumps(texts).encode()).hexdigest()[:16]
+                # Encoding uses the semantic model, so it runs on the inference thread between batches.
+                self._executor.submit(self._add_examples, example_id, texts)
+            else:
+                logger.warning("Ignored unknown control action: %s", action)
+        except Exception as e:
+            logger.exception("Failed to process control message: %s", e)
+
+    @staticmethod
+    def _add_examples(example_id, texts):
+        try:
+            if add_examples(example_id, texts):
+                logger.info("Added %d toxic examples (%s) to the semantic index", len(texts), example_id)
+        except Exception as e:
+            logger.exception("Failed to add examples %s: %s", example_id, e)
+
+    def on_bulk_channel_open(self, channel):
+        # Separate channel so the bulk queue gets its own, smaller prefetch window.
+        self.bulk_channel = channel
+        channel.basic_qos(prefetch_count=BULK_PREFETCH)
+        channel.basic_consume(queue=BULK_QUEUE, on_message_callback=self._process_message)
+        logger.info("Consuming bulk queue %s (prefetch %d)", BULK_QUEUE, BULK_PREFETCH)
+
+    @staticmethod
+    def _deadline(properties):
+        """Epoch second after which nobody waits for the reply, or None."""
+        deadline = (properties.headers or {}).get('deadline')
+        return deadline if isinstance(deadline, (int, float)) else None
 
+    def _drop(self, ch, method, properties, stage, count=1):
+        # Expired work is acked without a reply: the requester has already given up on it.
+        EXPIRED_COUNTER.labels(stage=stage).inc(count)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        logger.info("Dropped expired message with correlation_id: %s", properties.correlation_id)
+
+    def _process_message(self, ch, method, properties, body):
+        received_at = time.time()
+        published_at = (properties.headers or {}).get('published_at')
+        if isinstance(published_at, (int, float)):
+            QUEUE_WAIT.observe(max(0.0, received_at - published_at))
+        # A message carries one text (JSON) or an envelope of texts (msgpack); the
+        # request list, or the error decoding it, stays with the message until the reply.
+        try:
+            requests = decode_requests(body, properties.content_type)
+        except Exception as e:
+            logger.exception("Failed to decode message: %s", e)
+            requests = e
+        count = 1 if isinstance(requests, Exception) else len(requests)
+        deadline = self._deadline(properties)
+        if deadline is not None and received_at >= deadline:
+            self._drop(ch, method, properties, "queue", count)
+            return
+        IN_FLIGHT.inc(count)
+        self._pending.append((ch, method, properties, requests, received_at))
+        self._pending_texts += count
+        if self._pending_texts >= BATCH_SIZE:
+            self._flush_batch()
+        elif self._flush_timer is None:
+            self._flush_timer = self.connection.ioloop.call_later(
+                BATCH_TIMEOUT_MS / 1000.0, self._flush_batch
+            )
+
+    def _flush_batch(self):
+        if self._flush_timer is not None:
+            self.connection.ioloop.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        pending, self._pending = self._pending, []
+        self._pending_texts = 0
+        if not pending:
+            return
+
+        now = time.time()
+        batch = []
+        for ch, method, properties, requests, received_at in pending:
+            BATCH_WAIT.observe(now - received_at)
+            deadline = self._deadline(properties)
+            count = 1 if isinstance(requests, Exception) else len(requests)
+            if deadline is not None and now >= deadline:
+                IN_FLIGHT.dec(count)
+                self._drop(ch, method, properties, "batch", count)
+            else:
+                batch.append((ch, method, properties, requests))
+        if not batch:
+            return
+
+        # responses[i][j] is the result of the j-th text of the i-th message.
+        responses = []
+        texts, positions, deadlines, sessions = [], [], [], []
+        for i, (_, _, properties, requests) in enumerate(batch):
+            correlation_id = properties.correlation_id
             logger.info("Received message with correlation_id: %s", correlation_id)
+            if isinstance(requests, Exception):
+                responses.append([{"error": f"ERROR: {requests}"}])
+                continue
+            responses.append([None] * len(requests))
+            for j, request in enumerate(requests):
+                try:
+                    input_message = request['message']
+                    if not input_message or not isinstance(input_message, str) or not correlation_id:
+                        raise ValueError("Invalid message format")
+
+                    session = request['session']
+                    if session is not None and not isinstance(session, dict):
+                        raise ValueError("Invalid session state")
 
-            if not input_message or not correlation_id:
-                raise ValueError("Invalid message format")
+                    texts.append(input_message)
+                    positions.append((i, j))
+                    # Texts of an envelope carry their own deadline, the message header the latest of them.
+                    deadline = request['deadline']
+                    deadlines.append(deadline if isinstance(deadline, (int, float)) else self._deadline(properties))
+                    # Conversation turns carry their session state, which the reply returns updated.
+                    sessions.append(session)
+                except Exception as e:
+                    logger.exception("Failed to process message: %s", e)
+                    responses[i][j] = {
+                        "error": f"ERROR: {e}"
+                    }
+        BATCH_SIZE_HISTOGRAM.observe(len(texts))
 
-            response = is_safe(input_message)
-            logger.info("Filtering complete for correlation_id: %s", correlation_id)
+        self._executor.submit(self._run_batch, batch, responses, texts, positions, deadlines, sessions)
+
+    def _run_batch(self, batch, responses, texts, positions, deadlines, sessions):
+        # Runs on the inference thread; replies are handed back to the ioloop thread.
+        timings = self.profiler.begin_batch()
+        try:
+            # A None result means the message expired between stages.
+            results = is_safe_batch(texts, timings=timings, deadlines=deadlines, sessions=sessions)
+            for (i, j), result in zip(positions, results):
+                responses[i][j] = result
+            logger.info("Filtering complete for batch of %d messages", len(texts))
+        except Exception as e:
+            logger.exception("Failed to process batch: %s", e)
+            for i, j in positions:
+                responses[i][j] = {
+                    "error": f"ERROR: {e}"
+                }
+        self.profiler.end_batch(len(texts))
 
+        try:
+            self.connection.ioloop.add_callback_threadsafe(partial(self._publish_batch, batch, responses))
         except Exception as e:
-            logger.exception("Failed to process message: %s", e)
-            response = {
-                "error": f"ERROR: {e}"
-            }
+            logger.exception("Failed to schedule replies, messages will be redelivered: %s", e)
 
+    def _publish_batch(self, batch, responses):
+        for (ch, method, properties, _), response in zip(batch, responses):
+            self._reply(ch, method, properties, response)
+
+    def _reply(self, ch, method, properties, results):
+        IN_FLIGHT.dec(len(results))
+        if all(result is None for result in results):
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        for result in results:
+            if result is None:
+                continue
+            if "error" in result:
+                MESSAGES_COUNTER.labels(status="error").inc()
+            else:
+                MESSAGES_COUNTER.labels(status="passed" if result.get("status") else "blocked").inc()
+        # Replies use the request's wire format; requests in an unknown one get a JSON error.
+        content_type = properties.content_type if supported(properties.content_type) else JSON
+        if content_type == JSON:
+            results = [result for result in results if result is not None]
         try:
-            ch.basic_publish(
+            self.channel.basic_publish(
                 exchange='default',
                 routing_key=properties.reply_to,
-                properties=BasicProperties(correlation_id=properties.correlation_id),
-                body=json.dumps(response)
+                properties=BasicProperties(correlation_id=properties.correlation_id, content_type=content_type),
+                body=encode_results(results, content_type)
             )
             ch.basic_ack(delivery_tag=method.delivery_tag)
             logger.info("Published response for correlation_id: %s", properties.correlation_id)
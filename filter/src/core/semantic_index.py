@@ -0,0 +1,167 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from src.core.cache import make_fingerprint
+from src.utils.metrics import SEMANTIC_COMPACTIONS_COUNTER, SEMANTIC_DELTA_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class IndexState(NamedTuple):
+    """One immutable generation of the index; searches always use a single snapshot."""
+    embeddings: np.ndarray   # vectors behind the main searcher
+    searcher: object         # approximate searcher over `embeddings`
+    delta: np.ndarray        # vectors added since the last compaction, searched exactly
+    examples: Tuple[str, ...] = ()        # ids of the added examples compacted into `embeddings`
+    delta_examples: Tuple[str, ...] = ()  # ids of the examples in `delta`
+
+
+class SemanticIndex:
+    """
+    Toxic-example index made of the prebuilt approximate searcher plus a small
+    delta of examples added at runtime, which is searched exactly. Results of
+    both are merged into one top-k.
+
+    Once the delta reaches `compact_threshold` vectors, a background thread
+    calls `rebuild(embeddings, delta, examples)` for the embeddings and
+    searcher over everything and swaps them in; searches keep using the
+    previous generation until then. `examples` are the ids already
+    compacted into `embeddings`.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        searcher,
+        rebuild: Callable[[np.ndarray, np.ndarray, List[str]], Tuple[np.ndarray, object]],
+        compact_threshold: int,
+        examples: Iterable[str] = ()
+    ):
+        dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+        examples = tuple(examples)
+        self.state = IndexState(embeddings, searcher, np.empty((0, dim), dtype=np.float32), examples)
+        self.rebuild = rebuild
+        self.compact_threshold = compact_threshold
+        self.example_ids: Set[str] = set(examples)
+        self._lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> str:
+        """Identifies the added examples, so verdicts can be invalidated when they change."""
+        return make_fingerprint(examples=sorted(self.example_ids)) if self.example_ids else ""
+
+    def __len__(self) -> int:
+        state = self.state
+        return len(state.embeddings) + len(state.delta)
+
+    def search_batched(self, queries: np.ndarray, final_num_neighbors: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Same contract as ScaNN's search_batched: (neighbors, scores), best first."""
+        state = self.state
+        neighbors, scores = state.searcher.search_batched(queries, final_num_neighbors=final_num_neighbors)
+        if not len(state.delta):
+            return neighbors, scores
+
+        delta_scores = queries @ state.delta.T
+        delta_neighbors = np.broadcast_to(
+            np.arange(len(state.embeddings), len(state.embeddings) + len(state.delta)), delta_scores.shape
+        )
+        all_scores = np.concatenate([np.asarray(scores, dtype=np.float32), delta_scores], axis=1)
+        all_neighbors = np.concatenate([np.asarray(neighbors), delta_neighbors], axis=1)
+        k = min(final_num_neighbors, all_scores.shape[1])
+        top = np.argsort(-all_scores, axis=1)[:, :k]
+        return np.take_along_axis(all_neighbors, top, axis=1), np.take_along_axis(all_scores, top, axis=1)
+
+    def add(self, example_id: str, vectors: np.ndarray, compact: bool = True) -> bool:
+        """
+        Adds normalized vectors under `example_id`; an id seen before is ignored.
+        With `compact`, a full delta starts a background compaction.
+        Returns whether anything was added.
+        """
+        if example_id in self.example_ids:
+            return False
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.state.delta.shape[1])
+        with self._lock:
+            state = self.state
+            self.state = state._replace(
+                delta=np.concatenate([state.delta, vectors]), delta_examples=state.delta_examples + (example_id,)
+            )
+            self.example_ids.add(example_id)
+        SEMANTIC_DELTA_SIZE.set(len(self.state.delta))
+        logger.info("Added %d examples (%s) to the semantic delta, now %d vectors",
+                    len(vectors), example_id, len(self.state.delta))
+        if compact and len(self.state.delta) >= self.compact_threshold:
+            self.compact()
+        return True
+
+    def compact(self, wait: bool = False):
+        """Starts a background rebuild of the main index over the main and delta vectors."""
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self._compact, name="index-compaction", daemon=True)
+            self._compaction.start()
+        if wait:
+            self._compaction.join()
+
+    def _compact(self):
+        snapshot = self.state
+        merged = len(snapshot.delta)
+        examples = snapshot.examples + snapshot.delta_examples
+        start = time.time()
+        try:
+            embeddings, searcher = self.rebuild(snapshot.embeddings, snapshot.delta, list(examples))
+        except Exception as e:
+            logger.exception("Semantic index compaction failed: %s", e)
+            return
+        with self._lock:
+            # Vectors added while the rebuild ran stay in the delta.
+            state = self.state
+            self.state = IndexState(
+                embeddings, searcher, state.delta[merged:], examples,
+                state.delta_examples[len(snapshot.delta_examples):]
+            )
+        SEMANTIC_DELTA_SIZE.set(len(self.state.delta))
+        SEMANTIC_COMPACTIONS_COUNTER.inc()
+        logger.info("Compacted %d delta vectors into the semantic index (%d vectors) in %.1fs",
+                    merged, len(embeddings), time.time() - start)
+
+
+class ExampleStore:
+    """
+    Append-only JSONL file of the examples added at runtime, shared by every
+    worker. It stores texts, not vectors; at startup only the examples the
+    index artifact does not hold yet are encoded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> List[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def append(self, example_id: str, texts: List[str]):
+        """Appends a record unless another worker already stored the same id."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                if any(json.loads(line).get("id") == example_id for line in f if line.strip()):
+                    return
+                f.write(json.dumps({"id": example_id, "texts": texts, "added_at": time.time()}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,99 @@
+import base64
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def _encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float16).astype(np.float32)
+
+
+def turn_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class SessionState:
+    """
+    Cumulative signals of one conversation, carried by the app between turns
+    so that any worker can continue it. Everything is bounded: word counts
+    keep the `max_words` most frequent words, and digests and embeddings
+    only the last `max_turns` turns.
+    """
+    turns: int = 0
+    total_words: int = 0
+    words: Dict[str, int] = field(default_factory=dict)
+    anomaly: float = 0.0
+    recent: List[str] = field(default_factory=list)
+    embeddings: List[np.ndarray] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict, dim: int) -> "SessionState":
+        """Reads the state sent by the app; malformed parts start over rather than failing the turn."""
+        embeddings = []
+        for item in data.get("embeddings") or []:
+            try:
+                vector = _decode_vector(item)
+            except (TypeError, ValueError):
+                continue
+            # Embeddings of another semantic model cannot be compared with the current ones.
+            if vector.shape == (dim,):
+                embeddings.append(vector)
+        words = data.get("words")
+        return cls(
+            turns=int(data.get("turns", 0)),
+            total_words=int(data.get("total_words", 0)),
+            words={str(word): int(count) for word, count in words.items()} if isinstance(words, dict) else {},
+            anomaly=float(data.get("anomaly", 0.0)),
+            recent=[str(digest) for digest in data.get("recent") or []],
+            embeddings=embeddings,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "turns": self.turns,
+            "total_words": self.total_words,
+            "words": self.words,
+            "anomaly": self.anomaly,
+            "recent": self.recent,
+            "embeddings": [_encode_vector(vector) for vector in self.embeddings],
+        }
+
+    def context(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        """Normalized mean of the prior turns and this one, or None on the first turn."""
+        if not self.embeddings:
+            return None
+        mean = np.mean([*self.embeddings, vector], axis=0)
+        norm = np.linalg.norm(mean)
+        return mean / norm if norm else None
+
+    def add_turn(self, text: str, anomaly: float, vector: np.ndarray, max_turns: int, max_words: int,
+                 alpha: float) -> int:
+        """Folds one turn into the state and returns how many recent turns were identical to it."""
+        digest = turn_digest(text)
+        repeats = self.recent.count(digest)
+
+        words = Counter(text.lower().split())
+        merged = Counter(self.words)
+        merged.update(words)
+        self.words = dict(merged.most_common(max_words))
+        self.total_words += sum(words.values())
+
+        self.anomaly = anomaly if not self.turns else alpha * anomaly + (1 - alpha) * self.anomaly
+        self.turns += 1
+        self.recent = (self.recent + [digest])[-max_turns:]
+        self.embeddings = (self.embeddings + [np.asarray(vector, dtype=np.float32)])[-max_turns:]
+        return repeats
+
+    def repetition_ratio(self) -> float:
+        """Share of all session words taken by the most frequent one, as is_recurrent measures per text."""
+        if not self.total_words or not self.words:
+            return 0.0
+        return max(self.words.values()) / self.total_words
@@ -0,0 +1,214 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import torch
+
+from src.utils.metrics import mark_worker_dead
+
+logger = logging.getLogger(__name__)
+
+# Workers are forked after the models and the index are loaded, so every
+# process shares their read-only pages copy-on-write.
+_ctx = multiprocessing.get_context("fork")
+
+
+def write_ready_file(path: str):
+    with open(path, "w") as f:
+        f.write(str(os.getpid()))
+    logger.info("Filter is ready (%s)", path)
+
+
+def remove_ready_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_worker(index: int, torch_threads: int, ready_queue=None):
+    """
+    Entry point of one worker process: warms up its own torch thread pool,
+    then consumes and reports its index on `ready_queue`.
+    """
+    from src.core.filter import warm_up
+    from src.core.rabbitmq import RabbitMQService
+    from src.utils.config import ADMIN_PORT, WARMUP
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    logger.info("Worker %d started (pid %d, %d torch threads)", index, os.getpid(), torch.get_num_threads())
+    try:
+        if WARMUP:
+            warm_up()
+        RabbitMQService(
+            admin_port=ADMIN_PORT + 1 + index if ADMIN_PORT else None,
+            on_ready=lambda: ready_queue.put(index) if ready_queue is not None else None
+        ).initialize()
+    except KeyboardInterrupt:
+        pass
+
+
+def _calibrate(thread_counts: List[int], results):
+    from src.core.filter import is_safe_batch
+    from src.utils.config import BATCH_SIZE
+
+    lengths = (8, 32, 128)
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        # Unique texts so the verdict cache never answers for the model.
+        texts = [
+            f"calibration {threads} {i} " + "sample words " * lengths[i % len(lengths)]
+            for i in range(4 * BATCH_SIZE)
+        ]
+        is_safe_batch(texts[:BATCH_SIZE])
+        start = time.perf_counter()
+        for i in range(BATCH_SIZE, len(texts), BATCH_SIZE):
+            is_safe_batch(texts[i:i + BATCH_SIZE])
+        elapsed = time.perf_counter() - start
+        results.put((threads, (len(texts) - BATCH_SIZE) / elapsed))
+
+
+def _prepare_semantic_index():
+    from src.core.models import load_semantic_encoder, prepare_semantic_index
+
+    prepare_semantic_index(load_semantic_encoder())
+
+
+def prepare_semantic_index_in_child():
+    """
+    Builds the semantic index artifact and encodes the added examples it
+    lacks in a throwaway child. Encoding starts torch's thread pool, which
+    would make the supervisor unsafe to fork; the supervisor then only loads
+    the finished artifact.
+    """
+    process = _ctx.Process(target=_prepare_semantic_index, name="index-prepare")
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Semantic index preparation failed (exit code {process.exitcode})")
+
+
+def measure_throughput(thread_counts: List[int], timeout: float = 300) -> Dict[int, float]:
+    """
+    Measures single-process throughput (msgs/s) for each torch thread count.
+    Runs in a throwaway child so the supervisor never starts torch's thread
+    pool itself, which would be unsafe to fork afterwards.
+    """
+    results = _ctx.Queue()
+    process = _ctx.Process(target=_calibrate, args=(thread_counts, results), daemon=True)
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+    measured = {}
+    while not results.empty():
+        threads, throughput = results.get()
+        measured[threads] = throughput
+    return measured
+
+
+def choose_pool_size(cores: int, torch_threads: int) -> Tuple[int, int]:
+    """
+    Returns (processes, threads per process) for WORKER_PROCESSES=auto. With a
+    fixed TORCH_THREADS the cores are simply divided; otherwise the thread
+    count with the best measured total throughput over all cores wins.
+    """
+    if torch_threads:
+        return max(1, cores // torch_threads), torch_threads
+
+    candidates = [t for t in (1, 2, 4, 8) if t <= cores]
+    measured = measure_throughput(candidates)
+    if not measured:
+        logger.warning("Throughput calibration failed, using one thread per process")
+        return cores, 1
+
+    for threads, throughput in sorted(measured.items()):
+        logger.info("Calibration: %d thread(s) -> %.1f msgs/s per process, %.1f msgs/s total",
+                    threads, throughput, throughput * (cores // threads))
+    threads = max(measured, key=lambda t: measured[t] * (cores // t))
+    return cores // threads, threads
+
+
+class WorkerSupervisor:
+    """
+    Starts and keeps alive a pool of filter worker processes, each with its
+    own RabbitMQ connection and torch thread budget.
+
+    The pool is ready once every worker has warmed up and started consuming,
+    and stays ready while at least one of them is; readiness is reported
+    through `ready_file` and, given an admin port, GET /ready.
+    """
+
+    def __init__(self, processes: int, torch_threads: int, ready_file: Optional[str] = None, admin_port: int = 0):
+        self.processes = processes
+        self.torch_threads = torch_threads
+        self.ready_file = ready_file
+        self.admin_port = admin_port
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.ready_workers: Set[int] = set()
+        self.ready = False
+        self._ready_queue = _ctx.Queue()
+        self._stopping = False
+
+    def _start(self, index: int):
+        process = _ctx.Process(
+            target=run_worker, args=(index, self.torch_threads, self._ready_queue), name=f"filter-worker-{index}"
+        )
+        process.start()
+        self.workers[index] = process
+
+    def _update_ready(self):
+        while True:
+            try:
+                self.ready_workers.add(self._ready_queue.get_nowait())
+            except queue.Empty:
+                break
+        ready = len(self.ready_workers) == self.processes if not self.ready else bool(self.ready_workers)
+        if ready != self.ready:
+            self.ready = ready
+            if self.ready_file:
+                if ready:
+                    write_ready_file(self.ready_file)
+                else:
+                    remove_ready_file(self.ready_file)
+
+    def _stop(self, signum, _frame):
+        logger.info("Supervisor received signal %d, stopping workers", signum)
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        logger.info("Starting %d worker processes with %s torch threads each",
+                    self.processes, self.torch_threads or "default")
+        if self.admin_port:
+            from src.core.admin import AdminServer
+            AdminServer(self.admin_port, ready=lambda: self.ready).start()
+        for index in range(self.processes):
+            self._start(index)
+
+        while not self._stopping:
+            time.sleep(1)
+            self._update_ready()
+            for index, process in list(self.workers.items()):
+                if not process.is_alive() and not self._stopping:
+                    logger.warning("Worker %d exited with code %s, restarting", index, process.exitcode)
+                    mark_worker_dead(process.pid)
+                    self.ready_workers.discard(index)
+                    self._start(index)
+
+        if self.ready_file:
+            remove_ready_file(self.ready_file)
+
+        for process in self.workers.values():
+            process.terminate()
+        for process in self.workers.values():
+            process.join(10)
+        logger.info("All workers stopped")
@@ -4,10 +4,73 @@ from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Inference backend for the classifier and the semantic encoder:
+# torch (eager), torch-int8 (dynamic quantization), onnx or onnx-int8 (ONNX Runtime).
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+if INFERENCE_BACKEND not in ('torch', 'torch-int8', 'onnx', 'onnx-int8'):
+    raise ValueError(f"Unsupported INFERENCE_BACKEND: {INFERENCE_BACKEND}")
+# Exported ONNX models and the instruction set their int8 weights are quantized for.
+ONNX_DIR = os.environ.get('ONNX_DIR', '/models/onnx')
+ONNX_QUANTIZATION = os.environ.get('ONNX_QUANTIZATION', 'avx2')
+
+# Only the PyTorch eager backend runs on GPU; the others are CPU backends.
+DEVICE = torch.device("cuda" if torch.cuda.is_available() and INFERENCE_BACKEND == 'torch' else "cpu")
 HF_TOKEN = os.environ.get('HF_TOKEN')
 HF_MODEL = os.environ.get('HF_MODEL')
 SEMANTIC_MODEL = os.environ.get('SEMANTIC_MODEL')
+DATA_PATH = os.environ.get('DATA_PATH', '/data')
+# Prebuilt embeddings + searcher, reused across restarts while its fingerprint matches.
+INDEX_DIR = os.environ.get('INDEX_DIR', os.path.join(DATA_PATH, 'semantic_index'))
+# Nearest-neighbour engine of the semantic check: scann, exact (blocked matmul over a
+# float32/float16/int8 copy of the embeddings) or hnsw (needs the optional hnswlib).
+# Changing the backend or its parameters rebuilds the index artifact.
+ANN_BACKEND = os.environ.get('ANN_BACKEND', 'scann')
+if ANN_BACKEND not in ('scann', 'exact', 'hnsw'):
+    raise ValueError(f"Unsupported ANN_BACKEND: {ANN_BACKEND}")
+ANN_EXACT_DTYPE = os.environ.get('ANN_EXACT_DTYPE', 'float16')
+ANN_EXACT_BLOCK_SIZE = int(os.environ.get('ANN_EXACT_BLOCK_SIZE', 16384))
+HNSW_M = int(os.environ.get('HNSW_M', 16))
+HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION', 200))
+HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', 64))
+# Toxic examples added at runtime through the 'filter_control' exchange are searched
+# exactly until SEMANTIC_DELTA_COMPACT_THRESHOLD of them trigger a background rebuild
+# of the main index, which is saved to INDEX_DIR. They are kept in SEMANTIC_EXAMPLES_FILE
+# ('' keeps them, and the rebuilt index, in memory only).
+CONTROL_EXCHANGE = os.environ.get('CONTROL_EXCHANGE', 'filter_control')
+SEMANTIC_DELTA_COMPACT_THRESHOLD = int(os.environ.get('SEMANTIC_DELTA_COMPACT_THRESHOLD', 5000))
+SEMANTIC_EXAMPLES_FILE = os.environ.get('SEMANTIC_EXAMPLES_FILE', os.path.join(INDEX_DIR, 'added_examples.jsonl'))
+
+# Micro-batching: the worker prefetches up to BATCH_SIZE messages and waits at
+# most BATCH_TIMEOUT_MS after the first one before running inference on them.
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 16))
+BATCH_TIMEOUT_MS = float(os.environ.get('BATCH_TIMEOUT_MS', 5))
+# Bulk traffic arrives on 'task_bulk' and is consumed on its own channel with this
+# smaller prefetch, so interactive messages on 'task' always find room in a batch.
+BULK_PREFETCH = int(os.environ.get('BULK_PREFETCH', max(1, BATCH_SIZE // 4)))
+
+# Worker pool: number of worker processes ('auto' measures throughput to pick it)
+# and torch intra-op threads per process (0 lets torch or the calibration decide).
+WORKER_PROCESSES = os.environ.get('WORKER_PROCESSES', '1')
+TORCH_THREADS = int(os.environ.get('TORCH_THREADS', 0))
+
+# Port of the worker's Prometheus /metrics endpoint (served by the supervisor in a pool).
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 8000))
+
+# Startup: workers run a warm-up pass over these text lengths (in words) and batch
+# sizes before they start consuming, then create READY_FILE and answer /ready.
+WARMUP = os.environ.get('WARMUP', 'true').lower() in ('1', 'true', 'yes')
+WARMUP_LENGTHS = [int(n) for n in os.environ.get('WARMUP_LENGTHS', '8,32,128,512').split(',') if n.strip()]
+WARMUP_BATCH_SIZES = [
+    int(n) for n in os.environ.get('WARMUP_BATCH_SIZES', f'1,{BATCH_SIZE}').split(',') if n.strip()
+]
+READY_FILE = os.environ.get('READY_FILE', '/tmp/filter-ready')
+
+# Admin HTTP port for on-demand profiling (0 disables it). In a worker pool,
+# worker i listens on ADMIN_PORT + 1 + i. Profiles are written to PROFILE_DIR.
+ADMIN_PORT = int(os.environ.get('ADMIN_PORT', 8001))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/filter-profiles')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 300))
 
 torch.set_float32_matmul_precision('high')
 
@@ -19,4 +82,81 @@ KEYS = {
     "insult",
     "threat",
     "sexual_explicit"
-}
\ No newline at end of file
+}
+
+# Verdict thresholds used by is_safe.
+CLASSIFIER_THRESHOLD = float(os.environ.get('CLASSIFIER_THRESHOLD', 0.5))
+SEMANTIC_THRESHOLD = float(os.environ.get('SEMANTIC_THRESHOLD', 0.45))
+ANOMALY_THRESHOLD = float(os.environ.get('ANOMALY_THRESHOLD', 0.4))
+MIXED_SCRIPT_THRESHOLD = float(os.environ.get('MIXED_SCRIPT_THRESHOLD', 0.35))
+
+# In-process LRU cache of is_safe verdicts; size 0 disables it.
+VERDICT_CACHE_SIZE = int(os.environ.get('VERDICT_CACHE_SIZE', 10000))
+VERDICT_CACHE_TTL = float(os.environ.get('VERDICT_CACHE_TTL', 3600))
+
+# Near-duplicate flood detection: MinHash signatures of recently blocked texts. A text of
+# at least NEAR_DUPLICATE_MIN_LENGTH characters, not counting punctuation and symbols, whose
+# character 4-grams reach NEAR_DUPLICATE_THRESHOLD Jaccard similarity with one of them gets
+# its verdict without running any check. Entries expire NEAR_DUPLICATE_TTL seconds after
+# their last hit; size 0 disables it. Flood rates are decayed over NEAR_DUPLICATE_RATE_WINDOW
+# seconds and the NEAR_DUPLICATE_TOP_CLUSTERS busiest clusters are exported.
+NEAR_DUPLICATE_SIZE = int(os.environ.get('NEAR_DUPLICATE_SIZE', 10000))
+NEAR_DUPLICATE_TTL = float(os.environ.get('NEAR_DUPLICATE_TTL', 900))
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.7))
+NEAR_DUPLICATE_MIN_LENGTH = int(os.environ.get('NEAR_DUPLICATE_MIN_LENGTH', 32))
+NEAR_DUPLICATE_RATE_WINDOW = float(os.environ.get('NEAR_DUPLICATE_RATE_WINDOW', 60))
+NEAR_DUPLICATE_TOP_CLUSTERS = int(os.environ.get('NEAR_DUPLICATE_TOP_CLUSTERS', 5))
+
+# Conversation mode: a turn sent with its session state is also judged on the whole
+# conversation. The state keeps the SESSION_MAX_TURNS latest turn embeddings and the
+# SESSION_MAX_WORDS most frequent words. A turn is blocked when the conversation's most
+# frequent word exceeds the is_recurrent ratio over at least SESSION_MIN_WORDS words, when
+# it repeats an earlier turn SESSION_MAX_REPEATS times, when the running anomaly score
+# (an EWMA with weight SESSION_ANOMALY_ALPHA) exceeds SESSION_ANOMALY_THRESHOLD, or when
+# the mean embedding of the recent turns reaches SEMANTIC_THRESHOLD.
+SESSION_MAX_TURNS = int(os.environ.get('SESSION_MAX_TURNS', 8))
+SESSION_MAX_WORDS = int(os.environ.get('SESSION_MAX_WORDS', 256))
+SESSION_MIN_WORDS = int(os.environ.get('SESSION_MIN_WORDS', 30))
+SESSION_MAX_REPEATS = int(os.environ.get('SESSION_MAX_REPEATS', 3))
+SESSION_ANOMALY_ALPHA = float(os.environ.get('SESSION_ANOMALY_ALPHA', 0.3))
+SESSION_ANOMALY_THRESHOLD = float(os.environ.get('SESSION_ANOMALY_THRESHOLD', 0.3))
+
+# Cost-ordered cascade: checks run in this order and, with short-circuiting on,
+# a text stops at the first check that blocks it. A classifier score at or below
+# CLASSIFIER_CONFIDENT_CLEAN also skips the semantic check for that text.
+CASCADE_ORDER = [
+    stage.strip() for stage in
+    os.environ.get('CASCADE_ORDER', 'recurrent,mixed_script,anomaly,classifier,semantic').split(',')
+    if stage.strip()
+]
+CASCADE_SHORT_CIRCUIT = os.environ.get('CASCADE_SHORT_CIRCUIT', 'true').lower() in ('1', 'true', 'yes')
+CLASSIFIER_CONFIDENT_TOXIC = float(os.environ.get('CLASSIFIER_CONFIDENT_TOXIC', 0.9))
+CLASSIFIER_CONFIDENT_CLEAN = float(os.environ.get('CLASSIFIER_CONFIDENT_CLEAN', 0.02))
+
+# Stage pools: a worker with WORKER_STAGE set to one of STAGE_POOLS runs only those
+# checks, loads only their models and consumes task.<stage> / task_bulk.<stage>; the
+# app sends every text to each pool in parallel and merges the partial verdicts.
+# 'all' runs the whole cascade from task / task_bulk.
+STAGE_POOLS = {
+    "heuristics": ["recurrent", "mixed_script", "anomaly"],
+    "classifier": ["classifier"],
+    "semantic": ["semantic"],
+}
+WORKER_STAGE = os.environ.get('WORKER_STAGE', 'all')
+if WORKER_STAGE != 'all' and WORKER_STAGE not in STAGE_POOLS:
+    raise ValueError(f"Unsupported WORKER_STAGE: {WORKER_STAGE}")
+WORKER_CASCADE = [stage for stage in CASCADE_ORDER if WORKER_STAGE == 'all' or stage in STAGE_POOLS[WORKER_STAGE]]
+TASK_QUEUE = 'task' if WORKER_STAGE == 'all' else f'task.{WORKER_STAGE}'
+BULK_QUEUE = 'task_bulk' if WORKER_STAGE == 'all' else f'task_bulk.{WORKER_STAGE}'
+
+# Count any two scripts in one token as mixed, instead of only Latin/Cyrillic/other.
+MIXED_SCRIPT_ALL_SCRIPTS = os.environ.get('MIXED_SCRIPT_ALL_SCRIPTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Sliding-window classification: long texts are split into windows of at most
+# CLASSIFIER_MAX_LENGTH tokens overlapping by CLASSIFIER_WINDOW_STRIDE tokens,
+# scored in length-sorted batches of CLASSIFIER_BATCH_SIZE windows and reduced per text.
+CLASSIFIER_MAX_LENGTH = int(os.environ.get('CLASSIFIER_MAX_LENGTH', 128))
+CLASSIFIER_WINDOW_STRIDE = int(os.environ.get('CLASSIFIER_WINDOW_STRIDE', 32))
+CLASSIFIER_MAX_WINDOWS = int(os.environ.get('CLASSIFIER_MAX_WINDOWS', 32))
+CLASSIFIER_BATCH_SIZE = int(os.environ.get('CLASSIFIER_BATCH_SIZE', 32))
+CLASSIFIER_WINDOW_REDUCER = os.environ.get('CLASSIFIER_WINDOW_REDUCER', 'max')
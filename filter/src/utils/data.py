@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import os
+from functools import lru_cache
 
 from datasets import load_dataset
 
@@ -29,3 +31,28 @@ def load_toxic_texts(threshold=0.7, data_path='/data'):
     except Exception as e:
         logger.exception("Failed to load toxic dataset: %s", e)
         return []
+
+
+def load_sample_texts(limit=256, data_path='/data'):
+    """First `limit` comments of the training set, toxic or not, for parity and warm-up runs."""
+    try:
+        dataset = load_dataset(
+            "csv", data_files={"train": os.path.join(data_path, "train.csv")}, split="train", streaming=True
+        )
+        return [x['comment_text'] for x in dataset.take(limit)]
+    except Exception as e:
+        logger.exception("Failed to load sample texts: %s", e)
+        return []
+
+
+@lru_cache(maxsize=None)
+def dataset_fingerprint(data_path='/data') -> str:
+    """Content hash of the training CSV, so copies of the same file share artifacts."""
+    digest = hashlib.sha256()
+    try:
+        with open(os.path.join(data_path, "train.csv"), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return "missing"
+    return digest.hexdigest()[:16]
@@ -0,0 +1,139 @@
+import os
+import tempfile
+
+# A worker pool shares metrics through files, so the directory must be set
+# before prometheus_client is imported.
+if os.environ.get('WORKER_PROCESSES', '1') != '1' and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='filter-metrics-')
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+
+# Metrics:
+VERDICT_CACHE_COUNTER = Counter(
+    "filter_verdict_cache_total",
+    "Verdict cache lookups and evictions in the filter worker",
+    ["event"]  # event: hit / miss / eviction / expired
+)
+
+STAGE_SKIPPED_COUNTER = Counter(
+    "filter_stage_skipped_total",
+    "Checks not run for a text because the cascade had already decided its verdict",
+    ["stage"]  # stage: recurrent / mixed_script / anomaly / classifier / semantic
+)
+
+CLASSIFIER_WINDOWS_COUNTER = Counter(
+    "filter_classifier_windows_total",
+    "Token windows scored by the classifier"
+)
+
+CLASSIFIER_TOKENS_COUNTER = Counter(
+    "filter_classifier_tokens_total",
+    "Tokens fed to the classifier",
+    ["kind"]  # kind: real / padding
+)
+
+STAGE_DURATION = Histogram(
+    "filter_stage_duration_seconds",
+    "Time spent in each filter stage per batch",
+    ["stage"],  # stage: near_duplicate / session / heuristics / recurrent / mixed_script / anomaly / classifier / classifier_tokenize /
+                # classifier_forward / semantic / semantic_encode / semantic_search
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+BATCH_SIZE_HISTOGRAM = Histogram(
+    "filter_batch_size",
+    "Texts per inference batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+IN_FLIGHT = Gauge(
+    "filter_messages_in_flight",
+    "Texts received by the worker and not yet replied to",
+    multiprocess_mode="livesum"
+)
+
+QUEUE_WAIT = Histogram(
+    "filter_queue_wait_seconds",
+    "Time between the app publishing a message and the worker receiving it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+BATCH_WAIT = Histogram(
+    "filter_batch_wait_seconds",
+    "Time a message waits in the worker for its batch to start",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+MESSAGES_COUNTER = Counter(
+    "filter_messages_total",
+    "Texts processed by the filter worker",
+    ["status"]  # status: passed / blocked / error
+)
+
+EXPIRED_COUNTER = Counter(
+    "filter_expired_total",
+    "Texts dropped unprocessed because their deadline passed",
+    ["stage"]  # stage: queue (on receipt) / batch (before the batch ran) / a cascade stage name
+)
+
+STARTUP_PHASE_SECONDS = Gauge(
+    "filter_startup_phase_seconds",
+    "Duration of each worker startup phase",
+    ["phase"],  # phase: classifier / semantic_model / semantic_index / models / warmup
+    multiprocess_mode="max"
+)
+
+SEMANTIC_DELTA_SIZE = Gauge(
+    "filter_semantic_delta_size",
+    "Runtime-added examples searched exactly, not yet compacted into the main index",
+    multiprocess_mode="max"
+)
+
+SEMANTIC_COMPACTIONS_COUNTER = Counter(
+    "filter_semantic_compactions_total",
+    "Background rebuilds of the main semantic index"
+)
+
+SESSION_BLOCKED_COUNTER = Counter(
+    "filter_session_blocked_total",
+    "Conversation turns that passed on their own but were blocked by a session signal",
+    ["signal"]  # signal: recurrent / repeated / anomaly / semantic
+)
+
+NEAR_DUPLICATE_COUNTER = Counter(
+    "filter_near_duplicate_total",
+    "Near-duplicate index lookups and changes",
+    ["event"]  # event: hit / miss / added / eviction / expired
+)
+
+NEAR_DUPLICATE_CLUSTERS = Gauge(
+    "filter_near_duplicate_clusters",
+    "Clusters of near-duplicate blocked texts in the index",
+    multiprocess_mode="livesum"
+)
+
+NEAR_DUPLICATE_FLOOD_RATE = Gauge(
+    "filter_near_duplicate_flood_rate",
+    "Near-duplicate hits per minute of the busiest clusters",
+    ["rank"],  # rank: 1 (busiest) .. NEAR_DUPLICATE_TOP_CLUSTERS
+    multiprocess_mode="max"
+)
+
+
+def start_metrics_server(port: int):
+    """
+    Serves /metrics on the given port. In a worker pool the supervisor serves
+    the values aggregated from every worker's files.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+
+
+def mark_worker_dead(pid: int):
+    """Drops the live gauges of a worker process that has exited."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
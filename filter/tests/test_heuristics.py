@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from src.core.heuristics import HeuristicScanner
+
+TEXTS = [
+    "",
+    " ",
+    "hello world",
+    "Hello, World!!! Is this OK?",
+    "spam spam spam spam eggs",
+    "aaaa",
+    "aaa\n\n\n\nbbb",
+    "noooooo way",
+    "MIXED Cyrillic раз два и Latin",
+    "pаypal",  # Cyrillic "а" inside a Latin word
+    "日本語のテキストと English words",
+    "عربي و English",
+    "tab\tseparated\nlines\r\nhere",
+    "zero​width and \x00 control",
+    "𝐦𝐚𝐭𝐡 bold and emoji 🙂🙂🙂🙂",
+    "İstanbul İSTANBUL istanbul",
+    "   leading and trailing   ",
+    "a b c d e f g h i j",
+]
+
+ALPHABET = "aAbBzZ  \t\n!?.,-_0123абвгДЖ日本αβ🙂​\x07é"
+
+
+def random_texts(count: int, seed: int):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40))) for _ in range(count)]
+
+
+def assert_same(batch, scalar):
+    assert batch.recurrent == scalar.recurrent
+    assert batch.anomaly == pytest.approx(scalar.anomaly)
+    assert batch.mixed_script == pytest.approx(scalar.mixed_script)
+
+
+@pytest.mark.parametrize("all_scripts", [False, True])
+def test_scan_batch_matches_scan(all_scripts):
+    scanner = HeuristicScanner(all_scripts=all_scripts)
+    texts = TEXTS + random_texts(500, seed=1)
+    for text, batch in zip(texts, scanner.scan_batch(texts)):
+        assert_same(batch, scanner.scan(text))
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_scan_batch_of_one_matches_scan(text):
+    scanner = HeuristicScanner()
+    assert_same(scanner.scan_batch([text])[0], scanner.scan(text))
+
+
+def test_repeated_characters_do_not_span_texts():
+    scanner = HeuristicScanner()
+    # Two texts ending and starting with "aa" must not form a run of four.
+    batch = scanner.scan_batch(["xaa", "aax"])
+    assert batch[0].anomaly == pytest.approx(scanner.scan("xaa").anomaly)
+    assert batch[1].anomaly == pytest.approx(scanner.scan("aax").anomaly)
+
+
+def test_scan_batch_of_nothing():
+    assert HeuristicScanner().scan_batch([]) == []
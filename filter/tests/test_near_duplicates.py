@@ -0,0 +1,146 @@
+import zlib
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from src.core import near_duplicates
+from src.core.near_duplicates import NearDuplicateIndex, band_rows, minhash, similarity
+
+BLOCKED = "Buy cheap followers now at spam-site dot com, limited offer for everyone today"
+VARIANT = "buy CHEAP followers now at spam-site dot com!!! limited offer for everyone, today only"
+UNRELATED = "Could you summarize the second chapter of the book we discussed yesterday?"
+VERDICT = {"status": False, "anomaly_result": 0.5, "fingerprint": "f"}
+
+
+@pytest.fixture(autouse=True)
+def stable_hash(monkeypatch):
+    # hash() is salted per process; pin it so the similarity estimates do not depend on PYTHONHASHSEED.
+    monkeypatch.setattr(near_duplicates, "hash", lambda text: zlib.crc32(text.encode()), raising=False)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(near_duplicates.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_index(max_size=100, ttl=60.0, threshold=0.8, min_length=20):
+    return NearDuplicateIndex(max_size, ttl, threshold, min_length, rate_window=60.0, top_clusters=3,
+                              fingerprint="f")
+
+
+def test_minhash_estimates_similarity():
+    assert similarity(minhash(BLOCKED), minhash(BLOCKED)) == 1.0
+    # Case, punctuation and whitespace are normalized away.
+    assert similarity(minhash(BLOCKED), minhash(BLOCKED.upper() + "!!!")) == 1.0
+    assert 0.85 <= similarity(minhash(BLOCKED), minhash(VARIANT)) < 1.0
+    assert similarity(minhash(BLOCKED), minhash(UNRELATED)) < 0.3
+
+
+def test_minhash_tracks_the_jaccard_similarity():
+    def shingles(text):
+        normalized = near_duplicates.normalize(text)
+        return {normalized[i:i + near_duplicates.SHINGLE] for i in range(len(normalized) - near_duplicates.SHINGLE + 1)}
+
+    other = "buy CHEAP followers now at the spam-site dot com!!! limited offer for everyone, today only"
+    for text in (VARIANT, other):
+        a, b = shingles(BLOCKED), shingles(text)
+        assert similarity(minhash(BLOCKED), minhash(text)) == pytest.approx(len(a & b) / len(a | b), abs=0.05)
+
+
+def test_band_rows_keep_recall_at_the_threshold():
+    for threshold in (0.5, 0.8, 0.9):
+        rows = band_rows(threshold)
+        assert 1 - (1 - threshold ** rows) ** (near_duplicates.NUM_PERM // rows) >= 0.99
+    assert band_rows(0.9) >= band_rows(0.5)
+
+
+def test_match_returns_the_blocked_verdict(clock):
+    index = make_index()
+    index.add(index.signature(BLOCKED), BLOCKED, VERDICT)
+    match = index.match(index.signature(VARIANT))
+    assert match["status"] is False
+    assert match["anomaly_result"] == 0.5
+    assert match["near_duplicate_result"] >= 0.8
+    assert index.match(index.signature(UNRELATED)) is None
+
+
+def test_short_texts_are_not_indexed():
+    index = make_index(min_length=200)
+    assert index.signature(BLOCKED) is None
+    assert index.match(None) is None
+
+
+def test_texts_without_words_are_not_indexed(clock):
+    index = make_index()
+    noise = ["!" * 40, "-" * 40, "🙂" * 40, "?!.,;:" * 10, "    " * 10, "...", ""]
+    for text in noise:
+        assert minhash(text) is None
+        assert index.signature(text) is None
+    # A blocked punctuation run must not hand its verdict to other symbol strings.
+    index.add(index.signature(noise[0]), noise[0], VERDICT)
+    for text in noise:
+        assert index.match(index.signature(text)) is None
+    assert index.clusters() == []
+
+
+def test_min_length_counts_the_normalized_text():
+    index = make_index(min_length=20)
+    assert index.signature("ok " + "!" * 40) is None
+    assert index.signature("a real sentence with words") is not None
+
+
+def test_disabled_index():
+    index = make_index(max_size=0)
+    assert not index.enabled
+    assert index.signature(BLOCKED) is None
+
+
+def test_entries_expire_after_their_last_hit(clock):
+    index = make_index(ttl=10.0)
+    index.add(index.signature(BLOCKED), BLOCKED, VERDICT)
+    clock[0] += 8
+    assert index.match(index.signature(VARIANT)) is not None
+    # The hit extended the entry's lifetime.
+    clock[0] += 8
+    assert index.match(index.signature(BLOCKED)) is not None
+    clock[0] += 11
+    assert index.match(index.signature(BLOCKED)) is None
+    assert index.clusters() == []
+
+
+def test_least_recently_hit_entries_are_evicted(clock):
+    index = make_index(max_size=2)
+    texts = [f"{word} " * 10 for word in ("alpha", "bravo", "charlie")]
+    for text in texts:
+        index.add(index.signature(text), text, VERDICT)
+    assert index.match(index.signature(texts[0])) is None
+    assert index.match(index.signature(texts[2])) is not None
+
+
+def test_similar_texts_share_a_cluster(clock):
+    index = make_index()
+    index.add(index.signature(BLOCKED), BLOCKED, VERDICT)
+    index.add(index.signature(VARIANT), VARIANT, VERDICT)
+    index.add(index.signature(UNRELATED), UNRELATED, VERDICT)
+    for _ in range(3):
+        index.match(index.signature(BLOCKED))
+
+    clusters = index.clusters()
+    assert [cluster["entries"] for cluster in clusters] == [2, 1]
+    assert clusters[0]["hits"] == 3
+    assert clusters[0]["sample"] == BLOCKED[:80]
+    assert clusters[0]["hits_per_minute"] > clusters[1]["hits_per_minute"]
+    assert index.match(index.signature(VARIANT))["near_duplicate_cluster"] == clusters[0]["cluster"]
+
+
+def test_a_new_fingerprint_clears_the_index(clock):
+    index = make_index()
+    index.add(index.signature(BLOCKED), BLOCKED, VERDICT)
+    index.set_fingerprint("f")
+    assert index.match(index.signature(BLOCKED)) is not None
+    index.set_fingerprint("g")
+    assert index.match(index.signature(BLOCKED)) is None
+    assert index.clusters() == []
@@ -0,0 +1,96 @@
+import math
+import os
+
+import pytest
+
+from src.core import protocol
+from src.core.protocol import JSON, MSGPACK, decode_requests, decode_results, encode_requests, encode_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REQUESTS = [
+    {"message": "hello", "session": None, "deadline": None},
+    {"message": "with a session", "session": {"turns": ["hi"], "repetition": 0.5}, "deadline": 1700000000.25},
+    {"message": "ünïcödé 🙂", "session": None, "deadline": 1700000001.0},
+]
+
+VERDICT = {
+    "status": False,
+    "is_recurrent_result": True,
+    "mixed_language_result": 0.25,
+    "anomaly_result": 0.5,
+    "classification_result": {"toxic": 0.75, "insult": 0.125},
+    "semantic_result": 0.875,
+    "skipped": [],
+    "fingerprint": "3f9a1c0b7d2e4a65",
+}
+SHORT_CIRCUITED = {
+    "status": True,
+    "is_recurrent_result": False,
+    "mixed_language_result": 0.0,
+    "anomaly_result": 0.0625,
+    "classification_result": {},
+    "skipped": ["classifier", "semantic"],
+    "fingerprint": "0011223344556677",
+}
+NEAR_DUPLICATE = {**VERDICT, "near_duplicate_result": 0.9375, "near_duplicate_cluster": "42-7", "timings": {"a": 1}}
+ERROR = {"error": "Invalid message format"}
+
+
+def test_copies_are_identical():
+    with open(os.path.join(ROOT, "app", "src", "core", "protocol.py"), "rb") as app_copy:
+        with open(protocol.__file__, "rb") as filter_copy:
+            assert app_copy.read() == filter_copy.read()
+
+
+def test_json_round_trip():
+    body = encode_requests(REQUESTS[1:2], JSON)
+    assert decode_requests(body, JSON) == [{**REQUESTS[1], "deadline": None}]
+    assert decode_results(encode_results([VERDICT], JSON), JSON) == [VERDICT]
+
+
+def test_json_without_content_type():
+    # Apps and filters that predate content types send none.
+    assert decode_requests(b'{"message": "hi"}', None) == [{"message": "hi", "session": None, "deadline": None}]
+    assert decode_results(encode_results([VERDICT], None), None) == [VERDICT]
+
+
+def test_json_carries_one_text():
+    with pytest.raises(ValueError):
+        encode_requests(REQUESTS, JSON)
+    with pytest.raises(ValueError):
+        encode_results([None], JSON)
+
+
+def test_unsupported_content_type():
+    assert not protocol.supported("text/plain")
+    with pytest.raises(ValueError):
+        decode_requests(b"", "text/plain")
+
+
+def test_msgpack_requests_round_trip():
+    pytest.importorskip("msgpack")
+    assert decode_requests(encode_requests(REQUESTS, MSGPACK), MSGPACK) == REQUESTS
+
+
+def test_msgpack_results_round_trip():
+    pytest.importorskip("msgpack")
+    results = [VERDICT, None, SHORT_CIRCUITED, ERROR, NEAR_DUPLICATE]
+    # Every score used here is exact in float32.
+    assert decode_results(encode_results(results, MSGPACK), MSGPACK) == results
+
+
+def test_msgpack_scores_are_float32():
+    pytest.importorskip("msgpack")
+    verdict = {**VERDICT, "semantic_result": 0.1}
+    decoded = decode_results(encode_results([verdict], MSGPACK), MSGPACK)[0]
+    assert decoded["semantic_result"] == pytest.approx(0.1, rel=1e-6)
+    assert not math.isnan(decoded["anomaly_result"])
+
+
+def test_msgpack_rejects_other_versions():
+    msgpack = pytest.importorskip("msgpack")
+    with pytest.raises(ValueError):
+        decode_requests(msgpack.packb({"v": protocol.VERSION + 1, "items": []}), MSGPACK)
+    with pytest.raises(ValueError):
+        decode_requests(msgpack.packb({"v": protocol.VERSION, "items": []}), MSGPACK)
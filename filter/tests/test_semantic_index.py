@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from src.core.semantic_index import SemanticIndex
+
+DIM = 8
+
+
+class ExactSearcher:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def search_batched(self, queries, final_num_neighbors=5):
+        scores = queries @ self.vectors.T
+        top = np.argsort(-scores, axis=1)[:, :final_num_neighbors]
+        return top, np.take_along_axis(scores, top, axis=1)
+
+
+def vectors(count, seed):
+    v = np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+class Rebuild:
+    """Records what the index asks to compact; can hold the rebuild until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, embeddings, delta, examples):
+        self.calls.append((len(embeddings), len(delta), examples))
+        self.release.wait()
+        merged = np.concatenate([np.asarray(embeddings), delta])
+        return merged, ExactSearcher(merged)
+
+
+def make_index(rebuild, threshold=4, examples=("base",)):
+    main = vectors(10, seed=0)
+    return SemanticIndex(main, ExactSearcher(main), rebuild, threshold, examples=examples)
+
+
+def test_added_examples_are_searched_before_compaction():
+    index = make_index(Rebuild(), threshold=100)
+    added = vectors(2, seed=1)
+    assert index.add("e1", added)
+    assert not index.add("e1", added)
+    _, scores = index.search_batched(added, final_num_neighbors=1)
+    np.testing.assert_allclose(scores[:, 0], 1.0, rtol=1e-5)
+    assert len(index) == 12
+
+
+def test_compaction_passes_every_compacted_example():
+    rebuild = Rebuild()
+    index = make_index(rebuild)
+    index.add("e1", vectors(2, seed=1))
+    index.add("e2", vectors(3, seed=2))
+    index._compaction.join()
+
+    assert rebuild.calls == [(10, 5, ["base", "e1", "e2"])]
+    assert index.state.examples == ("base", "e1", "e2")
+    assert index.state.delta_examples == ()
+    assert len(index.state.embeddings) == 15 and len(index.state.delta) == 0
+    assert index.example_ids == {"base", "e1", "e2"}
+
+
+def test_examples_added_during_compaction_stay_in_the_delta():
+    rebuild = Rebuild()
+    rebuild.release.clear()
+    index = make_index(rebuild)
+    index.add("e1", vectors(4, seed=1))
+    index.add("e2", vectors(1, seed=2), compact=False)
+    rebuild.release.set()
+    index._compaction.join()
+
+    assert rebuild.calls == [(10, 4, ["base", "e1"])]
+    assert index.state.examples == ("base", "e1")
+    assert index.state.delta_examples == ("e2",)
+    assert len(index.state.delta) == 1
+
+
+def test_failed_compaction_keeps_the_index():
+    def rebuild(embeddings, delta, examples):
+        raise RuntimeError("disk full")
+
+    index = make_index(rebuild)
+    index.add("e1", vectors(4, seed=1))
+    index._compaction.join()
+    assert len(index.state.delta) == 4
+    assert index.state.delta_examples == ("e1",)
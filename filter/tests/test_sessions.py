@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from src.core.sessions import SessionState, turn_digest
+
+DIM = 4
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def add(state, text, anomaly=0.0, vector=None, max_turns=3, max_words=100, alpha=0.5):
+    return state.add_turn(text, anomaly, unit(1, 0, 0, 0) if vector is None else vector,
+                          max_turns, max_words, alpha)
+
+
+def test_round_trip():
+    state = SessionState()
+    add(state, "hello there", anomaly=0.2, vector=unit(1, 2, 3, 4))
+    add(state, "hello again", anomaly=0.4, vector=unit(4, 3, 2, 1))
+
+    restored = SessionState.from_dict(state.to_dict(), DIM)
+    assert restored.turns == 2
+    assert restored.total_words == 4
+    assert restored.words == {"hello": 2, "there": 1, "again": 1}
+    assert restored.anomaly == pytest.approx(0.3)
+    assert restored.recent == [turn_digest("hello there"), turn_digest("hello again")]
+    # Embeddings travel as float16.
+    for original, vector in zip(state.embeddings, restored.embeddings):
+        np.testing.assert_allclose(vector, original, atol=1e-3)
+
+
+def test_malformed_state_starts_over():
+    state = SessionState.from_dict({"turns": 3, "words": ["not", "a", "dict"], "embeddings": ["%%%", 7]}, DIM)
+    assert state.turns == 3
+    assert state.words == {}
+    assert state.embeddings == []
+
+
+def test_embeddings_of_another_model_are_dropped():
+    data = SessionState(embeddings=[unit(1, 1, 1, 1)]).to_dict()
+    assert SessionState.from_dict(data, DIM).embeddings
+    assert SessionState.from_dict(data, DIM * 2).embeddings == []
+
+
+def test_add_turn_counts_recent_repeats():
+    state = SessionState()
+    assert add(state, "same text") == 0
+    assert add(state, "same text") == 1
+    assert add(state, "other") == 0
+    assert add(state, "same text") == 2
+    # Only the last max_turns turns are remembered.
+    assert add(state, "other") == 1
+    assert len(state.recent) == 3
+    assert len(state.embeddings) == 3
+    assert state.turns == 5
+
+
+def test_word_counts_are_bounded():
+    state = SessionState()
+    add(state, "a a a b b c d e", max_words=2)
+    assert state.words == {"a": 3, "b": 2}
+    assert state.total_words == 8
+    assert state.repetition_ratio() == pytest.approx(3 / 8)
+
+
+def test_repetition_ratio_accumulates_across_turns():
+    state = SessionState()
+    assert state.repetition_ratio() == 0.0
+    add(state, "buy now")
+    add(state, "buy cheap")
+    add(state, "buy here")
+    assert state.repetition_ratio() == pytest.approx(3 / 6)
+
+
+def test_anomaly_is_smoothed():
+    state = SessionState()
+    add(state, "first", anomaly=1.0, alpha=0.25)
+    assert state.anomaly == 1.0
+    add(state, "second", anomaly=0.0, alpha=0.25)
+    assert state.anomaly == pytest.approx(0.75)
+
+
+def test_context_is_the_normalized_mean():
+    state = SessionState()
+    assert state.context(unit(1, 0, 0, 0)) is None
+    add(state, "first", vector=unit(1, 0, 0, 0))
+    context = state.context(unit(0, 1, 0, 0))
+    np.testing.assert_allclose(context, unit(1, 1, 0, 0), rtol=1e-6)
+    assert np.linalg.norm(context) == pytest.approx(1.0)